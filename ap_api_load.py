@@ -0,0 +1,282 @@
+# Licensed under the Creative Commons BY license: https://creativecommons.org/licenses/by/4.0/
+
+# Load test for the web API: sends a mix of requests at a fixed concurrency and reports throughput, latency
+# percentiles and error rates as JSON.
+#
+# To load test the app in this process (ASGI transport, no sockets, rate limiting disabled):
+#   python ap_api_load.py [--mix mixed] [--requests 20000] [--concurrency 32] [--output results.json]
+# To load test a server launched by this script with ap_api_server.py (rate limiting disabled):
+#   python ap_api_load.py --server [--workers n]
+# To load test a running server:
+#   python ap_api_load.py --url http://127.0.0.1:8000
+# To compare with results saved with --output, e.g. from another commit:
+#   python ap_api_load.py --baseline results.json
+#
+# Mixes:
+# - uniform: GET /shadow for AP types and subtypes chosen uniformly from all 15,000
+# - zipf: GET /shadow with Zipf-distributed popularity, so a few pairs get most requests
+# - invalid: GET /shadow with invalid AP types or subtypes (expected 400)
+# - batch: POST /shadow/batch with 100 random pairs
+# - mixed: mostly zipf, with some uniform, HTML, invalid and batch requests
+
+import argparse
+import asyncio
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+from collections import Counter
+from collections.abc import Callable
+from datetime import date
+from itertools import accumulate
+from json import dump, dumps, load
+from time import perf_counter, sleep
+
+import httpx
+
+from ap_core import ap_types, subtypes
+
+ZIPF_EXPONENT = 1.1
+BATCH_SIZE = 100
+INVALID_AP_TYPES = ('VVVV', 'XYZW', 'VLE', 'VLEFF', 'V1EF')
+INVALID_SUBTYPES = ('5555', '12', '12345', 'ABCD', '0x12')
+SERVER_START_TIMEOUT = 120  # seconds, including building the table file
+
+pairs = [(ap_type, subtype) for ap_type in ap_types for subtype in subtypes]
+
+
+class LoadRequest:
+    __slots__ = ('method', 'path', 'body', 'valid')
+
+    def __init__(self, method: str, path: str, body: bytes | None = None, valid: bool = True):
+        self.method = method
+        self.path = path
+        self.body = body
+        self.valid = valid  # whether a 2xx response is expected, otherwise 4xx
+
+
+def get_zipf_cum_weights(rng: random.Random) -> tuple[list[tuple[str, str]], list[float]]:
+    # pairs in a random order of popularity, with cumulative weights 1 / rank ** ZIPF_EXPONENT
+    popular_pairs = pairs.copy()
+    rng.shuffle(popular_pairs)
+    return popular_pairs, list(accumulate(1 / rank ** ZIPF_EXPONENT for rank in range(1, len(popular_pairs) + 1)))
+
+
+class RequestMix:
+    # generates requests for a mix, deterministically for a seed
+    def __init__(self, mix: str, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.popular_pairs, self.cum_weights = get_zipf_cum_weights(self.rng)
+        generators = {
+            'uniform': [(1, self.uniform)],
+            'zipf': [(1, self.zipf)],
+            'invalid': [(1, self.invalid)],
+            'batch': [(1, self.batch)],
+            'mixed': [(80, self.zipf), (10, self.uniform), (5, self.zipf_html), (4, self.invalid), (1, self.batch)],
+        }[mix]
+        self.generators = [generator for _, generator in generators]
+        self.generator_weights = list(accumulate(weight for weight, _ in generators))
+
+    def next(self) -> LoadRequest:
+        return self.rng.choices(self.generators, cum_weights=self.generator_weights)[0]()
+
+    def uniform(self) -> LoadRequest:
+        ap_type, subtype = self.rng.choice(pairs)
+        return LoadRequest('GET', f'/shadow/{ap_type}/{subtype}')
+
+    def zipf(self) -> LoadRequest:
+        ap_type, subtype = self.rng.choices(self.popular_pairs, cum_weights=self.cum_weights)[0]
+        return LoadRequest('GET', f'/shadow/{ap_type}/{subtype}')
+
+    def zipf_html(self) -> LoadRequest:
+        ap_type, subtype = self.rng.choices(self.popular_pairs, cum_weights=self.cum_weights)[0]
+        return LoadRequest('GET', f'/shadow.html/{ap_type}/{subtype}')
+
+    def invalid(self) -> LoadRequest:
+        ap_type, subtype = self.rng.choice(pairs)
+        if self.rng.random() < 0.5:
+            ap_type = self.rng.choice(INVALID_AP_TYPES)
+        else:
+            subtype = self.rng.choice(INVALID_SUBTYPES)
+        return LoadRequest('GET', f'/shadow/{ap_type}/{subtype}', valid=False)
+
+    def batch(self) -> LoadRequest:
+        batch = [{'ap_type': ap_type, 'subtype': subtype} for ap_type, subtype in self.rng.sample(pairs, BATCH_SIZE)]
+        return LoadRequest('POST', '/shadow/batch', dumps(batch).encode())
+
+
+def get_percentile(sorted_latencies: list[float], percentile: int) -> float:
+    return sorted_latencies[min(len(sorted_latencies) - 1, len(sorted_latencies) * percentile // 100)]
+
+
+def get_report(latencies: list[float], statuses: Counter, unexpected: int, seconds: float) -> dict:
+    latencies = sorted(latencies)
+    requests = sum(statuses.values())
+    errors = sum(count for status, count in statuses.items() if status == 'error' or status >= 400)
+    return {
+        'requests': requests,
+        'seconds': seconds,
+        'requests_per_sec': requests / seconds if seconds else 0.0,
+        'p50_ms': get_percentile(latencies, 50) * 1000 if latencies else 0.0,
+        'p95_ms': get_percentile(latencies, 95) * 1000 if latencies else 0.0,
+        'p99_ms': get_percentile(latencies, 99) * 1000 if latencies else 0.0,
+        'max_ms': latencies[-1] * 1000 if latencies else 0.0,
+        'statuses': {str(status): count for status, count in sorted(statuses.items(), key=lambda item: str(item[0]))},
+        'error_rate': errors / requests if requests else 0.0,  # 4xx, 5xx and failed requests
+        'unexpected_rate': unexpected / requests if requests else 0.0,  # 2xx for invalid input or vice versa
+    }
+
+
+async def run_load(client: httpx.AsyncClient, mix: RequestMix, requests: int, concurrency: int,
+                   duration: float | None = None) -> dict:
+    # Sends requests from the mix with this many requests in progress, until all are sent or the duration is over
+    latencies = []
+    statuses = Counter()
+    unexpected = 0
+    remaining = requests
+    start = perf_counter()
+    deadline = start + duration if duration else None
+
+    async def worker():
+        nonlocal remaining, unexpected
+        while remaining > 0 and (deadline is None or perf_counter() < deadline):
+            remaining -= 1
+            request = mix.next()
+            request_start = perf_counter()
+            try:
+                response = await client.request(request.method, request.path, content=request.body)
+                await response.aread()
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 'error'
+            latencies.append(perf_counter() - request_start)
+            statuses[status] += 1
+            if status == 'error' or (200 <= status < 300) != request.valid:
+                unexpected += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return get_report(latencies, statuses, unexpected, perf_counter() - start)
+
+
+def get_in_process_client() -> httpx.AsyncClient:
+    from ap_shadow_type_api import app, rate_limiter, warm_up  # imports FastAPI
+
+    rate_limiter.enabled = False  # every request comes from the same client
+    warm_up.run()  # the ASGI transport doesn't run the app's lifespan
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://ap-api')
+
+
+def get_free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers: int, table_file: str | None) -> tuple[subprocess.Popen, str]:
+    port = get_free_port()
+    env = dict(os.environ, AP_API_RATE_LIMIT='0', AP_API_BATCH_RATE_LIMIT='0', AP_API_MAX_CONCURRENCY='0')
+    command = [sys.executable, 'ap_api_server.py', '--port', str(port), '--workers', str(workers),
+               '--no-access-log', '--log-level', 'warning']
+    if table_file:
+        command += ['--table-file', table_file]
+    server = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+    url = f'http://127.0.0.1:{port}'
+    for _ in range(SERVER_START_TIMEOUT * 10):
+        if server.poll() is not None:
+            raise RuntimeError(f'Server exited with {server.returncode}')
+        try:
+            if httpx.get(f'{url}/readyz').status_code == 200:
+                return server, url
+        except httpx.HTTPError:
+            pass
+        sleep(0.1)
+    server.terminate()
+    raise RuntimeError(f'Server not ready after {SERVER_START_TIMEOUT} seconds')
+
+
+def get_git_commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_load_test(mix: str, requests: int, concurrency: int, duration: float | None, seed: int,
+                        get_client: Callable[[], httpx.AsyncClient]) -> dict:
+    async with get_client() as client:
+        report = await run_load(client, RequestMix(mix, seed), requests, concurrency, duration)
+    return {'mix': mix, 'concurrency': concurrency, 'seed': seed, **report}
+
+
+def get_comparison(results: dict, baseline: dict) -> list[str]:
+    comparison = []
+    for key in ('requests_per_sec', 'p50_ms', 'p95_ms', 'p99_ms', 'error_rate'):
+        value = results['results'][key]
+        baseline_value = baseline['results'][key]
+        change = f'{100 * (value / baseline_value - 1):+.1f}%' if baseline_value else 'n/a'
+        comparison.append(f'- {key}: {value:,.3f} (baseline {baseline_value:,.3f}, {change})')
+    return comparison
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='ap_api_load',
+        usage='Load test the AP web API',
+        add_help=True,  # add -h/--help option
+    )
+    parser.add_argument('-m', '--mix', choices=('uniform', 'zipf', 'invalid', 'batch', 'mixed'), default='mixed',
+                        help='request mix (default: mixed)')
+    parser.add_argument('-n', '--requests', type=int, default=20000, help='number of requests (default: 20000)')
+    parser.add_argument('-d', '--duration', type=float, help='stop after this many seconds')
+    parser.add_argument('-c', '--concurrency', type=int, default=32,
+                        help='requests in progress at once (default: 32)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the request mix (default: 0)')
+    parser.add_argument('--url', help='load test a running server at this URL instead of in this process')
+    parser.add_argument('--server', action='store_true', help='launch a server with ap_api_server.py to load test')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1,
+                        help='worker processes of the launched server (default: number of CPUs)')
+    parser.add_argument('-t', '--table-file', help='table file of the launched server (see ap_api_server.py)')
+    parser.add_argument('-o', '--output', help='save results to this JSON file')
+    parser.add_argument('-b', '--baseline', help='compare results to this JSON file saved with --output')
+    args = parser.parse_args()
+
+    load_server = None
+    load_url = args.url
+    if args.server:
+        load_server, load_url = start_server(args.workers, args.table_file)
+    try:
+        if load_url:
+            def get_load_client() -> httpx.AsyncClient:
+                return httpx.AsyncClient(base_url=load_url, limits=httpx.Limits(max_connections=args.concurrency))
+        else:
+            def get_load_client() -> httpx.AsyncClient:
+                return get_in_process_client()
+
+        load_results = asyncio.run(run_load_test(args.mix, args.requests, args.concurrency, args.duration,
+                                                 args.seed, get_load_client))
+    finally:
+        if load_server is not None:
+            load_server.terminate()
+            load_server.wait()
+
+    load_test_results = {
+        'date': str(date.today()),
+        'commit': get_git_commit(),
+        'python': platform.python_version(),
+        'target': load_url or 'in-process',
+        'workers': args.workers if args.server else None,
+        'results': load_results,
+    }
+    print(dumps(load_test_results, indent=4))
+    if args.output:
+        with open(args.output, 'w') as f:
+            dump(load_test_results, f, indent=4)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline_results = load(f)
+        print()
+        print(f'Compared to {args.baseline} (commit {baseline_results.get("commit")}):')
+        print('\n'.join(get_comparison(load_test_results, baseline_results)))
@@ -0,0 +1,151 @@
+# Licensed under the Creative Commons BY license: https://creativecommons.org/licenses/by/4.0/
+
+# Request metrics for the web API in Prometheus text format, without any dependencies.
+#
+# MetricsMiddleware is plain ASGI middleware recording each HTTP request's route (the path template, e.g.
+# /shadow/{ap_type}/{subtype}, so there is a fixed number of labels), method, status code and latency in an
+# ApiMetrics object, which renders them for a /metrics endpoint:
+#
+#   metrics = ApiMetrics()
+#   app.add_middleware(MetricsMiddleware, metrics=metrics)
+#   metrics.add_cache('response_bodies', response_bodies.info)  # any function returning hits and misses
+#
+# Recording a request is a few dictionary updates; nothing is formatted until /metrics is requested.
+
+from bisect import bisect_left
+from collections.abc import Callable
+from time import perf_counter
+
+# latency histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+VALIDATION_ERROR_STATUSES = (400, 422)
+UNMATCHED_ROUTE = 'unmatched'  # e.g. 404 for an unknown path
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class LatencyHistogram:
+    __slots__ = ('bucket_counts', 'count', 'total')
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)  # per bucket (not cumulative), last is +Inf
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.bucket_counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+
+def escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels: dict[str, str]) -> str:
+    return '{' + ','.join(f'{name}="{escape_label(str(value))}"' for name, value in labels.items()) + '}'
+
+
+class ApiMetrics:
+    def __init__(self):
+        self.requests: dict[tuple[str, str, int], int] = {}  # (route, method, status) -> requests
+        self.latencies: dict[str, LatencyHistogram] = {}  # route -> latency histogram
+        self.validation_errors: dict[str, int] = {}  # route -> invalid requests or batch items
+        self.caches: dict[str, Callable[[], dict]] = {}  # cache name -> function returning hits and misses
+
+    def observe(self, route: str, method: str, status: int, seconds: float) -> None:
+        key = (route, method, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        histogram = self.latencies.get(route)
+        if histogram is None:
+            histogram = self.latencies[route] = LatencyHistogram()
+        histogram.observe(seconds)
+        if status in VALIDATION_ERROR_STATUSES:
+            self.add_validation_errors(route)
+
+    # for errors that don't fail the request, e.g. invalid items of a batch
+    def add_validation_errors(self, route: str, count: int = 1) -> None:
+        self.validation_errors[route] = self.validation_errors.get(route, 0) + count
+
+    def add_cache(self, name: str, info: Callable[[], dict]) -> None:
+        self.caches[name] = info
+
+    def clear(self) -> None:
+        self.requests.clear()
+        self.latencies.clear()
+        self.validation_errors.clear()
+
+    def render(self) -> str:
+        lines = ['# HELP ap_api_requests_total Requests by route, method and status code.',
+                 '# TYPE ap_api_requests_total counter']
+        for (route, method, status), count in sorted(self.requests.items()):
+            labels = format_labels({'route': route, 'method': method, 'status': status})
+            lines.append(f'ap_api_requests_total{labels} {count}')
+
+        lines.append('# HELP ap_api_request_duration_seconds Request latency by route.')
+        lines.append('# TYPE ap_api_request_duration_seconds histogram')
+        for route, histogram in sorted(self.latencies.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), histogram.bucket_counts):
+                cumulative += count
+                labels = format_labels({'route': route, 'le': bound})
+                lines.append(f'ap_api_request_duration_seconds_bucket{labels} {cumulative}')
+            labels = format_labels({'route': route})
+            lines.append(f'ap_api_request_duration_seconds_sum{labels} {histogram.total:.9g}')
+            lines.append(f'ap_api_request_duration_seconds_count{labels} {histogram.count}')
+
+        lines.append('# HELP ap_api_validation_errors_total Invalid requests and batch items by route.')
+        lines.append('# TYPE ap_api_validation_errors_total counter')
+        for route, count in sorted(self.validation_errors.items()):
+            labels = format_labels({'route': route})
+            lines.append(f'ap_api_validation_errors_total{labels} {count}')
+
+        cache_infos = {name: info() for name, info in sorted(self.caches.items())}
+        for metric, metric_type, help_text, key in (
+                ('ap_api_cache_hits_total', 'counter', 'Cache hits.', 'hits'),
+                ('ap_api_cache_misses_total', 'counter', 'Cache misses.', 'misses'),
+                ('ap_api_cache_hit_ratio', 'gauge', 'Cache hits divided by cache lookups.', 'hit_ratio')):
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} {metric_type}')
+            for name, cache_info in cache_infos.items():
+                labels = format_labels({'cache': name})
+                value = cache_info[key]
+                formatted = f'{value:.6g}' if isinstance(value, float) else str(value)
+                lines.append(f'{metric}{labels} {formatted}')
+        return '\n'.join(lines) + '\n'
+
+
+def get_route(scope: dict) -> str:
+    # path template of the matched route, set in the scope by the router
+    route = scope.get('route')
+    path = getattr(route, 'path', None)
+    if path is not None:
+        return path
+    endpoint = scope.get('endpoint')
+    return getattr(endpoint, '__name__', UNMATCHED_ROUTE)
+
+
+class MetricsMiddleware:
+    def __init__(self, app, metrics: ApiMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = 500  # if the app fails before starting a response
+        start = perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # includes sending the body, e.g. for streamed responses
+            self.metrics.observe(get_route(scope), scope['method'], status, perf_counter() - start)
@@ -0,0 +1,180 @@
+# Licensed under the Creative Commons BY license: https://creativecommons.org/licenses/by/4.0/
+
+# Per-client rate limiting and load shedding for the web API, without any required dependencies.
+#
+# RateLimiter keeps a token bucket per client and route: each request takes a token, and tokens are added back at a
+# fixed rate up to a burst size. Clients are identified by an API key (X-API-Key header) if it's one of the known
+# keys, otherwise by their IP address (behind a proxy, run uvicorn with proxy headers so this is the real client).
+# RateLimitMiddleware responds 429 Too Many Requests with Retry-After when a client has no tokens left, and 503
+# Service Unavailable (also with Retry-After) when too many requests are already in progress, instead of queueing
+# them:
+#
+#   rate_limiter = RateLimiter(RateLimit(100, 200), {'/shadow/batch': RateLimit(1, 5), '/healthz': None})
+#   app.add_middleware(RateLimitMiddleware, limiter=rate_limiter, max_concurrency=256)
+#
+# Limits are per process, so with several workers a client gets up to that many times the rate.
+
+import os
+from collections import OrderedDict
+from math import ceil
+from time import monotonic
+
+try:
+    from starlette.routing import Match  # optional, only used to label rejected requests with their route
+except ImportError:
+    Match = None
+
+MAX_CLIENTS = 100000  # buckets kept before dropping those of the least recently seen clients
+API_KEY_HEADER = b'x-api-key'
+
+
+class RateLimit:
+    __slots__ = ('rate', 'burst')
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate  # requests per second
+        self.burst = burst  # requests allowed at once after being idle
+
+    def __eq__(self, other):
+        return isinstance(other, RateLimit) and (self.rate, self.burst) == (other.rate, other.burst)
+
+    def __repr__(self):
+        return f'RateLimit({self.rate}, {self.burst})'
+
+
+def parse_rate_limit(value: str) -> RateLimit | None:
+    # 'rate/burst' in requests per second (e.g. '100/200'), or just 'rate' for a burst of 1 second; '0' for no limit
+    rate, _, burst = value.partition('/')
+    rate = float(rate)
+    if rate <= 0:
+        return None
+    return RateLimit(rate, float(burst) if burst else max(rate, 1.0))
+
+
+def get_rate_limit_env(name: str, default: str) -> RateLimit | None:
+    try:
+        return parse_rate_limit(os.getenv(name, default))
+    except ValueError:
+        raise ValueError(f'Invalid {name}, expected requests per second and optional burst, e.g. {default}') from None
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter:
+    def __init__(self, default: RateLimit | None, routes: dict[str, RateLimit | None] = None,
+                 api_keys: set[str] = frozenset()):
+        # routes are path prefixes (e.g. /shadow/batch) with their own limit, or None for no limit
+        self.default = default
+        self.routes = sorted((routes or {}).items(), key=lambda item: -len(item[0]))  # most specific first
+        self.api_keys = api_keys
+        self.enabled = True
+        # (client, route prefix) -> bucket, least recently used first
+        self.buckets: OrderedDict[tuple[str, str], TokenBucket] = OrderedDict()
+
+    def get_limit(self, path: str) -> tuple[str, RateLimit | None]:
+        for prefix, limit in self.routes:
+            if path == prefix or path.startswith(prefix + '/'):
+                return prefix, limit
+        return '', self.default
+
+    def get_client(self, scope: dict) -> str:
+        if self.api_keys:
+            for name, value in scope['headers']:
+                if name == API_KEY_HEADER:
+                    api_key = value.decode('latin-1')
+                    if api_key in self.api_keys:
+                        return f'key:{api_key}'
+                    break
+        client = scope.get('client')
+        return f'ip:{client[0]}' if client else 'ip:unknown'
+
+    def acquire(self, client: str, path: str, now: float | None = None) -> float:
+        # Takes a token from the client's bucket for this path. Returns 0 if the request is allowed, otherwise the
+        # seconds until a token is available.
+        prefix, limit = self.get_limit(path)
+        if limit is None or not self.enabled:
+            return 0.0
+        if now is None:
+            now = monotonic()
+        key = (client, prefix)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            while len(self.buckets) >= MAX_CLIENTS:
+                self.buckets.popitem(last=False)  # a new bucket for this client later is at worst a full one
+            bucket = self.buckets[key] = TokenBucket(limit.burst, now)
+        else:
+            self.buckets.move_to_end(key)
+            bucket.tokens = min(limit.burst, bucket.tokens + (now - bucket.updated) * limit.rate)
+            bucket.updated = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return 0.0
+        return (1 - bucket.tokens) / limit.rate
+
+    def clear(self) -> None:
+        self.buckets.clear()
+
+
+async def send_error(send, status: int, retry_after: float, detail: str) -> None:
+    body = f'{{"detail":"{detail}"}}'.encode()
+    await send({'type': 'http.response.start', 'status': status, 'headers': [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode()),
+        (b'retry-after', str(max(1, ceil(retry_after))).encode()),
+    ]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def set_route(scope: dict) -> None:
+    # Sets the route the router would handle the request with, as the router does, so MetricsMiddleware counts
+    # rejected requests by route instead of as unmatched. Only done for rejected requests.
+    router = getattr(scope.get('app'), 'router', None)
+    if Match is None or router is None:
+        return
+    partial = None
+    for route in router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            scope['route'] = route
+            return
+        if match == Match.PARTIAL and partial is None:
+            partial = route
+    if partial is not None:
+        scope['route'] = partial
+
+
+class RateLimitMiddleware:
+    def __init__(self, app, limiter: RateLimiter, max_concurrency: int | None = None):
+        self.app = app
+        self.limiter = limiter
+        self.max_concurrency = max_concurrency  # requests in progress (including streaming) before responding 503
+        self.active = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        # 429 and 503 responses are counted by MetricsMiddleware, by route and status code
+        if self.max_concurrency and self.active >= self.max_concurrency:
+            set_route(scope)
+            await send_error(send, 503, 1, 'Server busy')
+            return
+        limiter = self.limiter
+        retry_after = limiter.acquire(limiter.get_client(scope), scope['path'])
+        if retry_after:
+            set_route(scope)
+            await send_error(send, 429, retry_after, 'Too many requests')
+            return
+
+        self.active += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.active -= 1
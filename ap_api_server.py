@@ -0,0 +1,128 @@
+# Licensed under the Creative Commons BY license: https://creativecommons.org/licenses/by/4.0/
+
+# Launcher for the web API (ap_shadow_type_api.app) with uvicorn, with a worker process per CPU by default.
+#
+# To run on port 8000 with a worker per CPU, sharing a table file (built first if it's missing or stale):
+#   python ap_api_server.py [--port 8000] [--workers n] [--table-file ap_tables.bin]
+# To listen on a Unix socket instead (e.g. behind nginx):
+#   python ap_api_server.py --uds /run/ap_api.sock
+# To reload on code changes during development (single process, without warm-up):
+#   python ap_api_server.py --reload
+#
+# With several workers, SIGHUP restarts them one at a time (e.g. after deploying new code) without dropping the
+# socket, and SIGTTIN/SIGTTOU add or remove a worker. The event loop and HTTP parser are uvloop and httptools when
+# installed (uvicorn[standard]), otherwise asyncio and h11.
+
+import argparse
+import os
+from importlib.util import find_spec
+
+from ap_table_file import TableFile, TableFileError
+
+APP = 'ap_shadow_type_api:app'
+DEFAULT_PORT = 8000
+WS_MAX_SIZE = 16384  # bytes per WebSocket message; queries are much smaller (see MAX_WEBSOCKET_MESSAGE_SIZE)
+
+
+def get_loop(loop: str) -> str:
+    if loop == 'auto':
+        return 'uvloop' if find_spec('uvloop') is not None else 'asyncio'
+    return loop
+
+
+def get_http(http: str) -> str:
+    if http == 'auto':
+        return 'httptools' if find_spec('httptools') is not None else 'h11'
+    return http
+
+
+def prepare_table_file(path: str) -> bool:
+    # Builds the table file if it's missing or stale, so workers can all map it instead of each building the
+    # response bodies. Returns whether it was built.
+    from ap_shadow_type_api import build_table_file, get_table_version_key  # imports FastAPI
+
+    try:
+        table_file = TableFile(path, get_table_version_key())
+        table_file.sections.clear()  # release views of the map before closing it
+        table_file.mmap.close()
+        return False
+    except (OSError, TableFileError):
+        build_table_file(path)
+        return True
+
+
+def get_uvicorn_options(args: argparse.Namespace) -> dict:
+    options = {
+        'loop': get_loop(args.loop),
+        'http': get_http(args.http),
+        'timeout_keep_alive': args.keep_alive,
+        'backlog': args.backlog,
+        'ws_max_size': WS_MAX_SIZE,
+        'proxy_headers': args.proxy_headers,
+        'log_level': args.log_level,
+        'access_log': args.access_log,
+    }
+    if args.uds:
+        options['uds'] = args.uds
+    else:
+        options['host'] = args.host
+        options['port'] = args.port
+    if args.limit_concurrency:
+        options['limit_concurrency'] = args.limit_concurrency
+    if args.reload:
+        options['reload'] = True  # uvicorn only supports reloading a single process
+    else:
+        options['workers'] = args.workers
+    return options
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='ap_api_server',
+        usage='Run the AP web API',
+        add_help=True,  # add -h/--help option
+    )
+    parser.add_argument('--host', default=os.getenv('AP_API_HOST', '127.0.0.1'),
+                        help='bind address (default: AP_API_HOST or 127.0.0.1; 0.0.0.0 for all interfaces)')
+    parser.add_argument('-p', '--port', type=int, default=int(os.getenv('AP_API_PORT', DEFAULT_PORT)),
+                        help=f'port (default: AP_API_PORT or {DEFAULT_PORT})')
+    parser.add_argument('--uds', help='listen on this Unix socket instead of a host and port')
+    parser.add_argument('-w', '--workers', type=int, default=int(os.getenv('AP_API_WORKERS', os.cpu_count() or 1)),
+                        help='number of worker processes (default: AP_API_WORKERS or number of CPUs)')
+    parser.add_argument('-t', '--table-file', default=os.getenv('AP_TABLE_FILE'),
+                        help='table file shared by the workers, built if missing or stale (default: AP_TABLE_FILE)')
+    parser.add_argument('--keep-alive', type=int, default=5,
+                        help='seconds to keep idle connections open (default: 5)')
+    parser.add_argument('--backlog', type=int, default=2048,
+                        help='maximum number of pending connections (default: 2048)')
+    parser.add_argument('--limit-concurrency', type=int,
+                        help='respond 503 beyond this many connections and tasks per worker (default: no limit)')
+    parser.add_argument('--loop', choices=('auto', 'asyncio', 'uvloop'), default='auto',
+                        help='event loop (default: uvloop if installed)')
+    parser.add_argument('--http', choices=('auto', 'h11', 'httptools'), default='auto',
+                        help='HTTP parser (default: httptools if installed)')
+    parser.add_argument('--proxy-headers', action='store_true',
+                        help='use X-Forwarded-For and X-Forwarded-Proto from trusted proxies for client addresses')
+    parser.add_argument('--reload', action='store_true', help='reload on code changes, for development')
+    parser.add_argument('--log-level', choices=('critical', 'error', 'warning', 'info', 'debug'), default='info',
+                        help='log level (default: info)')
+    parser.add_argument('--no-access-log', dest='access_log', action='store_false', help='disable the access log')
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_parser().parse_args()
+
+    if args.reload:
+        os.environ.setdefault('AP_API_WARM_UP', '0')  # don't rebuild every table on each reload
+    if args.table_file and not args.reload:
+        if prepare_table_file(args.table_file):
+            print(f'Built {args.table_file}')
+        os.environ['AP_TABLE_FILE'] = args.table_file  # read by each worker on import
+
+    import uvicorn
+
+    uvicorn_options = get_uvicorn_options(args)
+    print(f'Running {APP} with {uvicorn_options.get("workers", 1)} workers, {uvicorn_options["loop"]} and '
+          f'{uvicorn_options["http"]}')
+    uvicorn.run(APP, **uvicorn_options)
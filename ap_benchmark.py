@@ -0,0 +1,208 @@
+# Licensed under the Creative Commons BY license: https://creativecommons.org/licenses/by/4.0/
+
+# Benchmarks for the calculator entry points over their full input spaces.
+#
+# To run all benchmarks:
+#   python ap_benchmark.py
+# To save results as a baseline, then compare a later run against it (fails if ops/sec drops by more than 20%):
+#   python ap_benchmark.py --save baseline.json
+#   python ap_benchmark.py --baseline baseline.json --threshold 0.2
+#
+# Each benchmark is run once "cold" (after clearing any caches) and then --repeat times "warm". Latency percentiles
+# are per call.
+
+import argparse
+import asyncio
+import io
+import platform
+import sys
+from contextlib import redirect_stdout
+from datetime import date
+from json import dump, load
+from time import perf_counter_ns
+
+import ap_core
+from ap_all_intertype import get_all_intertypes
+from ap_core import ap_types, subtypes
+from ap_intertype import get_intertype
+from ap_shadow_type_calculator import (ShadowTypes, calculate_shadow_types, get_shadow_types_str, render_cache,
+                                       shadow_type_table)
+from triads import get_archetypes, get_triads, get_trifixes
+from typing_stats import TypingStats
+
+
+class Benchmark:
+    # function is called with each tuple of arguments in inputs; reset clears any caches before the cold run
+    def __init__(self, name: str, function, inputs: list[tuple], reset=None):
+        self.name = name
+        self.function = function
+        self.inputs = inputs
+        self.reset = reset
+
+    def run_once(self) -> list[int]:
+        function = self.function
+        latencies = []
+        for args in self.inputs:
+            start = perf_counter_ns()
+            function(*args)
+            latencies.append(perf_counter_ns() - start)
+        return latencies
+
+    def run(self, repeat: int) -> dict[str, dict[str, float]]:
+        if self.reset is not None:
+            self.reset()
+        results = {'cold': get_stats(self.run_once())}
+        warm_latencies = []
+        for _ in range(repeat):
+            warm_latencies.extend(self.run_once())
+        results['warm'] = get_stats(warm_latencies)
+        return results
+
+
+def get_stats(latencies: list[int]) -> dict[str, float]:
+    total_ns = sum(latencies)
+    latencies = sorted(latencies)
+    return {
+        'calls': len(latencies),
+        'ops_per_sec': len(latencies) * 1e9 / total_ns if total_ns else 0.0,
+        'p50_us': latencies[len(latencies) // 2] / 1000,
+        'p99_us': latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] / 1000,
+        'max_us': latencies[-1] / 1000,  # includes building tables on the first cold call
+    }
+
+
+def reset_shadow_type_caches() -> None:
+    ap_core._shadow_code_table = None
+    shadow_type_table.results = None
+    render_cache.clear()
+    if 'ap_shadow_type_api' in sys.modules:
+        sys.modules['ap_shadow_type_api'].response_bodies.clear()
+
+
+def run_typing_stats(include_celebrities: bool, include_community: bool) -> None:
+    with redirect_stdout(io.StringIO()):
+        TypingStats(include_celebrities, include_community)
+
+
+def get_api_requester(headers: list[tuple[bytes, bytes]] = ()):
+    # Function sending a GET request for a path directly to the ASGI app of ap_shadow_type_api (no network), so
+    # ops/sec is requests/sec through the routing, handlers and response classes. None if FastAPI isn't installed.
+    try:
+        from ap_shadow_type_api import app, rate_limiter
+    except ImportError:
+        return None
+    rate_limiter.enabled = False  # every request comes from the same client
+    loop = asyncio.new_event_loop()
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start' and message['status'] != 200:
+            raise RuntimeError(f'Status {message["status"]}')
+
+    def request(path: str) -> None:
+        scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+                 'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': b'',
+                 'headers': [(b'host', b'localhost'), *headers], 'client': ('127.0.0.1', 0),
+                 'server': ('localhost', 80)}
+        loop.run_until_complete(app(scope, receive, send))
+
+    return request
+
+
+def get_api_benchmarks(pairs: list[tuple[str, str]]) -> list[Benchmark]:
+    request = get_api_requester()
+    gzip_request = get_api_requester([(b'accept-encoding', b'gzip')])
+    if request is None:
+        return []
+    return [
+        Benchmark('API GET /shadow', request, [(f'/shadow/{ap_type}/{subtype}',) for ap_type, subtype in pairs],
+                  reset_shadow_type_caches),
+        Benchmark('API GET /shadow.html', request,
+                  [(f'/shadow.html/{ap_type}/{subtype}',) for ap_type, subtype in pairs], reset_shadow_type_caches),
+        Benchmark('API GET /shadow (gzip)', gzip_request,
+                  [(f'/shadow/{ap_type}/{subtype}',) for ap_type, subtype in pairs], reset_shadow_type_caches),
+    ]
+
+
+def get_benchmarks() -> list[Benchmark]:
+    pairs = [(ap_type, subtype) for ap_type in ap_types for subtype in subtypes]
+    return [
+        Benchmark('ShadowTypes', ShadowTypes, pairs),
+        Benchmark('calculate_shadow_types', calculate_shadow_types, pairs, reset_shadow_type_caches),
+        Benchmark('calculate_shadow_types (no table)', lambda ap_type, subtype: calculate_shadow_types(
+            ap_type, subtype, use_table=False), pairs),
+        Benchmark('get_shadow_types_str (text)', get_shadow_types_str, pairs, reset_shadow_type_caches),
+        Benchmark('get_shadow_types_str (JSON)', lambda ap_type, subtype: get_shadow_types_str(
+            ap_type, subtype, json=True), pairs, reset_shadow_type_caches),
+        Benchmark('get_intertype', get_intertype,
+                  [(ap_type1, ap_type2) for ap_type1 in ap_types for ap_type2 in ap_types]),
+        Benchmark('get_all_intertypes', get_all_intertypes, [(ap_type,) for ap_type in ap_types]),
+        Benchmark('get_triads', get_triads, [(value,) for value in get_trifixes() + get_archetypes()]),
+        Benchmark('TypingStats', run_typing_stats, [(True, False), (False, True), (True, True)]),
+    ] + get_api_benchmarks(pairs)
+
+
+def get_regressions(results: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    for name, phases in results['results'].items():
+        for phase, stats in phases.items():
+            baseline_stats = baseline['results'].get(name, {}).get(phase)
+            if baseline_stats is None:
+                continue
+            ratio = stats['ops_per_sec'] / baseline_stats['ops_per_sec']
+            if ratio < 1 - threshold:
+                regressions.append(f'{name} ({phase}): {stats["ops_per_sec"]:,.0f} ops/sec is '
+                                   f'{100 * (1 - ratio):.1f}% slower than {baseline_stats["ops_per_sec"]:,.0f}')
+    return regressions
+
+
+def run_benchmarks(repeat: int = 3, name_filter: str | None = None) -> dict:
+    results = {}
+    print(f'{"Benchmark":40s} {"Phase":5s} {"Calls":>8s} {"Ops/sec":>12s} {"p50 (us)":>10s} {"p99 (us)":>10s} '
+          f'{"Max (us)":>10s}')
+    for benchmark in get_benchmarks():
+        if name_filter and name_filter not in benchmark.name:
+            continue
+        results[benchmark.name] = benchmark.run(repeat)
+        for phase, stats in results[benchmark.name].items():
+            print(f'{benchmark.name:40s} {phase:5s} {stats["calls"]:8d} {stats["ops_per_sec"]:12,.0f} '
+                  f'{stats["p50_us"]:10.2f} {stats["p99_us"]:10.2f} {stats["max_us"]:10.2f}')
+    return {
+        'date': str(date.today()),
+        'python': platform.python_version(),
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='ap_benchmark',
+        usage='Benchmark AP calculators',
+        add_help=True,  # add -h/--help option
+    )
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='number of warm runs (default: 3)')
+    parser.add_argument('-f', '--filter', help='only run benchmarks whose name contains this text')
+    parser.add_argument('-s', '--save', help='save results to this JSON file')
+    parser.add_argument('-b', '--baseline', help='compare results to this JSON file saved with --save')
+    parser.add_argument('-t', '--threshold', type=float, default=0.2,
+                        help='fail if ops/sec is this fraction slower than the baseline (default: 0.2)')
+    args = parser.parse_args()
+
+    benchmark_results = run_benchmarks(args.repeat, args.filter)
+    if args.save:
+        with open(args.save, 'w') as f:
+            dump(benchmark_results, f, indent=4)
+    if args.baseline:
+        with open(args.baseline) as f:
+            benchmark_regressions = get_regressions(benchmark_results, load(f), args.threshold)
+        if benchmark_regressions:
+            print()
+            print(f'{len(benchmark_regressions)} regressions:')
+            for regression in benchmark_regressions:
+                print(f'- {regression}')
+            sys.exit(1)
+        print()
+        print(f'No regressions compared to {args.baseline}')
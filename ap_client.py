@@ -0,0 +1,406 @@
+# Licensed under the Creative Commons BY license: https://creativecommons.org/licenses/by/4.0/
+
+# Python client for the web API (ap_shadow_type_api.py), with pooled keep-alive connections, a local cache, and
+# retries with exponential backoff for failed connections, 429, 502, 503 and 504 (honoring Retry-After).
+#
+#   async with AsyncApClient('http://127.0.0.1:8000') as client:
+#       results = await asyncio.gather(*(client.shadow_types(ap_type, subtype) for ap_type, subtype in pairs))
+#
+#   with ApClient('http://127.0.0.1:8000') as client:
+#       result = client.intertype('LVEF', 'FEVL')
+#       results = client.shadow_types_batch(pairs)
+#
+# AsyncApClient.shadow_types coalesces calls made within batch_window seconds of each other into a single
+# POST /shadow/batch (up to max_batch_size pairs), so callers can ask for one pair at a time and still get batch
+# throughput. A call with no others to coalesce with is sent as GET /shadow/{ap_type}/{subtype} instead, which is
+# cached with its ETag and has the API's higher per-request rate limit. Batches are sent no faster than
+# batch_rate_limit (the API's default AP_API_BATCH_RATE_LIMIT, 1 per second with a burst of 5); calls made while
+# waiting are added to the next batch. ApClient (for code without an event loop) sends each call as it's made; use
+# shadow_types_batch for many pairs.
+#
+# GET responses are cached with their ETag until their Cache-Control max age expires, then revalidated with
+# If-None-Match (304 Not Modified keeps the cached result). Shadow types from batches (which have no ETag) are cached
+# for batch_max_age seconds. Results are only ever returned from the cache while fresh, so a deploy with a new
+# ALGORITHM_VERSION is picked up when they expire. The cache keeps JSON bodies, decoded for each call, so callers can
+# change the results they get.
+#
+# Invalid input raises ApiError with status code 400, like the API.
+
+import asyncio
+import random
+import re
+import time
+from collections import OrderedDict
+from copy import deepcopy
+from itertools import islice
+from json import dumps, loads
+from urllib.parse import quote
+
+import httpx
+
+from ap_api_rate_limit import RateLimit, RateLimiter
+
+RETRY_STATUSES = (429, 502, 503, 504)
+MAX_AGE_PATTERN = re.compile(r'max-age=(\d+)')
+DEFAULT_BASE_URL = 'http://127.0.0.1:8000'
+BATCH_PATH = '/shadow/batch'
+BATCH_RATE_LIMIT = RateLimit(1, 5)  # the API's default AP_API_BATCH_RATE_LIMIT
+
+
+class ApiError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(f'{status_code}: {detail}')
+        self.status_code = status_code
+        self.detail = detail
+
+
+class CacheEntry:
+    __slots__ = ('etag', 'expires', 'body')
+
+    def __init__(self, etag: str | None, expires: float, body: bytes):
+        self.etag = etag
+        self.expires = expires  # time.monotonic() after which the body must be revalidated
+        self.body = body  # JSON
+
+
+class ResponseCache:
+    # least recently used results by path, with their ETag and expiry
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path: str) -> CacheEntry | None:
+        entry = self.entries.get(path)
+        if entry is not None:
+            self.entries.move_to_end(path)
+        return entry
+
+    def get_fresh(self, path: str) -> bytes | None:
+        # the body if it doesn't need revalidating, otherwise None
+        entry = self.entries.get(path)
+        if entry is None or entry.expires <= time.monotonic():
+            self.misses += 1
+            return None
+        self.entries.move_to_end(path)
+        self.hits += 1
+        return entry.body
+
+    def put(self, path: str, etag: str | None, max_age: float, body: bytes) -> None:
+        if self.max_entries <= 0:
+            return
+        self.entries[path] = CacheEntry(etag, time.monotonic() + max_age, body)
+        self.entries.move_to_end(path)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+def normalize_pair(ap_type: str, subtype: str) -> tuple[str, str]:
+    # same normalization as the API, so there's a single cache entry (and no redirect) for each pair
+    return ap_type.strip().upper(), subtype.strip()
+
+
+def get_shadow_path(ap_type: str, subtype: str) -> str:
+    return f'/shadow/{quote(ap_type, safe="")}/{quote(subtype, safe="")}'
+
+
+def get_intertype_path(ap_type1: str, ap_type2: str) -> str:
+    return f'/intertype/{quote(ap_type1.strip().upper(), safe="")}/{quote(ap_type2.strip().upper(), safe="")}'
+
+
+def get_intertypes_path(ap_type: str) -> str:
+    return f'/intertypes/{quote(ap_type.strip().upper(), safe="")}'
+
+
+def get_triads_path(value: str) -> str:
+    return f'/triads/{quote(value.strip(), safe="/")}'  # the route accepts / (a separator of archetypes)
+
+
+def encode_json(value) -> bytes:
+    # same bytes as the API's responses
+    return dumps(value, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def get_max_age(response: httpx.Response) -> float:
+    cache_control = response.headers.get('cache-control', '')
+    if 'no-store' in cache_control or 'no-cache' in cache_control:
+        return 0
+    match = MAX_AGE_PATTERN.search(cache_control)
+    return int(match.group(1)) if match else 0
+
+
+def get_error(response: httpx.Response) -> ApiError:
+    try:
+        detail = response.json()['detail']
+    except (ValueError, KeyError, TypeError):
+        detail = response.text
+    return ApiError(response.status_code, str(detail))
+
+
+def get_batch_results(response: httpx.Response, count: int) -> list[dict]:
+    results = response.json()
+    if not isinstance(results, list) or len(results) != count:
+        raise ApiError(response.status_code, f'Expected {count} batch results')
+    return results
+
+
+class BaseApClient:
+    # settings, retry delays and caching shared by ApClient and AsyncApClient
+    def __init__(self, base_url: str, *, timeout: float, max_connections: int, retries: int, backoff: float,
+                 max_backoff: float, cache_size: int, batch_max_age: float, api_key: str | None):
+        self.base_url = base_url
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.batch_max_age = batch_max_age
+        self.cache = ResponseCache(cache_size)
+        self.client_options = {
+            'base_url': base_url,
+            'timeout': timeout,
+            'limits': httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            'headers': {'X-API-Key': api_key} if api_key else {},
+            'follow_redirects': True,
+        }
+
+    def get_retry_delay(self, attempt: int, response: httpx.Response | None) -> float:
+        # Retry-After if the API sent one, otherwise exponential backoff with jitter
+        if response is not None:
+            retry_after = response.headers.get('retry-after', '')
+            if retry_after.isdigit():
+                return min(float(retry_after), self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def get_conditional_headers(self, entry: CacheEntry | None) -> dict[str, str]:
+        return {'If-None-Match': entry.etag} if entry is not None and entry.etag else {}
+
+    def handle_get_response(self, path: str, entry: CacheEntry | None, response: httpx.Response) -> bytes:
+        # entry is the cached result the request was conditional on, if any
+        if response.status_code == 304 and entry is not None:
+            self.cache.put(path, entry.etag, get_max_age(response), entry.body)
+            return entry.body
+        if response.status_code != 200:
+            raise get_error(response)
+        self.cache.put(path, response.headers.get('etag'), get_max_age(response), response.content)
+        return response.content
+
+    def handle_batch_results(self, pairs: list[tuple[str, str]], results: list[dict]) -> list[dict]:
+        # results without their index, with shadow types cached by pair
+        for (ap_type, subtype), result in zip(pairs, results):
+            result.pop('index', None)
+            if 'error' not in result:
+                self.cache.put(get_shadow_path(ap_type, subtype), None, self.batch_max_age, encode_json(result))
+        return results
+
+
+class ApClient(BaseApClient):
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, *, timeout: float = 10.0, max_connections: int = 10,
+                 retries: int = 3, backoff: float = 0.1, max_backoff: float = 10.0, cache_size: int = 20000,
+                 batch_max_age: float = 3600, api_key: str | None = None, transport: httpx.BaseTransport = None):
+        super().__init__(base_url, timeout=timeout, max_connections=max_connections, retries=retries,
+                         backoff=backoff, max_backoff=max_backoff, cache_size=cache_size,
+                         batch_max_age=batch_max_age, api_key=api_key)
+        self.client = httpx.Client(transport=transport, **self.client_options)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        self.client.close()
+
+    def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.client.request(method, path, **kwargs)
+            except httpx.TransportError:
+                if attempt == self.retries:
+                    raise
+                response = None
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    return response
+            time.sleep(self.get_retry_delay(attempt, response))
+
+    def get_body(self, path: str) -> bytes:
+        body = self.cache.get_fresh(path)
+        if body is None:
+            entry = self.cache.get(path)
+            response = self.request('GET', path, headers=self.get_conditional_headers(entry))
+            body = self.handle_get_response(path, entry, response)
+        return body
+
+    def get(self, path: str):
+        return loads(self.get_body(path))
+
+    def shadow_types(self, ap_type: str, subtype: str) -> dict:
+        return self.get(get_shadow_path(*normalize_pair(ap_type, subtype)))
+
+    def shadow_types_batch(self, pairs: list[tuple[str, str]]) -> list[dict]:
+        # results in input order, with an error instead of shadow types for invalid pairs
+        pairs = [normalize_pair(ap_type, subtype) for ap_type, subtype in pairs]
+        response = self.request('POST', f'{BATCH_PATH}?format=json',
+                                json=[{'ap_type': ap_type, 'subtype': subtype} for ap_type, subtype in pairs])
+        if response.status_code != 200:
+            raise get_error(response)
+        return self.handle_batch_results(pairs, get_batch_results(response, len(pairs)))
+
+    def intertype(self, ap_type1: str, ap_type2: str) -> dict:
+        return self.get(get_intertype_path(ap_type1, ap_type2))
+
+    def intertypes(self, ap_type: str) -> dict:
+        return self.get(get_intertypes_path(ap_type))
+
+    def intertype_matrix(self) -> dict:
+        return self.get('/intertype/matrix')
+
+    def triads(self, value: str) -> dict:
+        return self.get(get_triads_path(value))
+
+
+class AsyncApClient(BaseApClient):
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, *, timeout: float = 10.0, max_connections: int = 100,
+                 retries: int = 3, backoff: float = 0.1, max_backoff: float = 10.0, cache_size: int = 20000,
+                 batch_max_age: float = 3600, batch_window: float = 0.005, max_batch_size: int = 1000,
+                 batch_rate_limit: RateLimit | None = BATCH_RATE_LIMIT, api_key: str | None = None,
+                 transport: httpx.AsyncBaseTransport = None):
+        super().__init__(base_url, timeout=timeout, max_connections=max_connections, retries=retries,
+                         backoff=backoff, max_backoff=max_backoff, cache_size=cache_size,
+                         batch_max_age=batch_max_age, api_key=api_key)
+        self.client = httpx.AsyncClient(transport=transport, **self.client_options)
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.batch_limiter = RateLimiter(batch_rate_limit)  # None for no limit
+        # pairs waiting for the next batch -> a future for each call
+        self.pending: dict[tuple[str, str], list[asyncio.Future]] = {}
+        self.flush_handle: asyncio.TimerHandle | None = None
+        self.batch_tasks: set[asyncio.Task] = set()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        # sends pending calls without waiting for the batch rate limit (429 responses are retried)
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        while self.pending:
+            self.send_pending()
+        if self.batch_tasks:
+            await asyncio.gather(*self.batch_tasks, return_exceptions=True)
+        await self.client.aclose()
+
+    async def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self.client.request(method, path, **kwargs)
+            except httpx.TransportError:
+                if attempt == self.retries:
+                    raise
+                response = None
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    return response
+            await asyncio.sleep(self.get_retry_delay(attempt, response))
+
+    async def get_body(self, path: str) -> bytes:
+        body = self.cache.get_fresh(path)
+        if body is None:
+            entry = self.cache.get(path)
+            response = await self.request('GET', path, headers=self.get_conditional_headers(entry))
+            body = self.handle_get_response(path, entry, response)
+        return body
+
+    async def get(self, path: str):
+        return loads(await self.get_body(path))
+
+    async def shadow_types(self, ap_type: str, subtype: str) -> dict:
+        # coalesced with other calls into a batch request (see flush)
+        pair = normalize_pair(ap_type, subtype)
+        body = self.cache.get_fresh(get_shadow_path(*pair))
+        if body is not None:
+            return loads(body)
+        future = asyncio.get_running_loop().create_future()  # cancelling a call only cancels its own future
+        futures = self.pending.get(pair)
+        if futures is not None:
+            futures.append(future)  # the same pair requested again before it's sent
+        else:
+            self.pending[pair] = [future]
+            if len(self.pending) == self.max_batch_size:
+                self.flush()
+            elif self.flush_handle is None:
+                self.flush_handle = asyncio.get_running_loop().call_later(self.batch_window, self.flush)
+        return await future
+
+    def flush(self) -> None:
+        # Sends pending shadow_types calls now, a single pair as a GET and more in batches of up to max_batch_size,
+        # unless that's over batch_rate_limit; then they're sent with any later calls once it isn't.
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        while self.pending:
+            if len(self.pending) > 1:
+                retry_after = self.batch_limiter.acquire('', BATCH_PATH)
+                if retry_after:
+                    self.flush_handle = asyncio.get_running_loop().call_later(retry_after, self.flush)
+                    return
+            self.send_pending()
+
+    def send_pending(self) -> None:
+        pairs = list(islice(self.pending, self.max_batch_size))
+        pending = {pair: self.pending.pop(pair) for pair in pairs}
+        task = asyncio.get_running_loop().create_task(self.send_batch(pending))
+        self.batch_tasks.add(task)
+        task.add_done_callback(self.batch_tasks.discard)
+
+    async def send_batch(self, pending: dict[tuple[str, str], list[asyncio.Future]]) -> None:
+        try:
+            if len(pending) == 1:
+                results = [loads(await self.get_body(get_shadow_path(*next(iter(pending)))))]
+            else:
+                results = await self.shadow_types_batch(list(pending))
+        except Exception as e:
+            for futures in pending.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        for futures, result in zip(pending.values(), results):
+            for i, future in enumerate(futures):
+                if future.done():
+                    continue
+                if 'error' in result:
+                    future.set_exception(ApiError(400, result['error']))
+                else:
+                    future.set_result(result if i == 0 else deepcopy(result))  # a result of its own for each call
+
+    async def shadow_types_batch(self, pairs: list[tuple[str, str]]) -> list[dict]:
+        # results in input order, with an error instead of shadow types for invalid pairs
+        pairs = [normalize_pair(ap_type, subtype) for ap_type, subtype in pairs]
+        response = await self.request('POST', f'{BATCH_PATH}?format=json',
+                                      json=[{'ap_type': ap_type, 'subtype': subtype} for ap_type, subtype in pairs])
+        if response.status_code != 200:
+            raise get_error(response)
+        return self.handle_batch_results(pairs, get_batch_results(response, len(pairs)))
+
+    async def intertype(self, ap_type1: str, ap_type2: str) -> dict:
+        return await self.get(get_intertype_path(ap_type1, ap_type2))
+
+    async def intertypes(self, ap_type: str) -> dict:
+        return await self.get(get_intertypes_path(ap_type))
+
+    async def intertype_matrix(self) -> dict:
+        return await self.get('/intertype/matrix')
+
+    async def triads(self, value: str) -> dict:
+        return await self.get(get_triads_path(value))
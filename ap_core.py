@@ -0,0 +1,290 @@
+# Licensed under the Creative Commons BY license: https://creativecommons.org/licenses/by/4.0/
+
+# Compact integer encodings of AP types and subtypes, and the shadow type algorithm implemented on them.
+#
+# - aspects are bit flags (V=1, L=2, E=4, F=8, the same as Aspect.flag in ap_shadow_type_calculator)
+# - blocks are the sum of the flags of their 2 aspects (the same as Block.flag)
+# - AP types are permutation indices between 0 and 23, in itertools.permutations('VLEF') order
+# - subtypes are base 5 integers between 0 and 624, e.g. 1204 is 1*125 + 2*25 + 0*5 + 4 = 179
+#
+# ShadowTypes in ap_shadow_type_calculator is the reference implementation of the shadow type algorithm;
+# calculate_shadow_codes must return the same results for every AP type and subtype.
+
+from array import array
+from itertools import permutations, product
+
+ASPECTS = 'VLEF'
+AP_TYPE_COUNT = 24
+SUBTYPE_COUNT = 625
+ROW_COUNT = AP_TYPE_COUNT * SUBTYPE_COUNT  # (AP type, subtype) pairs, see get_row
+ALL_ROWS = (1 << ROW_COUNT) - 1  # every row as a bit set
+
+aspect_flags: dict[str, int] = {aspect: 1 << i for i, aspect in enumerate(ASPECTS)}
+
+ap_types: tuple[str, ...] = tuple(map(''.join, permutations(ASPECTS)))  # index -> AP type
+ap_type_indices: dict[str, int] = {ap_type: i for i, ap_type in enumerate(ap_types)}
+
+subtypes: tuple[str, ...] = tuple(map(''.join, product('01234', repeat=4)))  # code -> subtype
+subtype_codes: dict[str, int] = {subtype: i for i, subtype in enumerate(subtypes)}
+
+# description flags, describing how a shadow type was reached
+DESCRIPTION_AP_TYPE = 1  # original AP type
+DESCRIPTION_METHOD = 2  # swapped method subtype (2-3 or 1-4)
+DESCRIPTION_SELF = 4  # swapped self subtype (1-2 or 3-4)
+DESCRIPTION_OTHERS = 8  # swapped others subtype (1-3 or 2-4)
+DESCRIPTION_OBSCURED = 16  # swapped for an obscured subtype
+DESCRIPTION_REPEATED = 32  # another subtype tried to swap to the same shadow type ("and ...")
+
+description_flag_names: dict[int, str] = {
+    DESCRIPTION_AP_TYPE: 'AP type',
+    DESCRIPTION_METHOD: 'method',
+    DESCRIPTION_SELF: 'self',
+    DESCRIPTION_OTHERS: 'others',
+    DESCRIPTION_OBSCURED: 'obscured',
+    DESCRIPTION_REPEATED: 'repeated',
+}
+
+
+def encode_ap_type(ap_type_str: str) -> int:
+    try:
+        return ap_type_indices[ap_type_str.upper()]
+    except KeyError:
+        raise ValueError(f'Invalid AP type {ap_type_str}') from None
+
+
+def decode_ap_type(ap_type_index: int) -> str:
+    return ap_types[ap_type_index]
+
+
+def encode_subtype(subtype_str: str) -> int:
+    try:
+        return subtype_codes[subtype_str]
+    except KeyError:
+        raise ValueError(f'Invalid subtype {subtype_str}') from None
+
+
+def decode_subtype(subtype_code: int) -> str:
+    return subtypes[subtype_code]
+
+
+def get_description_flag_names(flags: int) -> list[str]:
+    return [name for flag, name in description_flag_names.items() if flags & flag]
+
+
+# Rows are (AP type, subtype) pairs as ap_type_index * SUBTYPE_COUNT + subtype_code; sets of rows are stored as the
+# bits of an int.
+def get_row(ap_type_index: int, subtype_code: int) -> int:
+    return ap_type_index * SUBTYPE_COUNT + subtype_code
+
+
+def get_pair(row: int) -> tuple[str, str]:
+    return ap_types[row // SUBTYPE_COUNT], subtypes[row % SUBTYPE_COUNT]
+
+
+# rows of the lowest bits set in bits, up to limit
+def get_rows(bits: int, limit: int = ROW_COUNT) -> list[int]:
+    rows = []
+    while bits and len(rows) < limit:
+        low_bit = bits & -bits
+        rows.append(low_bit.bit_length() - 1)
+        bits ^= low_bit
+    return rows
+
+
+class ApType:
+    __slots__ = ('index',)
+
+    def __init__(self, index: int):
+        if not 0 <= index < AP_TYPE_COUNT:
+            raise ValueError(f'Invalid AP type index {index}')
+        self.index = index
+
+    @staticmethod
+    def from_str(ap_type_str: str) -> 'ApType':
+        return ApType(encode_ap_type(ap_type_str.strip()))
+
+    # aspect flag at position (1-4)
+    def aspect(self, pos: int) -> int:
+        return _ap_type_aspects[self.index][pos - 1]
+
+    # position (1-4) of aspect flag
+    def position(self, aspect_flag: int) -> int:
+        return _positions[self.index][aspect_flag]
+
+    def __eq__(self, other):
+        return isinstance(other, ApType) and self.index == other.index
+
+    def __hash__(self):
+        return self.index
+
+    def __str__(self):
+        return ap_types[self.index]
+
+    def __repr__(self):
+        return f'ApType({ap_types[self.index]})'
+
+
+class Subtype:
+    __slots__ = ('code',)
+
+    def __init__(self, code: int):
+        if not 0 <= code < SUBTYPE_COUNT:
+            raise ValueError(f'Invalid subtype code {code}')
+        self.code = code
+
+    @staticmethod
+    def from_str(subtype_str: str) -> 'Subtype':
+        return Subtype(encode_subtype(subtype_str.strip()))
+
+    # target position (0-4) of the aspect at position (1-4)
+    def target(self, pos: int) -> int:
+        return _subtype_targets[self.code][pos - 1]
+
+    def __eq__(self, other):
+        return isinstance(other, Subtype) and self.code == other.code
+
+    def __hash__(self):
+        return self.code
+
+    def __str__(self):
+        return subtypes[self.code]
+
+    def __repr__(self):
+        return f'Subtype({subtypes[self.code]})'
+
+
+def _get_subtype_kind(source_pos: int, target_pos: int) -> str:
+    if source_pos == target_pos:
+        return 'Accentuated'
+    elif target_pos == 0:
+        return 'obscured'
+    positions = {source_pos, target_pos}
+    if positions in ({2, 3}, {1, 4}):
+        return 'method'
+    elif positions in ({1, 2}, {3, 4}):
+        return 'self'
+    else:
+        return 'others'
+
+
+# AP type index -> aspect flags by position
+_ap_type_aspects: tuple[tuple[int, ...], ...] = tuple(
+    tuple(aspect_flags[aspect] for aspect in ap_type) for ap_type in ap_types)
+
+# AP type index -> position (1-4) indexed by aspect flag (only indices 1, 2, 4 and 8 are used)
+_positions: tuple[tuple[int, ...], ...] = tuple(
+    tuple(aspects.index(flag) + 1 if flag in aspects else 0 for flag in range(9)) for aspects in _ap_type_aspects)
+
+
+def _swap_positions(ap_type_index: int, pos1: int, pos2: int) -> int:
+    aspects = list(ap_types[ap_type_index])
+    aspects[pos1 - 1], aspects[pos2 - 1] = aspects[pos2 - 1], aspects[pos1 - 1]
+    return ap_type_indices[''.join(aspects)]
+
+
+# AP type index -> [pos1][pos2] -> AP type index with the aspects at pos1 and pos2 (1-4) swapped
+_swaps: tuple[tuple[tuple[int, ...], ...], ...] = tuple(
+    tuple(tuple(_swap_positions(i, pos1, pos2) if pos1 and pos2 else i for pos2 in range(5)) for pos1 in range(5))
+    for i in range(AP_TYPE_COUNT))
+
+# subtype code -> target positions
+_subtype_targets: tuple[tuple[int, ...], ...] = tuple(tuple(map(int, subtype)) for subtype in subtypes)
+
+# AP type index -> [source pos][target pos] -> subtype description, e.g. 2V-3 (method)
+_subtype_descriptions: tuple[tuple[tuple[str, ...], ...], ...] = tuple(
+    tuple(tuple(f'{source_pos}{ap_type[source_pos - 1]}-{target_pos} ({_get_subtype_kind(source_pos, target_pos)})'
+                if source_pos else '' for target_pos in range(5)) for source_pos in range(5))
+    for ap_type in ap_types)
+
+_kind_flags = {'method': DESCRIPTION_METHOD, 'self': DESCRIPTION_SELF, 'others': DESCRIPTION_OTHERS}
+
+
+def _get_swap_steps(subtype_code: int) -> tuple[tuple[int, int, int, int], ...]:
+    # The order of swaps only depends on the subtype, so it is calculated once per subtype.
+    # Each step is (source pos, target pos, obscured source pos or 0, description flags).
+    targets = _subtype_targets[subtype_code]
+    steps = []
+    swapped_to_obscured = set()
+
+    # swap subtypes pointing to an obscured aspect first, unless it has another aspect pointing at it
+    for obscured_pos, obscured_target in enumerate(targets, 1):
+        if obscured_target == 0:
+            matches = [pos for pos, target in enumerate(targets, 1) if target == obscured_pos]
+            if len(matches) == 1 and matches[0] not in swapped_to_obscured:
+                pos = matches[0]
+                kind = _get_subtype_kind(pos, targets[pos - 1])
+                steps.append((pos, targets[pos - 1], obscured_pos, _kind_flags.get(kind, 0) | DESCRIPTION_OBSCURED))
+                swapped_to_obscured.add(pos)
+
+    # swap method, self and others subtypes
+    for pair in ({2, 3}, {1, 4}, {1, 2}, {3, 4}, {1, 3}, {2, 4}):
+        for pos, target in enumerate(targets, 1):
+            if {pos, target} == pair and pos not in swapped_to_obscured:
+                steps.append((pos, target, 0, _kind_flags[_get_subtype_kind(pos, target)]))
+    return tuple(steps)
+
+
+_swap_steps: tuple[tuple[tuple[int, int, int, int], ...], ...] = tuple(
+    _get_swap_steps(code) for code in range(SUBTYPE_COUNT))
+
+
+def calculate_shadow_codes(ap_type_index: int, subtype_code: int) -> list[tuple[int, str, int]]:
+    # returns (shadow type index, description, description flags) for the AP type and each shadow type
+    aspects = _ap_type_aspects[ap_type_index]
+    descriptions = _subtype_descriptions[ap_type_index]
+    current = ap_type_index
+    results = {current: ['AP type', DESCRIPTION_AP_TYPE]}
+    for source_pos, target_pos, obscured_pos, flags in _swap_steps[subtype_code]:
+        pos = _positions[current][aspects[source_pos - 1]]  # position currently containing aspect
+        if pos == target_pos:
+            # already swapped, e.g. 2-3 and 3-2
+            result = results[current]
+            result[0] = f'{result[0]} and {descriptions[source_pos][target_pos]}'
+            result[1] |= DESCRIPTION_REPEATED
+        else:
+            current = _swaps[current][pos][target_pos]
+            if obscured_pos:
+                description = f'Swapped {descriptions[source_pos][target_pos]} for {descriptions[obscured_pos][0]}'
+            else:
+                description = f'Swapped {descriptions[source_pos][target_pos]}'
+            results[current] = [description, flags]
+    return [(shadow_type, description, flags) for shadow_type, (description, flags) in results.items()]
+
+
+class ShadowCodeTable:
+    # calculate_shadow_codes results for every AP type and subtype in flat arrays, for batch lookups.
+    # Rows are indexed by ap_type_index * SUBTYPE_COUNT + subtype_code; the results of a row are at
+    # offsets[row]:offsets[row + 1] in shadow_types, descriptions (index into description_strings) and flags.
+    __slots__ = ('counts', 'offsets', 'shadow_types', 'descriptions', 'description_flags', 'description_strings')
+
+    def __init__(self):
+        self.counts = array('B')
+        self.offsets = array('I', [0])
+        self.shadow_types = array('B')
+        self.descriptions = array('H')
+        self.description_flags = array('B')
+        self.description_strings: list[str] = []
+
+        description_indices = {}
+        for ap_type_index in range(AP_TYPE_COUNT):
+            for subtype_code in range(SUBTYPE_COUNT):
+                results = calculate_shadow_codes(ap_type_index, subtype_code)
+                for shadow_type, description, flags in results:
+                    if description not in description_indices:
+                        description_indices[description] = len(self.description_strings)
+                        self.description_strings.append(description)
+                    self.shadow_types.append(shadow_type)
+                    self.descriptions.append(description_indices[description])
+                    self.description_flags.append(flags)
+                self.counts.append(len(results))
+                self.offsets.append(len(self.shadow_types))
+
+
+_shadow_code_table: ShadowCodeTable | None = None
+
+
+def get_shadow_code_table() -> ShadowCodeTable:
+    global _shadow_code_table
+    if _shadow_code_table is None:
+        _shadow_code_table = ShadowCodeTable()
+    return _shadow_code_table
@@ -1,6 +1,7 @@
 import argparse
 import sys
 
+from ap_core import AP_TYPE_COUNT, ap_type_indices, ap_types
 from ap_shadow_type_calculator import validate_ap_type, input_ap_type
 
 mapping_dict = {
@@ -31,17 +32,49 @@ mapping_dict = {
 }
 
 
+relation_mappings: tuple[str, ...] = tuple(mapping_dict)  # relation ID -> mapping
+relation_ids: dict[str, int] = {mapping: i for i, mapping in enumerate(relation_mappings)}
+
+
 def get_mapping(ap_type1_str: str, ap_type2_str: str) -> str:
     return ''.join([str(1 + ap_type1_str.find(c)) for c in ap_type2_str])
 
 
+# Relation IDs and rendered intertypes of every pair of AP types, at index1 * 24 + index2 (AP type indices from
+# ap_core), so looking up a pair doesn't compute anything.
+intertype_ids: tuple[int, ...] = tuple(relation_ids[get_mapping(ap_type1_str, ap_type2_str)]
+                                       for ap_type1_str in ap_types for ap_type2_str in ap_types)
+intertype_strs: tuple[str, ...] = tuple(mapping_dict[relation_mappings[intertype_ids[i * AP_TYPE_COUNT + j]]].format(
+    ap_type1_str, ap_type2_str) for i, ap_type1_str in enumerate(ap_types) for j, ap_type2_str in enumerate(ap_types))
+
+
 def get_intertype(ap_type1_str: str, ap_type2_str: str) -> str:
+    try:
+        return intertype_strs[ap_type_indices[ap_type1_str] * AP_TYPE_COUNT + ap_type_indices[ap_type2_str]]
+    except KeyError:
+        pass
+    # invalid, or not uppercase
     validate_ap_type(ap_type1_str)
     validate_ap_type(ap_type2_str)
     mapping = get_mapping(ap_type1_str, ap_type2_str)
     return mapping_dict[mapping].format(ap_type1_str, ap_type2_str)
 
 
+def get_intertype_id(ap_type1_index: int, ap_type2_index: int) -> int:
+    # relation ID (index of relation_mappings) between 2 AP type indices
+    return intertype_ids[ap_type1_index * AP_TYPE_COUNT + ap_type2_index]
+
+
+def get_intertype_matrix() -> list[list[str]]:
+    # intertypes between every pair of AP types, by AP type indices
+    return [list(intertype_strs[i:i + AP_TYPE_COUNT]) for i in range(0, len(intertype_strs), AP_TYPE_COUNT)]
+
+
+def get_intertype_id_matrix() -> list[list[int]]:
+    # relation IDs between every pair of AP types, by AP type indices
+    return [list(intertype_ids[i:i + AP_TYPE_COUNT]) for i in range(0, len(intertype_ids), AP_TYPE_COUNT)]
+
+
 def run_interactive() -> None:
     ap_type1_str = input_ap_type('Enter AP type 1 (q to quit): ')
     ap_type2_str = input_ap_type('Enter AP type 2 (q to quit): ')
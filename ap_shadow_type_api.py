@@ -1,37 +1,715 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+import re
+import sys
+from collections.abc import Iterator
+from contextlib import asynccontextmanager
+from itertools import islice
+from json import JSONDecodeError, dumps, loads
+from math import ceil
+from time import perf_counter
 
-from ap_shadow_type_calculator import calculate_shadow_types
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket
+from fastapi.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
 
-app = FastAPI()
+from ap_all_intertype import get_all_intertypes
+from ap_api_metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, ApiMetrics, MetricsMiddleware
+from ap_api_rate_limit import RateLimiter, RateLimitMiddleware, get_rate_limit_env
+from ap_core import SUBTYPE_COUNT, ap_type_indices, ap_types, subtype_codes, subtypes
+from ap_intertype import get_intertype, get_intertype_matrix as get_intertype_strs_matrix
+from ap_shadow_type_calculator import (ALGORITHM_VERSION, calculate_shadow_types, calculate_shadow_types_batch,
+                                       shadow_type_table)
+from ap_table_file import PackedBodies, TableFile, pack_bodies, write_table_file
+from triads import get_archetypes, get_triads, get_trifixes
 
+MAX_BATCH_SIZE = 15000  # enough for every AP type and subtype
+MAX_BATCH_BYTES = MAX_BATCH_SIZE * 64  # about 45 bytes per pair as JSON, with room for whitespace
+BATCH_CHUNK_SIZE = 1000  # results per streamed chunk
 
-@app.get("/shadow/{ap_type}/{subtype}")
-async def get_shadow_json(ap_type: str, subtype: str):
+WEBSOCKET_PATH = '/ws'
+MAX_WEBSOCKET_MESSAGE_SIZE = 4096  # queries are small; longer messages close the connection
+
+CACHE_CONTROL = 'public, max-age=31536000, immutable'  # responses only change with ALGORITHM_VERSION
+MEDIA_TYPES = {'json': 'application/json', 'html': 'text/html; charset=utf-8'}
+
+WARM_UP = os.getenv('AP_API_WARM_UP', '1') != '0'  # set AP_API_WARM_UP=0 to skip warm-up, e.g. for development
+TABLE_FILE = os.getenv('AP_TABLE_FILE')  # table file built by ap_table_file.py, shared by all worker processes
+
+# per client and worker process, as requests per second and burst (see ap_api_rate_limit.py); 0 for no limit
+RATE_LIMIT = get_rate_limit_env('AP_API_RATE_LIMIT', '100/200')
+BATCH_RATE_LIMIT = get_rate_limit_env('AP_API_BATCH_RATE_LIMIT', '1/5')
+MAX_CONCURRENCY = int(os.getenv('AP_API_MAX_CONCURRENCY', '256'))  # requests in progress per worker; 0 for no limit
+API_KEYS = set(filter(None, os.getenv('AP_API_KEYS', '').split(',')))  # clients rate limited by key instead of IP
+
+# modules whose code determines the contents of table files
+TABLE_SOURCE_MODULES = ('ap_core', 'ap_shadow_type_calculator', 'ap_intertype', 'ap_all_intertype', 'triads', __name__)
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    if TABLE_FILE:
+        load_table_file(TABLE_FILE)  # only maps the file and checks it, so it doesn't need to wait for warm-up
+    # warm up in a thread, so /healthz responds (and /readyz reports not ready) in the meantime
+    task = None
+    if WARM_UP:
+        task = asyncio.create_task(asyncio.to_thread(warm_up.run))
+    else:
+        warm_up.ready = True  # tables are built on first use instead
+    yield
+    if task is not None and not task.done():
+        task.cancel()  # stop waiting for it; the thread finishes on its own
+
+
+app = FastAPI(lifespan=lifespan)
+metrics = ApiMetrics()
+rate_limiter = RateLimiter(RATE_LIMIT, {'/shadow/batch': BATCH_RATE_LIMIT, '/healthz': None, '/readyz': None,
+                                        '/metrics': None}, API_KEYS)
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter, max_concurrency=MAX_CONCURRENCY)
+app.add_middleware(MetricsMiddleware, metrics=metrics)  # added last so it's outermost and counts 429 and 503
+
+
+def render_json(shadow_types: dict) -> bytes:
+    # same bytes as JSONResponse
+    return dumps(shadow_types, ensure_ascii=False, allow_nan=False, indent=None, separators=(',', ':')).encode()
+
+
+def render_html(shadow_types: dict) -> bytes:
+    ap_type = shadow_types['ap_type']
+    subtype = shadow_types["subtype"]
+    results = [f'<h1>Shadow types for {ap_type} {subtype}:</h1><ol>']
+
+    for shadow_type_and_description in shadow_types['shadow_types']:
+        shadow_type = shadow_type_and_description['shadow_type']
+        description = shadow_type_and_description["description"]
+        results.append(f'<li>{shadow_type}: {description}</li>')
+    results.append('</ol>')
+
+    return ''.join(results).encode()
+
+
+renderers = {'json': render_json, 'html': render_html}
+
+
+class PackedMapping:
+    # read-only mapping of keys to bodies in a table file, given the index of each key
+    def __init__(self, indices: dict, packed: PackedBodies):
+        self.indices = indices
+        self.packed = packed
+
+    def get(self, key, default=None):
+        i = self.indices.get(key)
+        return default if i is None else self.packed[i]
+
+    def __len__(self):
+        return len(self.indices)
+
+
+class PackedShadowBodies:
+    # Read-only mapping of (media, AP type, subtype) -> body in a table file, with the bodies of each media in row
+    # order (AP type index * SUBTYPE_COUNT + subtype code, see ap_core). An empty body is None, for gzip bodies.
+    def __init__(self, packed: dict[str, PackedBodies]):
+        self.packed = packed
+
+    def __contains__(self, key: tuple[str, str, str]) -> bool:
+        media, ap_type, subtype = key
+        return media in self.packed and ap_type in ap_type_indices and subtype in subtype_codes
+
+    def __getitem__(self, key: tuple[str, str, str]) -> bytes | None:
+        media, ap_type, subtype = key
+        return self.packed[media][ap_type_indices[ap_type] * SUBTYPE_COUNT + subtype_codes[subtype]] or None
+
+    def get(self, key: tuple[str, str, str], default=None) -> bytes | None:
+        return self[key] if key in self else default
+
+    def __len__(self):
+        return sum(len(packed) for packed in self.packed.values())
+
+
+class ResponseBodies:
+    # Encoded response bodies by (media, AP type, subtype), with normalized AP types and subtypes, so requests don't
+    # serialize anything. Bodies are rendered on first request, or for all AP types and subtypes with warm().
+    # The gzip body is None if compressing doesn't make it smaller.
+    def __init__(self):
+        self.bodies: dict[tuple[str, str, str], bytes] | PackedShadowBodies = {}
+        self.gzip_bodies: dict[tuple[str, str, str], bytes | None] | PackedShadowBodies = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _render(self, key: tuple[str, str, str]) -> bytes:
+        body = self.bodies.get(key)
+        if body is None:
+            media, ap_type, subtype = key
+            body = renderers[media](calculate_shadow_types(ap_type, subtype))
+            self.bodies[key] = body
+        return body
+
+    def get(self, media: str, ap_type: str, subtype: str, count: bool = True) -> bytes:
+        # count=False for requests already counted as a hit or miss, by get_gzip
+        key = (media, ap_type, subtype)
+        body = self.bodies.get(key)
+        if body is None:
+            self.misses += count
+            return self._render(key)
+        self.hits += count
+        return body
+
+    def get_gzip(self, media: str, ap_type: str, subtype: str) -> bytes | None:
+        key = (media, ap_type, subtype)
+        if key in self.gzip_bodies:
+            self.hits += 1
+        else:
+            self.misses += 1
+            body = self._render(key)
+            gzip_body = gzip.compress(body, mtime=0)  # mtime=0 so the same body always has the same bytes
+            self.gzip_bodies[key] = gzip_body if len(gzip_body) < len(body) else None
+        return self.gzip_bodies[key]
+
+    def warm(self, compress: bool = False) -> None:
+        for media in renderers:
+            for ap_type in ap_types:
+                for subtype in subtypes:
+                    if compress:
+                        self.get_gzip(media, ap_type, subtype)
+                    else:
+                        self.get(media, ap_type, subtype)
+
+    def clear(self) -> None:
+        self.bodies = {}
+        self.gzip_bodies = {}
+        self.hits = 0
+        self.misses = 0
+
+    # table file sections: bodies for every AP type and subtype in row order, by media and encoding
+    def pack(self) -> dict[str, bytes]:
+        self.warm(compress=True)
+        sections = {}
+        for media in renderers:
+            keys = [(media, ap_type, subtype) for ap_type in ap_types for subtype in subtypes]
+            sections[f'shadow.{media}'] = pack_bodies([self.bodies[key] for key in keys])
+            sections[f'shadow.{media}.gzip'] = pack_bodies([self.gzip_bodies[key] or b'' for key in keys])
+        return sections
+
+    def load(self, table_file: TableFile) -> None:
+        self.bodies = PackedShadowBodies({media: table_file.bodies(f'shadow.{media}') for media in renderers})
+        self.gzip_bodies = PackedShadowBodies({media: table_file.bodies(f'shadow.{media}.gzip')
+                                               for media in renderers})
+
+    def info(self) -> dict[str, int | float]:
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / requests if requests else 0.0,
+            'size': len(self.bodies) + len(self.gzip_bodies),
+        }
+
+
+response_bodies = ResponseBodies()
+metrics.add_cache('response_bodies', response_bodies.info)
+
+
+def get_etag(ap_type: str, subtype: str, media: str, encoding: str | None = None) -> str:
+    # strong ETag for a normalized AP type and subtype, in the given media (json or html) and content encoding
+    etag = f'v{ALGORITHM_VERSION}-{media}-{ap_type}-{subtype}'
+    return f'"{etag}-{encoding}"' if encoding else f'"{etag}"'
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is None:
+        return False
+    tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags
+
+
+def accepts_gzip(request: Request) -> bool:
+    accept_encoding = request.headers.get('accept-encoding')
+    if accept_encoding is None:
+        return False
+    for coding in accept_encoding.split(','):
+        name, _, params = coding.partition(';')
+        if name.strip().lower() == 'gzip':
+            return params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+def error_response(status_code: int, detail: str) -> Response:
+    # same body as HTTPException, without raising it through FastAPI's exception handlers
+    return Response(content=render_json({'detail': detail}), status_code=status_code, media_type=MEDIA_TYPES['json'])
+
+
+def get_shadow_response(request: Request, route: str, ap_type: str, subtype: str, media: str) -> Response:
+    # 400 for invalid input (checked against the valid AP types and subtypes before any other work), redirect for
+    # non-normalized input (e.g. lowercase AP type or spaces) so there is a single URL for each result, 304 if the
+    # client already has the result, and otherwise the pre-encoded body (gzipped if accepted).
+    if ap_type not in ap_type_indices or subtype not in subtype_codes:
+        normalized_ap_type = ap_type.strip().upper()
+        normalized_subtype = subtype.strip()
+        if normalized_ap_type not in ap_type_indices:
+            return error_response(400, f'Invalid AP type {normalized_ap_type}')
+        if normalized_subtype not in subtype_codes:
+            return error_response(400, f'Invalid subtype {normalized_subtype}')
+        url = request.scope.get('root_path', '') + app.url_path_for(route, ap_type=normalized_ap_type,
+                                                                    subtype=normalized_subtype)
+        if request.url.query:
+            url += '?' + request.url.query
+        return RedirectResponse(url, status_code=308, headers={'Cache-Control': CACHE_CONTROL})
+
+    gzip_accepted = accepts_gzip(request)
+    body = response_bodies.get_gzip(media, ap_type, subtype) if gzip_accepted else None
+    headers = {
+        'ETag': get_etag(ap_type, subtype, media, 'gzip' if body is not None else None),
+        'Cache-Control': CACHE_CONTROL,
+        'Vary': 'Accept-Encoding',
+    }
+    if is_not_modified(request, headers['ETag']):
+        return Response(status_code=304, headers=headers)
+    if body is None:
+        body = response_bodies.get(media, ap_type, subtype, count=not gzip_accepted)
+    else:
+        headers['Content-Encoding'] = 'gzip'
+    return Response(content=body, media_type=MEDIA_TYPES[media], headers=headers)
+
+
+# The shadow type routes read path parameters from request.path_params instead of handler arguments, since FastAPI's
+# per-request parameter handling costs more than the rest of the request. These document them in the OpenAPI schema.
+SHADOW_PATH_PARAMETERS = {
+    'parameters': [
+        {'name': 'ap_type', 'in': 'path', 'required': True, 'schema': {'type': 'string'}},
+        {'name': 'subtype', 'in': 'path', 'required': True, 'schema': {'type': 'string'}},
+    ],
+    'responses': {
+        '400': {
+            'description': 'Invalid AP type or subtype',
+            'content': {'application/json': {'example': {'detail': 'Invalid AP type VLLE'}}},
+        },
+    },
+}
+
+
+@app.get("/shadow/{ap_type}/{subtype}", openapi_extra=SHADOW_PATH_PARAMETERS)
+async def get_shadow_json(request: Request):
+    path_params = request.path_params
+    return get_shadow_response(request, 'get_shadow_json', path_params['ap_type'], path_params['subtype'], 'json')
+
+
+@app.get("/shadow.html/{ap_type}/{subtype}", openapi_extra=SHADOW_PATH_PARAMETERS)
+async def get_shadow_html(request: Request):
+    path_params = request.path_params
+    return get_shadow_response(request, 'get_shadow_html', path_params['ap_type'], path_params['subtype'], 'html')
+
+
+async def read_batch_body(request: Request) -> bytes:
+    # read at most MAX_BATCH_BYTES, without trusting Content-Length (it may be missing for chunked requests)
+    content_length = request.headers.get('content-length')
+    if content_length is not None and content_length.isdigit() and int(content_length) > MAX_BATCH_BYTES:
+        raise HTTPException(status_code=413, detail=f'Request body is larger than {MAX_BATCH_BYTES} bytes')
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > MAX_BATCH_BYTES:
+            raise HTTPException(status_code=413, detail=f'Request body is larger than {MAX_BATCH_BYTES} bytes')
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def parse_batch_pair(pair) -> tuple[str, str]:
+    if not isinstance(pair, dict) or not isinstance(pair.get('ap_type'), str) or not isinstance(
+            pair.get('subtype'), str):
+        raise ValueError('Expected {"ap_type": string, "subtype": string}')
+    ap_type_str = pair['ap_type'].strip().upper()
+    subtype_str = pair['subtype'].strip()
+    if ap_type_str not in ap_type_indices:
+        raise ValueError(f'Invalid AP type {pair["ap_type"]}')
+    if subtype_str not in subtype_codes:
+        raise ValueError(f'Invalid subtype {pair["subtype"]}')
+    return ap_type_str, subtype_str
+
+
+# (AP type, subtype) for each valid pair and the error message for each invalid pair, in input order
+def parse_batch_pairs(pairs: list) -> list[tuple[str, str] | str]:
+    parsed = []
+    for pair in pairs:
+        try:
+            parsed.append(parse_batch_pair(pair))
+        except ValueError as e:
+            parsed.append(e.args[0])
+    return parsed
+
+
+def get_batch_results(parsed: list[tuple[str, str] | str]) -> Iterator[dict]:
+    # Calculate all valid pairs from parse_batch_pairs with a single calculate_shadow_types_batch call.
+    # Results are in input order, with an error instead of shadow types for invalid pairs.
+    valid = [result for result in parsed if isinstance(result, tuple)]
+    batch = calculate_shadow_types_batch([ap_type for ap_type, _ in valid], [subtype for _, subtype in valid])
+
+    functions = {}  # AP type -> functions, shared by all its subtypes
+    batch_index = 0
+    for index, result in enumerate(parsed):
+        if isinstance(result, str):
+            yield {'index': index, 'error': result}
+            continue
+        ap_type_str, subtype_str = result
+        if ap_type_str not in functions:
+            functions[ap_type_str] = shadow_type_table.lookup(ap_type_str, '0000')['functions']
+        yield {
+            'index': index,
+            'ap_type': ap_type_str,
+            'subtype': subtype_str,
+            'shadow_types': [{'shadow_type': shadow_type, 'description': description}
+                             for shadow_type, description in batch.get(batch_index)],
+            'functions': functions[ap_type_str],
+        }
+        batch_index += 1
+
+
+def encode_batch_results(results: Iterator[dict], ndjson: bool) -> Iterator[bytes]:
+    # NDJSON is 1 result per line; JSON is a single array. Either way, results are sent in chunks.
+    lines = map(render_json, results)
+    if not ndjson:
+        yield b'['
+    first = True
+    while chunk := list(islice(lines, BATCH_CHUNK_SIZE)):
+        if ndjson:
+            yield b'\n'.join(chunk) + b'\n'
+        else:
+            yield (b'' if first else b',') + b','.join(chunk)
+        first = False
+    if not ndjson:
+        yield b']'
+
+
+@app.post("/shadow/batch")
+async def post_shadow_batch(request: Request, output_format: str = Query('ndjson', alias='format')):
+    # Body: JSON array of {"ap_type": ..., "subtype": ...}, up to MAX_BATCH_SIZE pairs.
+    # format=ndjson (default) streams 1 JSON result per line; format=json streams a JSON array.
+    if output_format not in ('ndjson', 'json'):
+        raise HTTPException(status_code=400, detail=f'Invalid format {output_format}, expected ndjson or json')
+    body = await read_batch_body(request)
+    try:
+        pairs = loads(body)
+    except (JSONDecodeError, UnicodeDecodeError, RecursionError):  # RecursionError for deeply nested arrays
+        raise HTTPException(status_code=400, detail='Request body is not valid JSON') from None
+    if not isinstance(pairs, list):
+        raise HTTPException(status_code=400, detail='Expected a JSON array of {"ap_type", "subtype"} pairs')
+    if len(pairs) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f'{len(pairs)} pairs, expected at most {MAX_BATCH_SIZE}')
+
+    parsed = parse_batch_pairs(pairs)
+    invalid_count = sum(1 for result in parsed if isinstance(result, str))
+    if invalid_count:
+        metrics.add_validation_errors(request.scope['route'].path, invalid_count)
+    ndjson = output_format == 'ndjson'
+    return StreamingResponse(encode_batch_results(get_batch_results(parsed), ndjson),
+                             media_type='application/x-ndjson' if ndjson else 'application/json')
+
+
+class JsonTable:
+    # JSON bodies for every valid input, encoded on first use or loaded from a table file.
+    # get_keys returns every key, in a fixed order (their order in table files); get_content returns the JSON content
+    # for a key.
+    def __init__(self, get_keys, get_content):
+        self.get_keys = get_keys
+        self.get_content = get_content
+        self.bodies: dict | PackedMapping | None = None
+
+    def warm(self) -> None:
+        if self.bodies is None:
+            self.bodies = {key: render_json(self.get_content(key)) for key in self.get_keys()}
+
+    def get(self, key) -> bytes | None:
+        if self.bodies is None:
+            self.warm()
+        return self.bodies.get(key)
+
+    def pack(self) -> bytes:
+        self.warm()
+        return pack_bodies([self.bodies[key] for key in self.get_keys()])
+
+    def load(self, packed: PackedBodies) -> None:
+        self.bodies = PackedMapping({key: i for i, key in enumerate(self.get_keys())}, packed)
+
+
+def get_intertype_keys() -> list[tuple[str, str]]:
+    return [(ap_type1, ap_type2) for ap_type1 in ap_types for ap_type2 in ap_types]
+
+
+def get_intertype_content(key: tuple[str, str]) -> dict:
+    ap_type1, ap_type2 = key
+    return {'ap_type1': ap_type1, 'ap_type2': ap_type2, 'intertype': get_intertype(ap_type1, ap_type2)}
+
+
+def get_all_intertypes_content(ap_type: str) -> dict:
+    return {'ap_type': ap_type, 'intertypes': get_all_intertypes(ap_type)}
+
+
+def get_intertype_matrix_content(_key: None) -> dict:
+    return {'ap_types': list(ap_types), 'intertypes': get_intertype_strs_matrix()}
+
+
+def normalize_triads_value(value: str) -> str:
+    # same form for any case or separators accepted by get_triads, e.g. 'spi sy/cy/un' -> 'SPI SY-CY-UN'
+    value = value.strip().upper()
+    if len(value) == 3:
+        return value
+    tokens = re.split('[ -/]', value)
+    if len(tokens) == 4:
+        return f'{tokens[0]} {"-".join(tokens[1:])}'
+    return '-'.join(tokens)
+
+
+def get_triads_content(value: str) -> dict:
+    return {'value': value, 'triads': get_triads(value)}
+
+
+intertype_table = JsonTable(get_intertype_keys, get_intertype_content)
+all_intertypes_table = JsonTable(lambda: list(ap_types), get_all_intertypes_content)
+intertype_matrix_table = JsonTable(lambda: [None], get_intertype_matrix_content)
+triads_table = JsonTable(lambda: get_trifixes() + get_archetypes(), get_triads_content)
+
+
+def json_response(body: bytes) -> Response:
+    return Response(content=body, media_type=MEDIA_TYPES['json'])
+
+
+@app.get("/intertype/matrix")
+async def get_intertype_matrix():
+    return json_response(intertype_matrix_table.get(None))
+
+
+# Encoded bodies shared by the GET routes and the WebSocket, raising HTTPException for invalid input
+
+def get_intertype_body(ap_type1: str, ap_type2: str) -> bytes:
+    ap_type1 = ap_type1.strip().upper()
+    ap_type2 = ap_type2.strip().upper()
+    body = intertype_table.get((ap_type1, ap_type2))
+    if body is None:
+        invalid_ap_type = ap_type1 if ap_type1 not in ap_type_indices else ap_type2
+        raise HTTPException(status_code=400, detail=f'Invalid AP type {invalid_ap_type}')
+    return body
+
+
+def get_all_intertypes_body(ap_type: str) -> bytes:
+    ap_type = ap_type.strip().upper()
+    body = all_intertypes_table.get(ap_type)
+    if body is None:
+        raise HTTPException(status_code=400, detail=f'Invalid AP type {ap_type}')
+    return body
+
+
+def get_triads_body(value: str) -> bytes:
+    body = triads_table.get(normalize_triads_value(value))
+    if body is None:
+        # not in table, so most likely invalid
+        try:
+            body = render_json({'value': value.strip(), 'triads': get_triads(value.strip())})
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=e.args[0])
+    return body
+
+
+@app.get("/intertype/{ap_type1}/{ap_type2}")
+async def get_intertype_json(ap_type1: str, ap_type2: str):
+    return json_response(get_intertype_body(ap_type1, ap_type2))
+
+
+@app.get("/intertypes/{ap_type}")
+async def get_all_intertypes_json(ap_type: str):
+    return json_response(get_all_intertypes_body(ap_type))
+
+
+@app.get("/triads/{value:path}")  # path, since / is one of the separators of archetypes
+async def get_triads_json(value: str):
+    return json_response(get_triads_body(value))
+
+
+def get_shadow_body(ap_type: str, subtype: str) -> bytes:
+    ap_type = ap_type.strip().upper()
+    subtype = subtype.strip()
+    if ap_type not in ap_type_indices:
+        raise HTTPException(status_code=400, detail=f'Invalid AP type {ap_type}')
+    if subtype not in subtype_codes:
+        raise HTTPException(status_code=400, detail=f'Invalid subtype {subtype}')
+    return response_bodies.get('json', ap_type, subtype)
+
+
+def get_query_str(query: dict, name: str) -> str:
+    value = query.get(name)
+    if not isinstance(value, str):
+        raise HTTPException(status_code=400, detail=f'Expected string {name}')
+    return value
+
+
+# WebSocket query type -> function returning the same body as the GET route
+websocket_queries = {
+    'shadow': lambda query: get_shadow_body(get_query_str(query, 'ap_type'), get_query_str(query, 'subtype')),
+    'intertype': lambda query: get_intertype_body(get_query_str(query, 'ap_type1'), get_query_str(query, 'ap_type2')),
+    'intertypes': lambda query: get_all_intertypes_body(get_query_str(query, 'ap_type')),
+    'intertype_matrix': lambda query: intertype_matrix_table.get(None),
+    'triads': lambda query: get_triads_body(get_query_str(query, 'value')),
+}
+
+
+def get_websocket_response(message: str | bytes, client: str) -> str:
+    # Response to a WebSocket query message: {"id": id, "status": 200, "result": ...} with the same result as the GET
+    # route, or {"id": id, "status": 400, "detail": ...} (429 with retry_after seconds if rate limited).
+    request_id = None
     try:
-        result_dict = calculate_shadow_types(ap_type, subtype)
-        # Return as JSON response
-        return JSONResponse(content=result_dict)
-    except ValueError as e:
-        return HTTPException(status_code=400, detail=e.args[0])
+        try:
+            query = loads(message)
+        except (JSONDecodeError, UnicodeDecodeError, RecursionError):  # RecursionError for deeply nested arrays
+            raise HTTPException(status_code=400, detail='Message is not valid JSON') from None
+        if not isinstance(query, dict):
+            raise HTTPException(status_code=400, detail='Expected a JSON object')
+        request_id = query.get('id')
+        if request_id is not None and (not isinstance(request_id, (str, int)) or isinstance(request_id, bool)):
+            request_id = None
+            raise HTTPException(status_code=400, detail='Expected string or integer id')
+        retry_after = rate_limiter.acquire(client, WEBSOCKET_PATH)
+        if retry_after:
+            raise HTTPException(status_code=429, detail='Too many requests',
+                                headers={'Retry-After': str(max(1, ceil(retry_after)))})
+        query_type = query.get('type')
+        get_body = websocket_queries.get(query_type) if isinstance(query_type, str) else None
+        if get_body is None:
+            raise HTTPException(status_code=400, detail=f'Invalid type {query_type}, expected one of '
+                                                        f'{", ".join(websocket_queries)}')
+        body = get_body(query)
+    except HTTPException as e:
+        response = {'id': request_id, 'status': e.status_code, 'detail': e.detail}
+        if e.status_code == 429:
+            response['retry_after'] = int(e.headers['Retry-After'])
+        else:
+            metrics.add_validation_errors(WEBSOCKET_PATH)
+        return render_json(response).decode()
+    return f'{{"id":{render_json(request_id).decode()},"status":200,"result":{body.decode()}}}'
+
+
+@app.websocket(WEBSOCKET_PATH)
+async def shadow_websocket(websocket: WebSocket):
+    # Queries are answered in order on one connection, each with the id of its query. Lookups don't wait for
+    # anything, so there's nothing to gain from handling queries of a connection concurrently.
+    await websocket.accept()
+    client = rate_limiter.get_client(websocket.scope)
+    while True:
+        message = await websocket.receive()
+        if message['type'] == 'websocket.disconnect':
+            return
+        text = message.get('text')
+        if text is None:
+            text = message.get('bytes') or b''
+        if len(text) > MAX_WEBSOCKET_MESSAGE_SIZE:
+            await websocket.close(code=1009, reason=f'Message is longer than {MAX_WEBSOCKET_MESSAGE_SIZE}')
+            return
+        await websocket.send_text(get_websocket_response(text, client))
+
 
+@app.get("/metrics")
+async def get_metrics():
+    return Response(content=metrics.render(), media_type=METRICS_CONTENT_TYPE)
 
-@app.get("/shadow.html/{ap_type}/{subtype}")
-async def get_shadow_html(ap_type: str, subtype: str):
+
+def get_table_version_key() -> bytes:
+    # table files built by different code (or for a different ALGORITHM_VERSION) are stale
+    digest = hashlib.sha256(f'{ALGORITHM_VERSION}'.encode())
+    for module_name in TABLE_SOURCE_MODULES:
+        with open(sys.modules[module_name].__file__, 'rb') as f:
+            digest.update(f.read())
+    return digest.digest()
+
+
+json_tables = {
+    'intertype': intertype_table,
+    'intertypes': all_intertypes_table,
+    'intertype_matrix': intertype_matrix_table,
+    'triads': triads_table,
+}
+
+
+def build_table_file(path: str) -> None:
+    sections = response_bodies.pack()
+    for name, table in json_tables.items():
+        sections[name] = table.pack()
+    write_table_file(path, get_table_version_key(), sections)
+
+
+def load_table_file(path: str) -> bool:
+    # Use response bodies from a table file instead of building them. If the file is missing, invalid or stale,
+    # logs a warning and keeps building them in this process.
     try:
-        shadow_types = calculate_shadow_types(ap_type, subtype)
-
-        ap_type = shadow_types['ap_type']
-        subtype = shadow_types["subtype"]
-        results = [f'<h1>Shadow types for {ap_type} {subtype}:</h1><ol>']
-
-        for shadow_type_and_description in shadow_types['shadow_types']:
-            shadow_type = shadow_type_and_description['shadow_type']
-            description = shadow_type_and_description["description"]
-            results.append(f'<li>{shadow_type}: {description}</li>')
-        results.append('</ol>')
-
-        content = ''.join(results)
-        return HTMLResponse(content=content)
-    except ValueError as e:
-        return HTTPException(status_code=400, detail=e.args[0])
+        table_file = TableFile(path, get_table_version_key())
+        response_bodies.load(table_file)
+        for name, table in json_tables.items():
+            table.load(table_file.bodies(name))
+    except (OSError, ValueError) as e:
+        logger.warning(f'Not using table file: {e}')
+        warm_up.table_file_error = str(e)
+        return False
+    warm_up.table_file = path
+    return True
+
+
+class WarmUp:
+    # Builds every table and response body ahead of the first requests. Until it finishes, /readyz returns 503.
+    # Response bodies loaded from a table file don't need to be built.
+    def __init__(self):
+        self.ready = False
+        self.seconds: float | None = None
+        self.error: str | None = None
+        self.table_file: str | None = None
+        self.table_file_error: str | None = None
+
+    def run(self) -> None:
+        start = perf_counter()
+        try:
+            shadow_type_table.build()
+            calculate_shadow_types_batch(['VLEF'], ['0000'])  # builds the shadow code table and its row bytes
+            if self.table_file is None:
+                response_bodies.warm(compress=True)  # compressing also renders the uncompressed bodies
+                for table in json_tables.values():
+                    table.warm()
+        except Exception as e:
+            self.error = repr(e)
+            raise
+        self.seconds = perf_counter() - start
+        self.ready = True
+
+    def info(self) -> dict:
+        return {
+            'ready': self.ready,
+            'warm_up_seconds': self.seconds,
+            'error': self.error,
+            'table_file': self.table_file,
+            'table_file_error': self.table_file_error,
+            'tables': {
+                'shadow_types': len(shadow_type_table.results or ()),
+                'response_bodies': len(response_bodies.bodies),
+                'gzip_response_bodies': len(response_bodies.gzip_bodies),
+                'intertypes': len(intertype_table.bodies or ()),
+                'all_intertypes': len(all_intertypes_table.bodies or ()),
+                'intertype_matrix': len(intertype_matrix_table.bodies or ()),
+                'triads': len(triads_table.bodies or ()),
+            },
+        }
+
+
+warm_up = WarmUp()
+
+
+@app.get("/healthz")
+async def get_health():
+    # liveness: the process is serving requests, whether or not it is warm
+    return {'status': 'ok'}
+
+
+@app.get("/readyz")
+async def get_readiness():
+    # readiness: warm-up has finished, so requests won't wait for tables to be built
+    return JSONResponse(content=warm_up.info(), status_code=200 if warm_up.ready else 503)
@@ -0,0 +1,135 @@
+# Licensed under the Creative Commons BY license: https://creativecommons.org/licenses/by/4.0/
+
+# Audit of the shadow type algorithm over all 15,000 AP type and subtype pairs: how often each branch of ShadowTypes
+# is taken (from its trace events), histograms of the number of shadow types per pair and AP type, and for each
+# subtype, how many AP types have each shadow type.
+#
+# To print a summary and write the full report as JSON:
+#   python ap_shadow_type_audit.py [--output report.json] [--workers n]
+#
+# Each AP type is audited separately, in a process pool unless --workers is 1 or there is only 1 CPU, and the results
+# are merged.
+
+import argparse
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from json import dump
+
+from ap_core import ap_types, subtypes
+from ap_shadow_type_calculator import ShadowTypes, TraceEventKind, TracePhase
+
+
+class ShadowTypeAudit:
+    def __init__(self):
+        self.pairs = 0
+        self.events: Counter[tuple[TracePhase, TraceEventKind]] = Counter()  # (phase, event kind) -> events
+        # event kind -> pairs with at least 1 event of that kind
+        self.pairs_by_event: Counter[TraceEventKind] = Counter()
+        self.shadow_type_counts: Counter[int] = Counter()  # number of shadow types -> pairs
+        self.shadow_type_counts_by_ap_type: dict[str, Counter[int]] = {}
+        # subtype -> shadow type -> AP types producing it with that subtype
+        self.shadow_types_by_subtype: dict[str, Counter[str]] = {}
+
+    def audit(self, ap_type: str, subtype: str) -> None:
+        events = []
+        result = ShadowTypes(ap_type, subtype, trace=events.append)
+        shadow_types = [shadow_type for shadow_type, description in result.shadow_types.items()
+                        if not description.startswith('AP type')]
+
+        self.pairs += 1
+        if events:
+            kinds = set()
+            for event in events:
+                self.events[event.phase, event.kind] += 1
+                kinds.add(event.kind)
+            self.pairs_by_event.update(kinds)
+        self.shadow_type_counts[len(shadow_types)] += 1
+        self.shadow_type_counts_by_ap_type.setdefault(ap_type, Counter())[len(shadow_types)] += 1
+        self.shadow_types_by_subtype.setdefault(subtype, Counter()).update(shadow_types)
+
+    def merge(self, other: 'ShadowTypeAudit') -> None:
+        self.pairs += other.pairs
+        self.events.update(other.events)
+        self.pairs_by_event.update(other.pairs_by_event)
+        self.shadow_type_counts.update(other.shadow_type_counts)
+        for ap_type, counts in other.shadow_type_counts_by_ap_type.items():
+            self.shadow_type_counts_by_ap_type.setdefault(ap_type, Counter()).update(counts)
+        for subtype, shadow_types in other.shadow_types_by_subtype.items():
+            self.shadow_types_by_subtype.setdefault(subtype, Counter()).update(shadow_types)
+
+    def to_dict(self) -> dict:
+        def get_histogram(counts: Counter[int]) -> dict[str, int]:
+            return {str(count): counts[count] for count in sorted(counts)}
+
+        return {
+            'pairs': self.pairs,
+            'events': {kind.value: sum(self.events[(phase, kind)] for phase in TracePhase) for kind in TraceEventKind},
+            'events_by_phase': {phase.value: {kind.value: self.events[(phase, kind)] for kind in TraceEventKind}
+                                for phase in TracePhase},
+            'pairs_by_event': {kind.value: self.pairs_by_event[kind] for kind in TraceEventKind},
+            'shadow_type_counts': get_histogram(self.shadow_type_counts),
+            'shadow_type_counts_by_ap_type': {ap_type: get_histogram(counts) for ap_type, counts in
+                                              sorted(self.shadow_type_counts_by_ap_type.items())},
+            'shadow_types_by_subtype': {subtype: dict(sorted(shadow_types.items())) for subtype, shadow_types in
+                                        sorted(self.shadow_types_by_subtype.items())},
+        }
+
+
+# worker function, audits all subtypes of an AP type
+def audit_ap_type(ap_type: str) -> ShadowTypeAudit:
+    audit = ShadowTypeAudit()
+    for subtype in subtypes:
+        audit.audit(ap_type, subtype)
+    return audit
+
+
+def run_audit(workers: int | None = None) -> ShadowTypeAudit:
+    # workers defaults to the number of CPUs; with only 1, starting a process only adds to the run time
+    audit = ShadowTypeAudit()
+    if (workers or os.cpu_count() or 1) == 1:
+        for result in map(audit_ap_type, ap_types):
+            audit.merge(result)
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            for result in executor.map(audit_ap_type, ap_types):
+                audit.merge(result)
+    return audit
+
+
+def get_audit_summary(report: dict) -> str:
+    pairs = report['pairs']
+    results = [f'Shadow type audit of {pairs} AP type and subtype pairs', '', 'Events (pairs with event):']
+    for kind, count in report['events'].items():
+        results.append(f'- {kind}: {count} ({report["pairs_by_event"][kind]} pairs)')
+    results.append('')
+    results.append('Number of shadow types:')
+    for count, count_pairs in report['shadow_type_counts'].items():
+        results.append(f'- {count}: {count_pairs} pairs ({100 * count_pairs / pairs:.1f}%)')
+
+    subtype_counts = {subtype: sum(shadow_types.values())
+                      for subtype, shadow_types in report['shadow_types_by_subtype'].items()}
+    most = max(subtype_counts, key=subtype_counts.get)
+    fewest = min(subtype_counts, key=subtype_counts.get)
+    results.append('')
+    results.append(f'Most shadow types for all AP types: {most} ({subtype_counts[most]})')
+    results.append(f'Fewest shadow types for all AP types: {fewest} ({subtype_counts[fewest]})')
+    return '\n'.join(results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='ap_shadow_type_audit',
+        usage='Audit the shadow type algorithm over all AP types and subtypes',
+        add_help=True,  # add -h/--help option
+    )
+    parser.add_argument('-o', '--output', help='write the full report to this JSON file')
+    parser.add_argument('-w', '--workers', type=int,
+                        help='number of worker processes (default: number of CPUs)')
+    args = parser.parse_args()
+
+    audit_report = run_audit(args.workers).to_dict()
+    if args.output:
+        with open(args.output, 'w') as f:
+            dump(audit_report, f, indent=4)
+    print(get_audit_summary(audit_report))
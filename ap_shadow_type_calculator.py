@@ -4,10 +4,37 @@
 #   python ap_shadow_type_calculator.py
 # To run the script with arguments:
 #   python ap_shadow_type_calculator.py [AP type] [subtype]
+# To calculate shadow types for each "AP type subtype" line of standard input or a file:
+#   python ap_shadow_type_calculator.py --stream [--input file] [--json] [--workers n]
+# To list the AP type and subtype pairs that produce a shadow type:
+#   python ap_shadow_type_calculator.py --reverse [shadow type]
 
 import argparse
+import csv
 import sys
-from json import dumps
+from array import array
+from collections import OrderedDict
+from collections.abc import Callable
+from enum import Enum
+from functools import cached_property
+from itertools import accumulate, islice
+from json import dumps, loads
+from multiprocessing import Pool
+from operator import index
+from threading import Lock
+
+from ap_core import (AP_TYPE_COUNT, SUBTYPE_COUNT, ap_type_indices, ap_types, calculate_shadow_codes,
+                     get_shadow_code_table, subtype_codes, subtypes)
+from ap_shadow_type_index import find_shadow_type_sources, get_query_str
+
+try:
+    import numpy as np  # optional, only used by calculate_shadow_types_batch for NumPy input
+except ImportError:
+    np = None
+
+# Version of the shadow type algorithm's results, e.g. for cache keys and HTTP ETags.
+# Increase it whenever a change to ShadowTypes or its descriptions changes any result.
+ALGORITHM_VERSION = 1
 
 
 class SubType:
@@ -153,9 +180,68 @@ functions_by_pos = {
 }
 
 
+class TracePhase(Enum):
+    OBSCURED = 'obscured'  # swapping subtypes pointing to an obscured aspect first
+    METHOD = 'method'
+    SELF = 'self'
+    OTHERS = 'others'
+
+
+class TraceEventKind(Enum):
+    SWAPPED = 'swapped'
+    ALREADY_SWAPPED = 'already swapped'  # aspect already at target, e.g. 2-3 after 3-2
+    SKIPPED_ALREADY_SWAPPED = 'skipped already swapped'  # already swapped for an obscured subtype
+    SKIPPED_MULTIPLE_MATCHES = 'skipped multiple matches'  # more than one subtype points to an obscured aspect
+    SKIPPED_NO_MATCHES = 'skipped no matches'  # no subtype points to an obscured aspect
+
+
+class TraceEvent:
+    # Step of the shadow type algorithm, sent to the trace sink of ShadowTypes. Events are only created when a sink
+    # is attached, and are only formatted when converted to a string or dict.
+    __slots__ = ('phase', 'kind', 'subtype', 'obscured_subtype', 'shadow_type')
+
+    def __init__(self, phase: TracePhase, kind: TraceEventKind, subtype: SubType,
+                 obscured_subtype: SubType | None = None, shadow_type: str | None = None):
+        self.phase = phase
+        self.kind = kind
+        self.subtype = subtype  # the obscured subtype for SKIPPED_MULTIPLE_MATCHES and SKIPPED_NO_MATCHES
+        self.obscured_subtype = obscured_subtype
+        self.shadow_type = shadow_type
+
+    def __str__(self):
+        if self.kind == TraceEventKind.SWAPPED:
+            return f'Swapped {self.subtype} -> {self.shadow_type}'
+        elif self.kind == TraceEventKind.ALREADY_SWAPPED:
+            return f'Already swapped {self.subtype}'
+        elif self.kind == TraceEventKind.SKIPPED_ALREADY_SWAPPED:
+            return f'Skipped {self.subtype} - already swapped'
+        elif self.kind == TraceEventKind.SKIPPED_MULTIPLE_MATCHES:
+            return f'Skipped {self.subtype} - multiple matches'
+        else:
+            return f'Skipped {self.subtype} - no matches'
+
+    def to_dict(self) -> dict[str, str | None]:
+        return {
+            'phase': self.phase.value,
+            'event': self.kind.value,
+            'subtype': repr(self.subtype),
+            'obscured_subtype': repr(self.obscured_subtype) if self.obscured_subtype else None,
+            'shadow_type': self.shadow_type,
+            'message': str(self),
+        }
+
+
+def print_trace_event(event: TraceEvent) -> None:
+    print(event)
+
+
 class ShadowTypes:
-    def __init__(self, ap_type_str: str, subtype_str: str, verbose: bool = False):
+    # trace is an optional sink called with a TraceEvent for each step; verbose prints each step
+    def __init__(self, ap_type_str: str, subtype_str: str, verbose: bool = False,
+                 trace: Callable[[TraceEvent], None] | None = None):
         self.verbose = verbose
+        self.trace = trace if trace is not None else print_trace_event if verbose else None
+        self.phase = TracePhase.OBSCURED
         self.ap_type_str = ap_type_str.strip().upper()
         self.subtype_str = subtype_str.strip()
 
@@ -180,18 +266,24 @@ class ShadowTypes:
                 self.swap_obscured_shadow_type(subtype)
 
         # swap method subtypes
+        self.phase = TracePhase.METHOD
         self.swap_shadow_type(2, 3)  # 2-3 or 3-2
         self.swap_shadow_type(1, 4)  # 1-4 or 4-1
 
         # swap self subtypes
+        self.phase = TracePhase.SELF
         self.swap_shadow_type(1, 2)  # 1-2 or 2-1
         self.swap_shadow_type(3, 4)  # 3-4 or 4-3
 
         # swap others subtypes
+        self.phase = TracePhase.OTHERS
         self.swap_shadow_type(1, 3)  # 1-3 or 3-1
         self.swap_shadow_type(2, 4)  # 2-4 or 4-2
 
-        self.functions: list[str] = list(self.calculate_functions())
+    @cached_property
+    def functions(self) -> list[str]:
+        # only depend on the AP type, and aren't needed to calculate shadow types (e.g. in ap_shadow_type_audit)
+        return list(self.calculate_functions())
 
     def calculate_functions(self):
         for pos1 in range(1, 4):
@@ -204,16 +296,13 @@ class ShadowTypes:
                 pos_text = f'{pos} - {functions_by_pos[pos]}'
                 yield f'{pos_text} - {block_description}'
 
-    def debug(self, s: str) -> None:
-        if self.verbose:
-            print(s)
-
     def description(self) -> str:
         return f'{self.ap_type_str} {self.subtype_str}'
 
     def swap(self, subtype: SubType, obscured_subtype: SubType = None) -> None:
         if subtype in self.swapped_to_obscured:
-            self.debug(f'Skipped {subtype} - already swapped')
+            if self.trace is not None:
+                self.trace(TraceEvent(self.phase, TraceEventKind.SKIPPED_ALREADY_SWAPPED, subtype))
             return
 
         pos1 = self.last_shadow_type.index(subtype.aspect) + 1  # position currently containing aspect
@@ -222,13 +311,16 @@ class ShadowTypes:
         if pos1 == pos2:
             # subtypes in the same pair, e.g. 2-3 or 3-2, ignore
             shadow_type_str = ''.join(self.last_shadow_type)
-            self.debug(f'Already swapped {subtype}')
+            if self.trace is not None:
+                self.trace(TraceEvent(self.phase, TraceEventKind.ALREADY_SWAPPED, subtype, obscured_subtype,
+                                      shadow_type_str))
             self.shadow_types[shadow_type_str] = f'{self.shadow_types[shadow_type_str]} and {subtype}'
         else:
             self.last_shadow_type[pos1 - 1], self.last_shadow_type[pos2 - 1] = self.last_shadow_type[pos2 - 1], \
                 self.last_shadow_type[pos1 - 1]
             shadow_type_str = ''.join(self.last_shadow_type)
-            self.debug(f'Swapped {subtype} -> {shadow_type_str}')
+            if self.trace is not None:
+                self.trace(TraceEvent(self.phase, TraceEventKind.SWAPPED, subtype, obscured_subtype, shadow_type_str))
             if obscured_subtype:
                 self.shadow_types[shadow_type_str] = f'Swapped {subtype} for {obscured_subtype}'
             else:
@@ -240,14 +332,16 @@ class ShadowTypes:
             if other_subtype.target_pos == obscured_subtype.source_pos:  # obscured
                 if swap_subtype:
                     # multiple matches, do not swap
-                    self.debug(f'Skipped {obscured_subtype} - multiple matches')
+                    if self.trace is not None:
+                        self.trace(TraceEvent(self.phase, TraceEventKind.SKIPPED_MULTIPLE_MATCHES, obscured_subtype))
                     return
                 swap_subtype = other_subtype
         if swap_subtype is not None:
             self.swap(swap_subtype, obscured_subtype)
             self.swapped_to_obscured.add(swap_subtype)
         else:
-            self.debug(f'Skipped {obscured_subtype} - no matches')
+            if self.trace is not None:
+                self.trace(TraceEvent(self.phase, TraceEventKind.SKIPPED_NO_MATCHES, obscured_subtype))
 
     def swap_shadow_type(self, pos1: int, pos2: int):
         for subtype in self.subtypes:
@@ -280,24 +374,21 @@ def input_subtype() -> str:
 
 
 def validate_ap_type(ap_type_str: str) -> None:
-    if len(ap_type_str) != 4 or sorted(ap_type_str.upper()) != ['E', 'F', 'L', 'V']:
+    if ap_type_str.upper() not in ap_type_indices:
         raise ValueError(f'Invalid AP type {ap_type_str}')
 
 
 def validate_subtype(subtype_str: str) -> None:
-    if len(subtype_str) != 4 or not all(map(lambda c: '0' <= c <= '4', subtype_str)):
+    if subtype_str not in subtype_codes:
         raise ValueError(f'Invalid subtype {subtype_str}')
 
 
-def calculate_shadow_types(ap_type_str: str, subtype_str: str, verbose: bool = False) -> dict[str, str]:
-    shadow_types = ShadowTypes(ap_type_str, subtype_str, verbose)
-    shadow_type_dict = shadow_types.shadow_types
-
+def shadow_types_to_dict(shadow_types: ShadowTypes) -> dict[str, str]:
     shadow_types_with_descriptions = [
         {
             'shadow_type': shadow_type,
             'description': description,
-        } for shadow_type, description in shadow_type_dict.items()
+        } for shadow_type, description in shadow_types.shadow_types.items()
     ]
     return {
         'ap_type': shadow_types.ap_type_str,  # normalized
@@ -307,11 +398,191 @@ def calculate_shadow_types(ap_type_str: str, subtype_str: str, verbose: bool = F
     }
 
 
-def get_shadow_types_str(ap_type_str: str, subtype_str: str, verbose: bool = False, json: bool = False) -> str:
-    shadow_types = calculate_shadow_types(ap_type_str, subtype_str, verbose)
+class ShadowTypeTable:
+    # Lookup table with the shadow types of every (AP type, subtype) pair (24 x 625 = 15,000 entries).
+    # The table is built on first use with calculate_shadow_codes (the integer implementation of the algorithm in
+    # ShadowTypes), after which calculate_shadow_types is a dictionary lookup instead of a full calculation.
+    def __init__(self):
+        # (AP type, subtype) -> (shadow types and descriptions, functions), both as tuples so they can be shared
+        self.results: dict[tuple[str, str], tuple[tuple[tuple[str, str], ...], tuple[str, ...]]] | None = None
+
+    def build(self) -> None:
+        if self.results is not None:
+            return
+        results = {}
+        for ap_type_index, ap_type in enumerate(ap_types):
+            functions = tuple(ShadowTypes(ap_type, '0000').functions)
+            for subtype_code, subtype in enumerate(subtypes):
+                shadow_types = tuple((ap_types[shadow_type], description) for shadow_type, description, _ in
+                                     calculate_shadow_codes(ap_type_index, subtype_code))
+                results[(ap_type, subtype)] = (shadow_types, functions)
+        self.results = results
+
+    def lookup(self, ap_type_str: str, subtype_str: str) -> dict[str, str]:
+        if self.results is None:
+            self.build()
+        ap_type_str = ap_type_str.strip().upper()
+        subtype_str = subtype_str.strip()
+        result = self.results.get((ap_type_str, subtype_str))
+        if result is None:
+            # not in table, so at least one is invalid
+            validate_ap_type(ap_type_str)
+            validate_subtype(subtype_str)
+        shadow_types, functions = result
+        # build a new dict for each call, since callers may modify it
+        return {
+            'ap_type': ap_type_str,
+            'subtype': subtype_str,
+            'shadow_types': [
+                {
+                    'shadow_type': shadow_type,
+                    'description': description,
+                } for shadow_type, description in shadow_types
+            ],
+            'functions': list(functions)
+        }
+
+
+shadow_type_table = ShadowTypeTable()
+
+
+def calculate_shadow_types(ap_type_str: str, subtype_str: str, verbose: bool = False,
+                           use_table: bool = True, explain: bool = False) -> dict[str, str]:
+    if use_table and not verbose and not explain:
+        return shadow_type_table.lookup(ap_type_str, subtype_str)
+
+    # reference algorithm, also used for verbose and explain output since the table doesn't trace anything
+    events: list[TraceEvent] = []
+
+    def explain_trace(event: TraceEvent) -> None:
+        if verbose:
+            print_trace_event(event)
+        events.append(event)
+
+    result = shadow_types_to_dict(ShadowTypes(ap_type_str, subtype_str, verbose, explain_trace if explain else None))
+    if explain:
+        result['trace'] = [event.to_dict() for event in events]
+    return result
+
+
+class ShadowTypesBatch:
+    # Columnar results of calculate_shadow_types_batch. Input i has counts[i] results (the AP type followed by its
+    # shadow types, as in calculate_shadow_types), stored at offsets[i]:offsets[i + 1] in the flat columns:
+    # - shadow_types: AP type indices (see ap_core.ap_types)
+    # - descriptions: indices into description_strings
+    # - description_flags: ap_core.DESCRIPTION_* flags
+    # Columns are NumPy arrays for NumPy input and array.array otherwise.
+    def __init__(self, counts, offsets, shadow_types, descriptions, description_flags,
+                 description_strings: list[str]):
+        self.counts = counts
+        self.offsets = offsets
+        self.shadow_types = shadow_types
+        self.descriptions = descriptions
+        self.description_flags = description_flags
+        self.description_strings = description_strings
+
+    def __len__(self):
+        return len(self.counts)
+
+    # (shadow type, description) strings for input i, in the same order as calculate_shadow_types
+    def get(self, i: int) -> list[tuple[str, str]]:
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return [(ap_types[self.shadow_types[j]], self.description_strings[self.descriptions[j]])
+                for j in range(start, end)]
+
+
+def _encode_batch(values, codes: dict[str, int], count: int, name: str, normalize) -> array:
+    try:
+        # fast path for already normalized strings
+        return array('H', map(codes.__getitem__, values))
+    except (KeyError, TypeError):
+        pass
+    encoded = array('H')
+    for value in values:
+        if isinstance(value, str):
+            code = codes.get(normalize(value))
+            if code is None:
+                raise ValueError(f'Invalid {name} {value}')
+        else:
+            # integers only (including NumPy integers), not bools, floats or None
+            try:
+                code = None if isinstance(value, bool) else index(value)
+            except TypeError:
+                code = None
+            if code is None or not 0 <= code < count:
+                raise ValueError(f'Invalid {name} code {value!r}')
+        encoded.append(code)
+    return encoded
+
+
+def calculate_shadow_types_batch(ap_type_values, subtype_values) -> ShadowTypesBatch:
+    # ap_type_values and subtype_values are equal length sequences of strings (e.g. 'VLEF' and '1204') or
+    # encoded values (AP type indices and subtype codes, see ap_core), or NumPy arrays of encoded values.
+    if len(ap_type_values) != len(subtype_values):
+        raise ValueError(f'{len(ap_type_values)} AP types and {len(subtype_values)} subtypes')
+    table = get_shadow_code_table()
+
+    if (np is not None and isinstance(ap_type_values, np.ndarray) and isinstance(subtype_values, np.ndarray)
+            and np.issubdtype(ap_type_values.dtype, np.integer) and np.issubdtype(subtype_values.dtype, np.integer)):
+        return _calculate_shadow_types_batch_numpy(table, ap_type_values, subtype_values)
+
+    ap_type_codes = _encode_batch(ap_type_values, ap_type_indices, AP_TYPE_COUNT, 'AP type',
+                                  lambda value: value.strip().upper())
+    subtype_codes_ = _encode_batch(subtype_values, subtype_codes, SUBTYPE_COUNT, 'subtype', str.strip)
+
+    # gather the raw bytes of each row's columns and join them, to avoid per-value Python objects
+    rows = [ap_type_code * SUBTYPE_COUNT + subtype_code
+            for ap_type_code, subtype_code in zip(ap_type_codes, subtype_codes_)]
+    row_bytes = _get_row_bytes(table)
+    counts = array('B', map(table.counts.__getitem__, rows))
+    offsets = array('I', [0])
+    offsets.extend(accumulate(counts))
+    shadow_types = array('B', b''.join(map(row_bytes[0].__getitem__, rows)))
+    descriptions = array('H')
+    descriptions.frombytes(b''.join(map(row_bytes[1].__getitem__, rows)))
+    description_flags = array('B', b''.join(map(row_bytes[2].__getitem__, rows)))
+    return ShadowTypesBatch(counts, offsets, shadow_types, descriptions, description_flags,
+                            table.description_strings)
+
+
+_row_bytes: tuple[list[bytes], list[bytes], list[bytes]] | None = None
+
+
+# shadow types, descriptions and description flags of each table row as bytes
+def _get_row_bytes(table) -> tuple[list[bytes], list[bytes], list[bytes]]:
+    global _row_bytes
+    if _row_bytes is None:
+        offsets = table.offsets
+        _row_bytes = tuple([column[offsets[row]:offsets[row + 1]].tobytes() for row in range(len(table.counts))]
+                           for column in (table.shadow_types, table.descriptions, table.description_flags))
+    return _row_bytes
+
+
+def _calculate_shadow_types_batch_numpy(table, ap_type_codes, subtype_codes_) -> ShadowTypesBatch:
+    if ap_type_codes.size and (ap_type_codes.min() < 0 or ap_type_codes.max() >= AP_TYPE_COUNT):
+        raise ValueError('Invalid AP type code')
+    if subtype_codes_.size and (subtype_codes_.min() < 0 or subtype_codes_.max() >= SUBTYPE_COUNT):
+        raise ValueError('Invalid subtype code')
+
+    rows = ap_type_codes.astype(np.intp) * SUBTYPE_COUNT + subtype_codes_.astype(np.intp)
+    table_offsets = np.frombuffer(table.offsets, dtype=np.uint32).astype(np.intp)
+    starts = table_offsets[rows]
+    counts = np.frombuffer(table.counts, dtype=np.uint8)[rows]
+    offsets = np.zeros(len(rows) + 1, dtype=np.intp)
+    np.cumsum(counts, out=offsets[1:])
+
+    # index into the flat table columns for every result: start of its row plus its position within the row
+    indices = np.repeat(starts - offsets[:-1], counts) + np.arange(offsets[-1])
+    return ShadowTypesBatch(counts, offsets,
+                            np.frombuffer(table.shadow_types, dtype=np.uint8)[indices],
+                            np.frombuffer(table.descriptions, dtype=np.uint16)[indices],
+                            np.frombuffer(table.description_flags, dtype=np.uint8)[indices],
+                            table.description_strings)
+
+
+def format_shadow_types(shadow_types: dict[str, str], json: bool = False) -> str:
     if json:
-        my_dict = calculate_shadow_types(ap_type_str, subtype_str, verbose)
-        return dumps(my_dict, indent=4)
+        return dumps(shadow_types, indent=4)
     else:
         ap_type = shadow_types['ap_type']
         subtype = shadow_types['subtype']
@@ -330,9 +601,93 @@ def get_shadow_types_str(ap_type_str: str, subtype_str: str, verbose: bool = Fal
         for i, dichotomy in enumerate(shadow_types['functions']):
             results.append(f'{i + 1}. {dichotomy}')
 
+        if 'trace' in shadow_types:
+            results.append(f'\nSteps for {ap_type} {subtype}:')
+            for event in shadow_types['trace']:
+                results.append(f'- {event["message"]} ({event["phase"]} phase)')
+
         return '\n'.join(results)
 
 
+class RenderCache:
+    # Bounded LRU cache of get_shadow_types_str output, keyed by normalized (AP type, subtype, json).
+    # Each entry holds the rendered string and, once requested, its UTF-8 encoding for servers.
+    # Invalid input raises ValueError and is not cached.
+    def __init__(self, maxsize: int = 2 * AP_TYPE_COUNT * SUBTYPE_COUNT):  # default fits text and JSON for all
+        self.maxsize = maxsize
+        self.entries: OrderedDict[tuple[str, str, bool], list[str | bytes | None]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def _get_entry(self, ap_type_str: str, subtype_str: str, json: bool) -> list[str | bytes | None]:
+        key = (ap_type_str.strip().upper(), subtype_str.strip(), json)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return entry
+            self.misses += 1
+
+        entry = [format_shadow_types(calculate_shadow_types(key[0], key[1]), json), None]
+        with self.lock:
+            self.entries[key] = entry
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return entry
+
+    def get_str(self, ap_type_str: str, subtype_str: str, json: bool = False) -> str:
+        return self._get_entry(ap_type_str, subtype_str, json)[0]
+
+    def get_bytes(self, ap_type_str: str, subtype_str: str, json: bool = False) -> bytes:
+        entry = self._get_entry(ap_type_str, subtype_str, json)
+        if entry[1] is None:
+            entry[1] = entry[0].encode()
+        return entry[1]
+
+    # render (and optionally encode) every AP type and subtype ahead of time
+    def warm(self, text: bool = True, json: bool = True, encode: bool = False) -> None:
+        formats = [json_format for json_format, enabled in ((False, text), (True, json)) if enabled]
+        for ap_type in ap_types:
+            for subtype in subtypes:
+                for json_format in formats:
+                    if encode:
+                        self.get_bytes(ap_type, subtype, json_format)
+                    else:
+                        self.get_str(ap_type, subtype, json_format)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> dict[str, int | float]:
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / requests if requests else 0.0,
+            'size': len(self.entries),
+            'maxsize': self.maxsize,
+        }
+
+
+render_cache = RenderCache()
+
+
+def get_shadow_types_str(ap_type_str: str, subtype_str: str, verbose: bool = False, json: bool = False,
+                         use_table: bool = True, explain: bool = False) -> str:
+    if use_table and not verbose and not explain:
+        return render_cache.get_str(ap_type_str, subtype_str, json)
+    return format_shadow_types(calculate_shadow_types(ap_type_str, subtype_str, verbose, use_table, explain), json)
+
+
+def get_shadow_types_bytes(ap_type_str: str, subtype_str: str, json: bool = False) -> bytes:
+    return render_cache.get_bytes(ap_type_str, subtype_str, json)
+
+
 def run_interactive() -> None:
     ap_type_str = input_ap_type()
     subtype_str = input_subtype()
@@ -340,14 +695,70 @@ def run_interactive() -> None:
     print()
 
 
-def run_with_args(ap_type_str: str, subtype_str: str, verbose: bool = False, json: bool = False) -> None:
+def run_with_args(ap_type_str: str, subtype_str: str, verbose: bool = False, json: bool = False,
+                  use_table: bool = True, explain: bool = False) -> None:
     try:
-        print(get_shadow_types_str(ap_type_str, subtype_str, verbose, json))
+        print(get_shadow_types_str(ap_type_str, subtype_str, verbose, json, use_table, explain))
     except ValueError as e:
         sys.stderr.write(f'{e.args[0]}\n')
         exit(1)
 
 
+def parse_stream_line(line: str) -> tuple[str, str]:
+    # supported formats: "VLEF 1204", "VLEF,1204", {"ap_type": "VLEF", "subtype": "1204"} or ["VLEF", "1204"]
+    line = line.strip()
+    if line.startswith(('{', '[')):
+        try:
+            values = loads(line)
+        except RecursionError:
+            raise ValueError(f'JSON nested too deeply: {line[:20]}...') from None
+        if isinstance(values, dict):
+            values = [values.get('ap_type'), values.get('subtype')]
+    elif ',' in line:
+        values = next(csv.reader([line]))
+    else:
+        values = line.split()
+    if len(values) != 2 or not all(isinstance(value, str) for value in values):
+        raise ValueError(f'Expected AP type and subtype: {line}')
+    return values[0], values[1]
+
+
+def get_stream_result(line_number: int, line: str, json: bool = False) -> str:
+    # each result ends with a newline, so results can be written as they are
+    try:
+        ap_type_str, subtype_str = parse_stream_line(line)
+        if json:
+            return dumps(calculate_shadow_types(ap_type_str, subtype_str)) + '\n'
+        return get_shadow_types_str(ap_type_str, subtype_str) + '\n'
+    except ValueError as e:  # includes JSONDecodeError
+        if json:
+            return dumps({'line': line_number, 'input': line.strip(), 'error': e.args[0]}) + '\n'
+        return f'Line {line_number}: {e.args[0]}\n'
+
+
+# worker function for run_stream, returns results for a chunk of (line number, line)
+def get_stream_results(lines: list[tuple[int, str]], json: bool = False) -> list[str]:
+    return [get_stream_result(line_number, line, json) for line_number, line in lines]
+
+
+def run_stream(input_file, json: bool = False, workers: int = 1, chunk_size: int = 1000) -> None:
+    # one result per non-blank input line, written as soon as it is calculated, so memory use is bounded by
+    # chunk_size * workers lines regardless of the size of the input
+    lines = ((line_number, line) for line_number, line in enumerate(input_file, 1) if line.strip())
+    if workers <= 1:
+        for line_number, line in lines:
+            sys.stdout.write(get_stream_result(line_number, line, json))
+        return
+
+    with Pool(workers) as pool:
+        while True:
+            chunks = [chunk for chunk in (list(islice(lines, chunk_size)) for _ in range(workers)) if chunk]
+            if not chunks:
+                break
+            for results in pool.starmap(get_stream_results, [(chunk, json) for chunk in chunks]):
+                sys.stdout.writelines(results)
+
+
 if __name__ == '__main__':
     if len(sys.argv) == 1:
         # interactive mode, ask user for AP type and subtype, repeating until q is entered
@@ -359,9 +770,39 @@ if __name__ == '__main__':
             usage='Calculate AP shadow types (no arguments to run interactively)',
             add_help=True,  # add -h/--help option
         )
-        parser.add_argument('ap_type', help='AP type (any permutation of FLEV)')
-        parser.add_argument('subtype', help='AP subtype (4 digits between 0 and 4, inclusive)')
+        parser.add_argument('ap_type', nargs='?', help='AP type (any permutation of FLEV)')
+        parser.add_argument('subtype', nargs='?', help='AP subtype (4 digits between 0 and 4, inclusive)')
         parser.add_argument('-j', '--json', action='store_true', help='return answer in JSON format')
         parser.add_argument('-v', '--verbose', action='store_true', help='print verbose messages')
+        parser.add_argument('-e', '--explain', action='store_true',
+                            help='include the steps of the calculation in the answer')
+        parser.add_argument('--no-table', action='store_true',
+                            help='calculate shadow types directly instead of using the lookup table')
+        parser.add_argument('-r', '--reverse', metavar='SHADOW_TYPE',
+                            help='list AP type and subtype pairs that produce the shadow type '
+                                 '(see ap_shadow_type_index.py for compound queries)')
+        parser.add_argument('-s', '--stream', action='store_true',
+                            help='read AP type and subtype pairs (space separated, CSV or JSON), one per line, '
+                                 'and write one result per line')
+        parser.add_argument('-i', '--input', help='input file for --stream (default: standard input)')
+        parser.add_argument('-w', '--workers', type=int, default=1,
+                            help='number of worker processes for --stream (default: 1)')
         args = parser.parse_args()
-        run_with_args(args.ap_type, args.subtype, args.verbose, args.json)
+        if args.reverse:
+            try:
+                print(get_query_str(find_shadow_type_sources(args.reverse), args.json))
+            except ValueError as e:
+                sys.stderr.write(f'{e.args[0]}\n')
+                exit(1)
+        elif args.stream:
+            if args.explain or args.no_table:
+                parser.error('--explain and --no-table are not supported with --stream')
+            if args.input:
+                with open(args.input) as input_file:
+                    run_stream(input_file, args.json, args.workers)
+            else:
+                run_stream(sys.stdin, args.json, args.workers)
+        elif args.ap_type is None or args.subtype is None:
+            parser.error('AP type and subtype are required unless --stream is used')
+        else:
+            run_with_args(args.ap_type, args.subtype, args.verbose, args.json, not args.no_table, args.explain)
@@ -0,0 +1,166 @@
+# Licensed under the Creative Commons BY license: https://creativecommons.org/licenses/by/4.0/
+
+# Reverse index of shadow types: which (AP type, subtype) pairs produce a given shadow type.
+#
+# To list the pairs producing a shadow type:
+#   python ap_shadow_type_index.py [shadow type] [--description text] [--kind kind]
+# Compound queries:
+#   python ap_shadow_type_index.py --has VLEF --has-not FELV --min-count 3
+#
+# Pairs are stored as rows (ap_type_index * SUBTYPE_COUNT + subtype_code, see ap_core), and each index entry is a
+# set of rows stored as the bits of an int, so compound queries are a few bitwise operations on 15,000-bit ints.
+
+import argparse
+import sys
+from json import dumps
+
+from ap_core import (ALL_ROWS, AP_TYPE_COUNT, ROW_COUNT, DESCRIPTION_AP_TYPE, description_flag_names, encode_ap_type,
+                     get_pair, get_rows, get_shadow_code_table)
+
+description_flags_by_name: dict[str, int] = {name: flag for flag, name in description_flag_names.items()}
+
+
+class ShadowTypeIndex:
+    def __init__(self):
+        table = get_shadow_code_table()
+
+        # shadow type index -> rows with that shadow type (not counting the AP type itself)
+        self.rows_by_shadow_type: list[int] = [0] * AP_TYPE_COUNT
+        # shadow type index -> description index -> rows, for description filters
+        self.rows_by_description: list[dict[int, int]] = [{} for _ in range(AP_TYPE_COUNT)]
+        # (shadow type index, description flag) -> rows, for kind filters
+        self.rows_by_flag: dict[tuple[int, int], int] = {}
+        # number of shadow types -> rows
+        self.rows_by_count: dict[int, int] = {}
+        self.description_strings = table.description_strings
+
+        for row in range(ROW_COUNT):
+            row_bit = 1 << row
+            count = 0
+            for i in range(table.offsets[row], table.offsets[row + 1]):
+                flags = table.description_flags[i]
+                if flags & DESCRIPTION_AP_TYPE:
+                    continue
+                count += 1
+                shadow_type = table.shadow_types[i]
+                self.rows_by_shadow_type[shadow_type] |= row_bit
+                rows_by_description = self.rows_by_description[shadow_type]
+                description = table.descriptions[i]
+                rows_by_description[description] = rows_by_description.get(description, 0) | row_bit
+                for flag in description_flag_names:
+                    if flags & flag:
+                        key = (shadow_type, flag)
+                        self.rows_by_flag[key] = self.rows_by_flag.get(key, 0) | row_bit
+            self.rows_by_count[count] = self.rows_by_count.get(count, 0) | row_bit
+
+    # rows producing shadow type, optionally only if its description contains description and has all flags
+    def rows_with(self, shadow_type_str: str, description: str | None = None, flags: int = 0) -> int:
+        shadow_type = encode_ap_type(shadow_type_str.strip())
+        rows = self.rows_by_shadow_type[shadow_type]
+        if description is not None:
+            description_rows = 0
+            for i, bits in self.rows_by_description[shadow_type].items():
+                if description in self.description_strings[i]:
+                    description_rows |= bits
+            rows &= description_rows
+        for flag in description_flag_names:
+            if flags & flag:
+                rows &= self.rows_by_flag.get((shadow_type, flag), 0)
+        return rows
+
+    def rows_with_count(self, min_count: int | None = None, max_count: int | None = None) -> int:
+        rows = 0
+        for count, bits in self.rows_by_count.items():
+            if (min_count is None or count >= min_count) and (max_count is None or count <= max_count):
+                rows |= bits
+        return rows
+
+    # rows matching all conditions; description and flags apply to the shadow types in has
+    def query_rows(self, has: list[str] = (), has_not: list[str] = (), min_count: int | None = None,
+                   max_count: int | None = None, description: str | None = None, flags: int = 0) -> int:
+        rows = ALL_ROWS
+        for shadow_type_str in has:
+            rows &= self.rows_with(shadow_type_str, description, flags)
+        for shadow_type_str in has_not:
+            rows &= ~self.rows_with(shadow_type_str)
+        if min_count is not None or max_count is not None:
+            rows &= self.rows_with_count(min_count, max_count)
+        return rows
+
+    def query(self, has: list[str] = (), has_not: list[str] = (), min_count: int | None = None,
+              max_count: int | None = None, description: str | None = None, flags: int = 0) -> list[tuple[str, str]]:
+        rows = self.query_rows(has, has_not, min_count, max_count, description, flags)
+        return [get_pair(row) for row in get_rows(rows)]
+
+    def count(self, has: list[str] = (), has_not: list[str] = (), min_count: int | None = None,
+              max_count: int | None = None, description: str | None = None, flags: int = 0) -> int:
+        return self.query_rows(has, has_not, min_count, max_count, description, flags).bit_count()
+
+
+_shadow_type_index: ShadowTypeIndex | None = None
+
+
+def get_shadow_type_index() -> ShadowTypeIndex:
+    global _shadow_type_index
+    if _shadow_type_index is None:
+        _shadow_type_index = ShadowTypeIndex()
+    return _shadow_type_index
+
+
+# (AP type, subtype) pairs that produce shadow type, e.g. find_shadow_type_sources('VLEF', 'Swapped 2L-3')
+def find_shadow_type_sources(shadow_type_str: str, description: str | None = None,
+                             kinds: list[str] = ()) -> list[tuple[str, str]]:
+    return get_shadow_type_index().query([shadow_type_str], description=description, flags=get_kind_flags(kinds))
+
+
+def get_kind_flags(kinds: list[str]) -> int:
+    flags = 0
+    for kind in kinds:
+        if kind not in description_flags_by_name:
+            raise ValueError(f'Invalid kind {kind}, expected one of {", ".join(description_flags_by_name)}')
+        flags |= description_flags_by_name[kind]
+    return flags
+
+
+def get_query_str(pairs: list[tuple[str, str]], json: bool = False) -> str:
+    if json:
+        return dumps([{'ap_type': ap_type, 'subtype': subtype} for ap_type, subtype in pairs], indent=4)
+    results = [f'{ap_type} {subtype}' for ap_type, subtype in pairs]
+    results.append(f'{len(pairs)} matching AP type and subtype pairs')
+    return '\n'.join(results)
+
+
+def add_query_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--has', action='append', default=[], help='shadow type that must be produced (repeatable)')
+    parser.add_argument('--has-not', action='append', default=[],
+                        help='shadow type that must not be produced (repeatable)')
+    parser.add_argument('--min-count', type=int, help='minimum number of shadow types')
+    parser.add_argument('--max-count', type=int, help='maximum number of shadow types')
+    parser.add_argument('-d', '--description', help='text the description of the --has shadow types must contain')
+    parser.add_argument('-k', '--kind', action='append', default=[],
+                        help=f'kind of the --has shadow types (repeatable): {", ".join(description_flags_by_name)}')
+
+
+def run_query(args, json: bool = False) -> None:
+    try:
+        pairs = get_shadow_type_index().query(args.has, args.has_not, args.min_count, args.max_count,
+                                              args.description, get_kind_flags(args.kind))
+        print(get_query_str(pairs, json))
+    except ValueError as e:
+        sys.stderr.write(f'{e.args[0]}\n')
+        exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='ap_shadow_type_index',
+        usage='List AP type and subtype pairs that produce shadow types',
+        add_help=True,  # add -h/--help option
+    )
+    parser.add_argument('shadow_type', nargs='?', help='shadow type (same as --has)')
+    add_query_arguments(parser)
+    parser.add_argument('-j', '--json', action='store_true', help='return answer in JSON format')
+    args = parser.parse_args()
+    if args.shadow_type:
+        args.has.insert(0, args.shadow_type)
+    run_query(args, args.json)
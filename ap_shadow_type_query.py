@@ -0,0 +1,121 @@
+# Licensed under the Creative Commons BY license: https://creativecommons.org/licenses/by/4.0/
+
+# Shadow type statistics for every AP type and subtype matching wildcard patterns.
+#
+# Patterns use shell-style wildcards: ? for any character, * for any characters, and [...] for a set or range of
+# characters, e.g. 1?34, [0-2]2*4 or 1* for subtypes and V* or ?L?? for AP types.
+#
+# To show statistics for all matching pairs:
+#   python ap_shadow_type_query.py [AP type pattern] [subtype pattern] [--json]
+
+import argparse
+import sys
+from collections import Counter
+from collections.abc import Iterator
+from fnmatch import fnmatchcase
+from json import dumps
+
+from ap_core import (SUBTYPE_COUNT, DESCRIPTION_AP_TYPE, ap_types, description_flag_names, get_shadow_code_table,
+                     subtypes)
+
+
+def expand_ap_types(pattern: str) -> list[int]:
+    pattern = pattern.strip().upper()
+    ap_type_indices = [i for i, ap_type in enumerate(ap_types) if fnmatchcase(ap_type, pattern)]
+    if not ap_type_indices:
+        raise ValueError(f'No AP types match {pattern}')
+    return ap_type_indices
+
+
+def expand_subtypes(pattern: str) -> list[int]:
+    pattern = pattern.strip()
+    subtype_codes = [code for code, subtype in enumerate(subtypes) if fnmatchcase(subtype, pattern)]
+    if not subtype_codes:
+        raise ValueError(f'No subtypes match {pattern}')
+    return subtype_codes
+
+
+# rows (ap_type_index * SUBTYPE_COUNT + subtype_code, see ap_core) matching the patterns, generated one at a time
+def expand_query(ap_type_pattern: str, subtype_pattern: str) -> Iterator[int]:
+    subtype_codes = expand_subtypes(subtype_pattern)
+    for ap_type_index in expand_ap_types(ap_type_pattern):
+        for subtype_code in subtype_codes:
+            yield ap_type_index * SUBTYPE_COUNT + subtype_code
+
+
+class ShadowTypeStats:
+    # aggregated shadow types of many (AP type, subtype) pairs, not counting the AP types themselves
+    def __init__(self):
+        self.pairs = 0
+        self.shadow_type_counts: Counter[str] = Counter()  # shadow type -> pairs producing it
+        self.description_counts: Counter[str] = Counter()  # description flag name -> shadow types with the flag
+        self.count_distribution: Counter[int] = Counter()  # number of shadow types -> pairs
+
+    def add_rows(self, rows) -> 'ShadowTypeStats':
+        table = get_shadow_code_table()
+        offsets = table.offsets
+        for row in rows:
+            self.pairs += 1
+            count = 0
+            for i in range(offsets[row], offsets[row + 1]):
+                flags = table.description_flags[i]
+                if flags & DESCRIPTION_AP_TYPE:
+                    continue
+                count += 1
+                self.shadow_type_counts[ap_types[table.shadow_types[i]]] += 1
+                for flag, name in description_flag_names.items():
+                    if flags & flag:
+                        self.description_counts[name] += 1
+            self.count_distribution[count] += 1
+        return self
+
+    def to_dict(self) -> dict:
+        return {
+            'pairs': self.pairs,
+            'pairs_with_shadow_types': self.pairs - self.count_distribution[0],
+            'shadow_types': dict(self.shadow_type_counts.most_common()),
+            'descriptions': dict(self.description_counts.most_common()),
+            'shadow_type_counts': {str(count): self.count_distribution[count]
+                                   for count in sorted(self.count_distribution)},
+        }
+
+
+def query_shadow_types(ap_type_pattern: str, subtype_pattern: str) -> ShadowTypeStats:
+    return ShadowTypeStats().add_rows(expand_query(ap_type_pattern, subtype_pattern))
+
+
+def get_query_stats_str(ap_type_pattern: str, subtype_pattern: str, json: bool = False) -> str:
+    stats = query_shadow_types(ap_type_pattern, subtype_pattern).to_dict()
+    if json:
+        return dumps({'ap_type': ap_type_pattern, 'subtype': subtype_pattern, **stats}, indent=4)
+
+    results = [f'Shadow types for {ap_type_pattern} {subtype_pattern}:',
+               f'- {stats["pairs"]} AP type and subtype pairs, {stats["pairs_with_shadow_types"]} with shadow types']
+    results.append('\nShadow types:')
+    for shadow_type, count in stats['shadow_types'].items():
+        results.append(f'- {shadow_type}: {count}')
+    results.append('\nDescriptions:')
+    for description, count in stats['descriptions'].items():
+        results.append(f'- {description}: {count}')
+    results.append('\nNumber of shadow types:')
+    for shadow_type_count, count in stats['shadow_type_counts'].items():
+        results.append(f'- {shadow_type_count}: {count} pairs')
+    return '\n'.join(results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='ap_shadow_type_query',
+        usage='Show shadow type statistics for AP types and subtypes matching wildcard patterns',
+        add_help=True,  # add -h/--help option
+    )
+    parser.add_argument('ap_type', help='AP type pattern, e.g. V* (default: all)', nargs='?', default='*')
+    parser.add_argument('subtype', help='subtype pattern, e.g. 1?34 or [0-2]2*4 (default: all)', nargs='?',
+                        default='*')
+    parser.add_argument('-j', '--json', action='store_true', help='return answer in JSON format')
+    args = parser.parse_args()
+    try:
+        print(get_query_stats_str(args.ap_type, args.subtype, args.json))
+    except ValueError as e:
+        sys.stderr.write(f'{e.args[0]}\n')
+        exit(1)
@@ -0,0 +1,199 @@
+# Licensed under the Creative Commons BY license: https://creativecommons.org/licenses/by/4.0/
+
+# Similarity search over shadow type profiles: which (AP type, subtype) pairs produce shadow types like mine?
+#
+# To list the 10 pairs with the most similar shadow types:
+#   python ap_shadow_type_similarity.py [AP type] [subtype] [-k 10] [--metric jaccard|hamming] [--ap-type VLEF]
+#
+# The profile of a pair is an int with bit i set for each shadow type with AP type index i (see ap_core), not
+# counting the AP type itself, and bit 24 + j set for each description flag 1 << j of those shadow types
+# (method, self, others, obscured, repeated).
+#
+# Searches don't compare profiles one by one. Instead, for each profile bit there is a mask (an int with a bit per
+# row) of the rows with that bit set. Adding the masks of the bits in the query profile with bit-sliced addition
+# gives the size of the intersection with the query for every row at once; combined with masks of rows by profile
+# size, this gives the rows at each distance with a few hundred operations on 15,000-bit ints.
+
+import argparse
+import sys
+from json import dumps
+
+from ap_core import (ALL_ROWS, AP_TYPE_COUNT, ROW_COUNT, SUBTYPE_COUNT, DESCRIPTION_AP_TYPE, encode_ap_type,
+                     encode_subtype, get_pair, get_row, get_rows, get_shadow_code_table)
+
+DESCRIPTION_SHIFT = AP_TYPE_COUNT
+PROFILE_BITS = DESCRIPTION_SHIFT + 6  # 6 description flags
+
+METRICS = ('jaccard', 'hamming')
+
+
+def get_hamming_distance(profile1: int, profile2: int) -> int:
+    return (profile1 ^ profile2).bit_count()
+
+
+def get_jaccard_distance(profile1: int, profile2: int) -> float:
+    union = (profile1 | profile2).bit_count()
+    if union == 0:
+        return 0.0  # both have no shadow types
+    return 1 - (profile1 & profile2).bit_count() / union
+
+
+# the same distances from the sizes of 2 profiles and of their intersection
+def get_hamming_distance_from_sizes(size1: int, size2: int, intersection: int) -> int:
+    return size1 + size2 - 2 * intersection
+
+
+def get_jaccard_distance_from_sizes(size1: int, size2: int, intersection: int) -> float:
+    union = size1 + size2 - intersection
+    if union == 0:
+        return 0.0
+    return 1 - intersection / union
+
+
+class ShadowTypeProfiles:
+    def __init__(self):
+        table = get_shadow_code_table()
+        self.profiles: list[int] = []  # row -> profile
+        for row in range(ROW_COUNT):
+            profile = 0
+            for i in range(table.offsets[row], table.offsets[row + 1]):
+                flags = table.description_flags[i]
+                if not flags & DESCRIPTION_AP_TYPE:
+                    profile |= 1 << table.shadow_types[i] | flags << DESCRIPTION_SHIFT
+            self.profiles.append(profile)
+
+        # profile bit -> rows with that bit, and profile size (popcount) -> rows with that size
+        self.rows_by_bit: list[int] = [0] * PROFILE_BITS
+        self.rows_by_size: dict[int, int] = {}
+        for row, profile in enumerate(self.profiles):
+            row_bit = 1 << row
+            for bit in range(PROFILE_BITS):
+                if profile >> bit & 1:
+                    self.rows_by_bit[bit] |= row_bit
+            size = profile.bit_count()
+            self.rows_by_size[size] = self.rows_by_size.get(size, 0) | row_bit
+
+    def get_profile(self, ap_type_str: str, subtype_str: str) -> int:
+        return self.profiles[get_row(encode_ap_type(ap_type_str.strip()), encode_subtype(subtype_str.strip()))]
+
+    # masks of rows by the size of their intersection with profile
+    def get_rows_by_intersection(self, profile: int, rows: int) -> list[int]:
+        size = profile.bit_count()
+        planes = [0] * max(1, size.bit_length())  # bit-sliced counters, planes[j] is bit j of every row's count
+        for bit in range(PROFILE_BITS):
+            if profile >> bit & 1:
+                carry = self.rows_by_bit[bit]
+                for j, plane in enumerate(planes):
+                    planes[j] = plane ^ carry
+                    carry &= plane
+                    if not carry:
+                        break
+
+        rows_by_intersection = []
+        for count in range(size + 1):
+            count_rows = rows
+            for j, plane in enumerate(planes):
+                count_rows &= plane if count >> j & 1 else ~plane
+            rows_by_intersection.append(count_rows)
+        return rows_by_intersection
+
+    # k nearest rows to profile as (row, distance), nearest first, ties in row order.
+    # rows is a mask of the rows to search; exclude_row is left out of the results (e.g. the query itself).
+    def find_nearest_rows(self, profile: int, k: int = 10, metric: str = 'jaccard', rows: int = ALL_ROWS,
+                          exclude_row: int | None = None) -> list[tuple[int, int | float]]:
+        if metric == 'jaccard':
+            distance = get_jaccard_distance_from_sizes
+        elif metric == 'hamming':
+            distance = get_hamming_distance_from_sizes
+        else:
+            raise ValueError(f'Invalid metric {metric}, expected one of {", ".join(METRICS)}')
+        if exclude_row is not None:
+            rows &= ~(1 << exclude_row)
+
+        # distance -> rows, from each combination of intersection size and profile size
+        size = profile.bit_count()
+        rows_by_distance = {}
+        for intersection, intersection_rows in enumerate(self.get_rows_by_intersection(profile, rows)):
+            if intersection_rows:
+                for other_size, size_rows in self.rows_by_size.items():
+                    if intersection_rows & size_rows:
+                        row_distance = distance(size, other_size, intersection)
+                        rows_by_distance[row_distance] = rows_by_distance.get(row_distance, 0) | (
+                                intersection_rows & size_rows)
+
+        results = []
+        for row_distance in sorted(rows_by_distance):
+            results.extend((row, row_distance) for row in get_rows(rows_by_distance[row_distance], k - len(results)))
+            if len(results) >= k:
+                break
+        return results
+
+
+_shadow_type_profiles: ShadowTypeProfiles | None = None
+
+
+def get_shadow_type_profiles() -> ShadowTypeProfiles:
+    global _shadow_type_profiles
+    if _shadow_type_profiles is None:
+        _shadow_type_profiles = ShadowTypeProfiles()
+    return _shadow_type_profiles
+
+
+# mask of the rows with any of the AP types and any of the subtypes (all if none are given)
+def get_row_mask(ap_type_strs: list[str] = (), subtype_strs: list[str] = ()) -> int:
+    rows = ALL_ROWS
+    if ap_type_strs:
+        ap_type_rows = (1 << SUBTYPE_COUNT) - 1
+        rows &= sum(ap_type_rows << encode_ap_type(ap_type.strip()) * SUBTYPE_COUNT for ap_type in set(ap_type_strs))
+    if subtype_strs:
+        subtype_rows = sum(1 << ap_type_index * SUBTYPE_COUNT for ap_type_index in range(AP_TYPE_COUNT))
+        rows &= sum(subtype_rows << encode_subtype(subtype.strip()) for subtype in set(subtype_strs))
+    return rows
+
+
+# k (AP type, subtype, distance) with shadow types most like those of ap_type_str and subtype_str,
+# optionally limited to the given AP types and/or subtypes
+def find_similar_subtypes(ap_type_str: str, subtype_str: str, k: int = 10, metric: str = 'jaccard',
+                          ap_type_strs: list[str] = (),
+                          subtype_strs: list[str] = ()) -> list[tuple[str, str, int | float]]:
+    row = get_row(encode_ap_type(ap_type_str.strip()), encode_subtype(subtype_str.strip()))
+    profiles = get_shadow_type_profiles()
+    nearest = profiles.find_nearest_rows(profiles.profiles[row], k, metric, get_row_mask(ap_type_strs, subtype_strs),
+                                         exclude_row=row)
+    return [(*get_pair(row), distance) for row, distance in nearest]
+
+
+def get_similar_subtypes_str(ap_type_str: str, subtype_str: str, k: int = 10, metric: str = 'jaccard',
+                             ap_type_strs: list[str] = (), subtype_strs: list[str] = (), json: bool = False) -> str:
+    similar = find_similar_subtypes(ap_type_str, subtype_str, k, metric, ap_type_strs, subtype_strs)
+    if json:
+        return dumps([{'ap_type': ap_type, 'subtype': subtype, 'distance': distance}
+                      for ap_type, subtype, distance in similar], indent=4)
+    results = [f'Most similar to {ap_type_str.strip().upper()} {subtype_str.strip()} ({metric} distance):']
+    for ap_type, subtype, distance in similar:
+        results.append(f'- {ap_type} {subtype}: {distance:.3g}')
+    return '\n'.join(results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='ap_shadow_type_similarity',
+        usage='List AP type and subtype pairs with the most similar shadow types',
+        add_help=True,  # add -h/--help option
+    )
+    parser.add_argument('ap_type', help='AP type (any permutation of FLEV)')
+    parser.add_argument('subtype', help='AP subtype (4 digits between 0 and 4, inclusive)')
+    parser.add_argument('-k', type=int, default=10, help='number of results (default: 10)')
+    parser.add_argument('-m', '--metric', choices=METRICS, default='jaccard', help='distance (default: jaccard)')
+    parser.add_argument('-a', '--ap-type', dest='ap_types', action='append', default=[],
+                        help='only include this AP type (repeatable)')
+    parser.add_argument('-s', '--subtype', dest='subtypes', action='append', default=[],
+                        help='only include this subtype (repeatable)')
+    parser.add_argument('-j', '--json', action='store_true', help='return answer in JSON format')
+    args = parser.parse_args()
+    try:
+        print(get_similar_subtypes_str(args.ap_type, args.subtype, args.k, args.metric, args.ap_types, args.subtypes,
+                                       args.json))
+    except ValueError as e:
+        sys.stderr.write(f'{e.args[0]}\n')
+        exit(1)
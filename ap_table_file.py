@@ -0,0 +1,149 @@
+# Licensed under the Creative Commons BY license: https://creativecommons.org/licenses/by/4.0/
+
+# Binary file of precomputed tables, memory-mapped read-only so that every process using it shares one copy in the
+# page cache. ap_shadow_type_api stores its encoded response bodies in one (see build_table_file there).
+#
+# To build the API's table file:
+#   python ap_table_file.py [--output ap_tables.bin]
+# then start the API with AP_TABLE_FILE=ap_tables.bin.
+#
+# Layout (little endian):
+# - header: magic, format version, section count, version key, CRC-32 of the data, data length
+# - section directory: name, offset and length of each section, offsets from the start of the data
+# - data: the sections, each starting at a multiple of 8 bytes
+#
+# The version key is chosen by the writer (e.g. a hash of the code that computes the tables); a file with a
+# different version key is stale. Sections are raw bytes; pack_bodies and PackedBodies store a list of byte strings
+# in a section and look them up by index without copying the section.
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+from zlib import crc32
+
+MAGIC = b'APTABLES'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sHH32sIQ')
+SECTION = struct.Struct('<32sQQ')
+ALIGNMENT = 8
+
+
+class TableFileError(ValueError):
+    pass
+
+
+def pack_bodies(bodies: list[bytes]) -> bytes:
+    # count, then count + 1 offsets into the concatenated bodies, then the bodies
+    offsets = [0]
+    for body in bodies:
+        offsets.append(offsets[-1] + len(body))
+    return struct.pack(f'<I{len(offsets)}I', len(bodies), *offsets) + b''.join(bodies)
+
+
+class PackedBodies:
+    # byte strings of a pack_bodies section, by index
+    __slots__ = ('data', 'offsets', 'start')
+
+    def __init__(self, section: memoryview):
+        count = struct.unpack_from('<I', section)[0]
+        self.start = 4 * (count + 2)
+        self.offsets = section[4:self.start].cast('I')
+        self.data = section
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> bytes:
+        return bytes(self.data[self.start + self.offsets[i]:self.start + self.offsets[i + 1]])
+
+
+def write_table_file(path: str, version_key: bytes, sections: dict[str, bytes]) -> None:
+    # written to a temporary file first, so processes never map a partial file
+    directory = []
+    data = bytearray()
+    for name, section in sections.items():
+        data.extend(bytes(-len(data) % ALIGNMENT))
+        directory.append(SECTION.pack(name.encode(), len(data), len(section)))
+        data.extend(section)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(sections), version_key, crc32(data), len(data))
+    padding = bytes(-(len(header) + len(directory) * SECTION.size) % ALIGNMENT)
+
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(header)
+        f.write(b''.join(directory))
+        f.write(padding)
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+class TableFile:
+    # Read-only memory map of a table file. Raises TableFileError if the file is invalid, corrupt or stale
+    # (version key isn't version_key), and OSError if it can't be read.
+    def __init__(self, path: str, version_key: bytes):
+        self.path = path
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise TableFileError(f'Invalid table file {path}: empty')  # can't map an empty file
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.sections = self._read_sections(version_key)
+        except (TableFileError, struct.error) as e:
+            self.mmap.close()
+            raise TableFileError(f'Invalid table file {path}: {e}') from None
+
+    def _read_sections(self, version_key: bytes) -> dict[str, memoryview]:
+        magic, format_version, section_count, file_version_key, checksum, length = HEADER.unpack_from(self.mmap)
+        if magic != MAGIC:
+            raise TableFileError('not a table file')
+        if format_version != FORMAT_VERSION:
+            raise TableFileError(f'format version {format_version}, expected {FORMAT_VERSION}')
+        if file_version_key != version_key:
+            raise TableFileError('stale, built from different code')
+        if sys.byteorder != 'little':
+            raise TableFileError('only supported on little endian platforms')  # PackedBodies offsets are native
+
+        directory_end = HEADER.size + section_count * SECTION.size
+        data_start = directory_end + -directory_end % ALIGNMENT
+        if data_start + length > len(self.mmap):
+            raise TableFileError('truncated')
+        directory = {}
+        for i in range(section_count):
+            name, offset, section_length = SECTION.unpack_from(self.mmap, HEADER.size + i * SECTION.size)
+            if offset + section_length > length:
+                raise TableFileError(f'section {i} out of range')
+            directory[name.rstrip(b'\0').decode()] = (data_start + offset, section_length)
+
+        # views are released before returning, so the map can be closed if the checksum doesn't match
+        with memoryview(self.mmap) as view, view[data_start:data_start + length] as data:
+            if crc32(data) != checksum:
+                raise TableFileError('checksum mismatch')
+
+        view = memoryview(self.mmap)
+        return {name: view[start:start + section_length] for name, (start, section_length) in directory.items()}
+
+    def section(self, name: str) -> memoryview:
+        try:
+            return self.sections[name]
+        except KeyError:
+            raise TableFileError(f'Missing section {name} in table file {self.path}') from None
+
+    def bodies(self, name: str) -> PackedBodies:
+        return PackedBodies(self.section(name))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='ap_table_file',
+        usage='Build the table file of the web API (use it by setting AP_TABLE_FILE)',
+        add_help=True,  # add -h/--help option
+    )
+    parser.add_argument('-o', '--output', default='ap_tables.bin', help='table file (default: ap_tables.bin)')
+    args = parser.parse_args()
+
+    from ap_shadow_type_api import build_table_file  # only needed here, and needs FastAPI
+
+    build_table_file(args.output)
+    print(f'Wrote {args.output} ({os.path.getsize(args.output):,} bytes)')
@@ -0,0 +1,57 @@
+import asyncio
+import unittest
+from collections import Counter
+
+from ap_api_load import RequestMix, get_in_process_client, get_report, run_load
+from ap_shadow_type_api import rate_limiter
+
+
+class ApApiLoadTest(unittest.TestCase):
+
+    def test_request_mix(self):
+        mix = RequestMix('mixed', seed=1)
+        requests = [mix.next() for _ in range(1000)]
+        same_mix = RequestMix('mixed', seed=1)
+        self.assertListEqual([request.path for request in requests], [same_mix.next().path for _ in range(1000)])
+        self.assertTrue(any(request.method == 'POST' for request in requests))
+        self.assertTrue(any(not request.valid for request in requests))
+        self.assertTrue(any(request.path.startswith('/shadow.html/') for request in requests))
+        # popular pairs get most requests
+        zipf_mix = RequestMix('zipf')
+        paths = Counter(zipf_mix.next().path for _ in range(1000))
+        self.assertGreater(paths.most_common(1)[0][1], 50)
+        self.assertTrue(all(not RequestMix('invalid', seed).next().valid for seed in range(10)))
+
+    def test_report(self):
+        report = get_report([0.001] * 98 + [0.002, 0.010], Counter({200: 99, 400: 1}), 1, 0.5)
+        self.assertEqual(100, report['requests'])
+        self.assertEqual(200, report['requests_per_sec'])
+        self.assertAlmostEqual(1, report['p50_ms'])
+        self.assertAlmostEqual(1, report['p95_ms'])
+        self.assertAlmostEqual(10, report['p99_ms'])
+        self.assertAlmostEqual(10, report['max_ms'])
+        self.assertDictEqual({'200': 99, '400': 1}, report['statuses'])
+        self.assertEqual(0.01, report['error_rate'])
+        self.assertEqual(0.01, report['unexpected_rate'])
+
+    def test_run_load(self):
+        self.addCleanup(setattr, rate_limiter, 'enabled', True)
+
+        async def run():
+            async with get_in_process_client() as client:
+                return (await run_load(client, RequestMix('zipf'), 200, 8),
+                        await run_load(client, RequestMix('invalid'), 50, 8))
+
+        report, invalid_report = asyncio.run(run())
+        self.assertEqual(200, report['requests'])
+        self.assertDictEqual({'200': 200}, report['statuses'])
+        self.assertEqual(0, report['unexpected_rate'])
+        self.assertLessEqual(report['p50_ms'], report['p95_ms'])
+        self.assertLessEqual(report['p95_ms'], report['p99_ms'])
+        self.assertDictEqual({'400': 50}, invalid_report['statuses'])
+        self.assertEqual(1, invalid_report['error_rate'])
+        self.assertEqual(0, invalid_report['unexpected_rate'])
+
+
+if __name__ == '__main__':
+    unittest.main()
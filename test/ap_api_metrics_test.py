@@ -0,0 +1,61 @@
+import asyncio
+import unittest
+
+from ap_api_metrics import ApiMetrics, MetricsMiddleware, UNMATCHED_ROUTE
+
+
+class ApApiMetricsTest(unittest.TestCase):
+
+    def test_render(self):
+        metrics = ApiMetrics()
+        metrics.observe('/shadow/{ap_type}/{subtype}', 'GET', 200, 0.0003)
+        metrics.observe('/shadow/{ap_type}/{subtype}', 'GET', 200, 0.002)
+        metrics.observe('/shadow/{ap_type}/{subtype}', 'GET', 400, 5.0)
+        metrics.add_validation_errors('/shadow/batch', 3)
+        metrics.add_cache('bodies', lambda: {'hits': 3, 'misses': 1, 'hit_ratio': 0.75})
+        lines = metrics.render().splitlines()
+
+        self.assertIn('ap_api_requests_total{route="/shadow/{ap_type}/{subtype}",method="GET",status="200"} 2', lines)
+        self.assertIn('ap_api_requests_total{route="/shadow/{ap_type}/{subtype}",method="GET",status="400"} 1', lines)
+        # buckets are cumulative
+        self.assertIn('ap_api_request_duration_seconds_bucket{route="/shadow/{ap_type}/{subtype}",le="0.00025"} 0',
+                      lines)
+        self.assertIn('ap_api_request_duration_seconds_bucket{route="/shadow/{ap_type}/{subtype}",le="0.0005"} 1',
+                      lines)
+        self.assertIn('ap_api_request_duration_seconds_bucket{route="/shadow/{ap_type}/{subtype}",le="0.0025"} 2',
+                      lines)
+        self.assertIn('ap_api_request_duration_seconds_bucket{route="/shadow/{ap_type}/{subtype}",le="2.5"} 2', lines)
+        self.assertIn('ap_api_request_duration_seconds_bucket{route="/shadow/{ap_type}/{subtype}",le="+Inf"} 3', lines)
+        self.assertIn('ap_api_request_duration_seconds_count{route="/shadow/{ap_type}/{subtype}"} 3', lines)
+        self.assertIn('ap_api_validation_errors_total{route="/shadow/{ap_type}/{subtype}"} 1', lines)
+        self.assertIn('ap_api_validation_errors_total{route="/shadow/batch"} 3', lines)
+        self.assertIn('ap_api_cache_hits_total{cache="bodies"} 3', lines)
+        self.assertIn('ap_api_cache_hit_ratio{cache="bodies"} 0.75', lines)
+
+    def test_escape_labels(self):
+        metrics = ApiMetrics()
+        metrics.observe('a"b\\c\nd', 'GET', 200, 0.0)
+        self.assertIn('ap_api_requests_total{route="a\\"b\\\\c\\nd",method="GET",status="200"} 1',
+                      metrics.render().splitlines())
+
+    def test_middleware(self):
+        metrics = ApiMetrics()
+
+        async def app(scope, receive, send):
+            await send({'type': 'http.response.start', 'status': 404, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b''})
+
+        async def failing_app(scope, receive, send):
+            raise RuntimeError()
+
+        async def send(message):
+            pass
+
+        asyncio.run(MetricsMiddleware(app, metrics)({'type': 'http', 'method': 'GET'}, None, send))
+        with self.assertRaises(RuntimeError):
+            asyncio.run(MetricsMiddleware(failing_app, metrics)({'type': 'http', 'method': 'POST'}, None, send))
+        self.assertDictEqual({(UNMATCHED_ROUTE, 'GET', 404): 1, (UNMATCHED_ROUTE, 'POST', 500): 1}, metrics.requests)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from starlette.applications import Starlette
+from starlette.routing import Route
+
+from ap_api_rate_limit import RateLimit, RateLimiter, RateLimitMiddleware, parse_rate_limit, set_route
+
+
+def get_scope(path: str, client: str = '1.2.3.4', headers: list[tuple[bytes, bytes]] = ()) -> dict:
+    return {'type': 'http', 'method': 'GET', 'path': path, 'client': (client, 1234), 'headers': list(headers)}
+
+
+class ApApiRateLimitTest(unittest.TestCase):
+
+    def test_parse_rate_limit(self):
+        self.assertEqual(RateLimit(100, 200), parse_rate_limit('100/200'))
+        self.assertEqual(RateLimit(10, 10), parse_rate_limit('10'))
+        self.assertEqual(RateLimit(0.5, 1), parse_rate_limit('0.5'))
+        self.assertIsNone(parse_rate_limit('0'))
+        with self.assertRaises(ValueError):
+            parse_rate_limit('fast')
+
+    def test_token_bucket(self):
+        limiter = RateLimiter(RateLimit(2, 3))
+        for _ in range(3):
+            self.assertEqual(0, limiter.acquire('a', '/shadow/LVEF/4343', now=10.0))
+        self.assertAlmostEqual(0.5, limiter.acquire('a', '/shadow/LVEF/4343', now=10.0))
+        self.assertAlmostEqual(0.25, limiter.acquire('a', '/shadow/LVEF/4343', now=10.25))  # half a token back
+        self.assertEqual(0, limiter.acquire('a', '/shadow/LVEF/4343', now=10.5))
+        self.assertEqual(0, limiter.acquire('b', '/shadow/LVEF/4343', now=10.5))  # separate client
+        # refills up to the burst size
+        for _ in range(3):
+            self.assertEqual(0, limiter.acquire('a', '/shadow/LVEF/4343', now=100.0))
+        self.assertGreater(limiter.acquire('a', '/shadow/LVEF/4343', now=100.0), 0)
+
+    def test_routes(self):
+        limiter = RateLimiter(RateLimit(100, 100), {'/shadow/batch': RateLimit(1, 1), '/healthz': None})
+        self.assertEqual(0, limiter.acquire('a', '/shadow/batch', now=0.0))
+        self.assertAlmostEqual(1.0, limiter.acquire('a', '/shadow/batch', now=0.0))
+        self.assertEqual(0, limiter.acquire('a', '/shadow/LVEF/4343', now=0.0))
+        self.assertEqual(0, limiter.acquire('a', '/shadow/batches', now=0.0))  # not a path under /shadow/batch
+        for _ in range(1000):
+            self.assertEqual(0, limiter.acquire('a', '/healthz', now=0.0))
+        self.assertNotIn(('a', '/healthz'), limiter.buckets)
+
+    def test_disabled(self):
+        limiter = RateLimiter(RateLimit(1, 1))
+        limiter.enabled = False
+        for _ in range(10):
+            self.assertEqual(0, limiter.acquire('a', '/shadow/LVEF/4343', now=0.0))
+
+    def test_max_clients(self):
+        limiter = RateLimiter(RateLimit(1, 2), {'/shadow/batch': RateLimit(1, 1)})
+        with patch('ap_api_rate_limit.MAX_CLIENTS', 2):
+            limiter.acquire('a', '/shadow/LVEF/4343', now=0.0)
+            limiter.acquire('b', '/shadow/LVEF/4343', now=0.0)
+            limiter.acquire('a', '/shadow/LVEF/4343', now=0.0)  # most recently used again
+            limiter.acquire('a', '/shadow/batch', now=0.0)  # drops the least recently used bucket
+        self.assertListEqual([('a', ''), ('a', '/shadow/batch')], list(limiter.buckets))
+
+    def test_get_client(self):
+        limiter = RateLimiter(RateLimit(1, 1), api_keys={'secret'})
+        self.assertEqual('ip:1.2.3.4', limiter.get_client(get_scope('/')))
+        self.assertEqual('key:secret', limiter.get_client(get_scope('/', headers=[(b'x-api-key', b'secret')])))
+        # unknown keys don't get a bucket of their own
+        self.assertEqual('ip:1.2.3.4', limiter.get_client(get_scope('/', headers=[(b'x-api-key', b'guess')])))
+
+    def test_set_route(self):
+        route = Route('/shadow/{ap_type}/{subtype}', lambda request: None, methods=['GET'])
+        app = Starlette(routes=[Route('/healthz', lambda request: None), route])
+        scope = {**get_scope('/shadow/LVEF/4343'), 'app': app}
+        set_route(scope)
+        self.assertIs(route, scope['route'])
+        scope = {**get_scope('/shadow/LVEF/4343'), 'method': 'POST', 'app': app}
+        set_route(scope)
+        self.assertIs(route, scope['route'])  # partial match, responds 405
+        scope = {**get_scope('/missing'), 'app': app}
+        set_route(scope)
+        self.assertNotIn('route', scope)
+
+    def test_middleware(self):
+        release = None
+
+        async def app(scope, receive, send):
+            if scope['path'] == '/slow':
+                await release.wait()
+            await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b''})
+
+        async def request(middleware, path: str) -> tuple[int, dict[bytes, bytes]]:
+            messages = []
+
+            async def send(message):
+                messages.append(message)
+
+            await middleware(get_scope(path), None, send)
+            return messages[0]['status'], dict(messages[0]['headers'])
+
+        async def run():
+            nonlocal release
+            release = asyncio.Event()
+            middleware = RateLimitMiddleware(app, RateLimiter(RateLimit(1, 2)), max_concurrency=1)
+            slow = asyncio.create_task(request(middleware, '/slow'))
+            await asyncio.sleep(0)
+            busy = await request(middleware, '/fast')  # shed while /slow is in progress
+            release.set()
+            self.assertEqual(200, (await slow)[0])
+            return busy, await request(middleware, '/fast'), await request(middleware, '/fast')
+
+        (busy_status, busy_headers), (ok_status, _), (limited_status, limited_headers) = asyncio.run(run())
+        self.assertEqual(503, busy_status)
+        self.assertEqual(b'1', busy_headers[b'retry-after'])
+        self.assertEqual(200, ok_status)
+        self.assertEqual(429, limited_status)
+        self.assertEqual(b'1', limited_headers[b'retry-after'])
+
+
+if __name__ == '__main__':
+    unittest.main()
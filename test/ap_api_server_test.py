@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+
+from ap_api_server import get_http, get_loop, get_parser, get_uvicorn_options, prepare_table_file
+
+
+class ApApiServerTest(unittest.TestCase):
+
+    def test_options(self):
+        args = get_parser().parse_args(['--port', '8080', '--workers', '4', '--keep-alive', '10'])
+        options = get_uvicorn_options(args)
+        self.assertEqual('127.0.0.1', options['host'])
+        self.assertEqual(8080, options['port'])
+        self.assertEqual(4, options['workers'])
+        self.assertEqual(10, options['timeout_keep_alive'])
+        self.assertEqual(2048, options['backlog'])
+        self.assertNotIn('reload', options)
+        self.assertNotIn('limit_concurrency', options)
+
+    def test_uds(self):
+        options = get_uvicorn_options(get_parser().parse_args(['--uds', '/tmp/ap_api.sock']))
+        self.assertEqual('/tmp/ap_api.sock', options['uds'])
+        self.assertNotIn('host', options)
+        self.assertNotIn('port', options)
+
+    def test_reload(self):
+        options = get_uvicorn_options(get_parser().parse_args(['--reload', '--workers', '4']))
+        self.assertTrue(options['reload'])
+        self.assertNotIn('workers', options)
+
+    def test_loop_and_http(self):
+        self.assertIn(get_loop('auto'), ('asyncio', 'uvloop'))
+        self.assertEqual('asyncio', get_loop('asyncio'))
+        self.assertIn(get_http('auto'), ('h11', 'httptools'))
+        self.assertEqual('h11', get_http('h11'))
+
+    def test_prepare_table_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'tables.bin')
+            self.assertTrue(prepare_table_file(path))  # missing
+            self.assertFalse(prepare_table_file(path))  # current
+            with open(path, 'r+b') as f:
+                f.seek(-1, os.SEEK_END)
+                f.write(b'!')
+            self.assertTrue(prepare_table_file(path))  # corrupt
+            open(path, 'wb').close()
+            self.assertTrue(prepare_table_file(path))  # empty, e.g. after an interrupted build
+            self.assertFalse(prepare_table_file(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+import asyncio
+import time
+import unittest
+from json import loads
+
+import httpx
+from fastapi.testclient import TestClient
+
+from ap_api_rate_limit import RateLimit
+from ap_client import ApClient, ApiError, AsyncApClient, get_shadow_path
+from ap_shadow_type_api import app, rate_limiter
+
+
+class CountingTransport(httpx.AsyncBaseTransport):
+    # the app in this process, counting requests by method
+    def __init__(self):
+        self.transport = httpx.ASGITransport(app=app)
+        self.requests: list[httpx.Request] = []
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        return await self.transport.handle_async_request(request)
+
+
+class ApClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_client = TestClient(app)
+        rate_limiter.enabled = False  # all requests come from the same client
+        self.addCleanup(setattr, rate_limiter, 'enabled', True)
+        self.requests: list[httpx.Request] = []
+
+    def get_sync_transport(self, responses: list[httpx.Response | Exception] = ()) -> httpx.MockTransport:
+        # the app in this process, after any given responses or errors
+        responses = list(responses)
+
+        def handle(request: httpx.Request) -> httpx.Response:
+            self.requests.append(request)
+            if responses:
+                response = responses.pop(0)
+                if isinstance(response, Exception):
+                    raise response
+                return response
+            return self.test_client.request(request.method, str(request.url), headers=request.headers,
+                                            content=request.content)
+
+        return httpx.MockTransport(handle)
+
+    def test_async_coalescing(self):
+        pairs = [('LVEF', '4343'), ('lvef', ' 4343'), ('FEVL', '1440'), ('VELF', '1234'), ('VLLE', '4343')]
+
+        async def run():
+            transport = CountingTransport()
+            async with AsyncApClient(transport=transport, batch_window=0.01) as client:
+                results = await asyncio.gather(*(client.shadow_types(ap_type, subtype) for ap_type, subtype in pairs),
+                                               return_exceptions=True)
+                batch_requests = len(transport.requests)
+                # cached, so no more requests
+                cached = await client.shadow_types('FEVL', '1440')
+                matrix = await client.intertype_matrix()
+            return results, batch_requests, cached, matrix, transport.requests
+
+        results, batch_requests, cached, matrix, requests = asyncio.run(run())
+        self.assertEqual(1, batch_requests)
+        self.assertEqual('/shadow/batch', requests[0].url.path)
+        for (ap_type, subtype), result in zip(pairs[:4], results):
+            self.assertDictEqual(self.test_client.get(f'/shadow/{ap_type.upper()}/{subtype.strip()}').json(), result)
+        self.assertIsInstance(results[4], ApiError)
+        self.assertEqual(400, results[4].status_code)
+        self.assertEqual('Invalid AP type VLLE', results[4].detail)
+        self.assertEqual(results[2], cached)
+        self.assertEqual(2, len(requests))
+        self.assertDictEqual(self.test_client.get('/intertype/matrix').json(), matrix)
+
+    def test_async_max_batch_size(self):
+        async def run():
+            transport = CountingTransport()
+            async with AsyncApClient(transport=transport, batch_window=10, max_batch_size=2) as client:
+                await asyncio.gather(client.shadow_types('LVEF', '4343'), client.shadow_types('FEVL', '1440'))
+            return transport.requests
+
+        self.assertEqual(1, len(asyncio.run(run())))  # sent without waiting for the window
+
+    def test_async_rate_limited(self):
+        rate_limiter.enabled = True  # with the API's default limits
+        rate_limiter.clear()
+        pairs = [(ap_type, '4343') for ap_type in ('LVEF', 'FEVL', 'VELF', 'EFLV', 'LFVE', 'VLEF')] * 2
+
+        async def run():
+            transport = CountingTransport()
+            async with AsyncApClient(transport=transport) as client:
+                start = time.perf_counter()
+                results = [await client.shadow_types(ap_type, subtype) for ap_type, subtype in pairs]
+                return results, time.perf_counter() - start, transport.requests
+
+        results, seconds, requests = asyncio.run(run())
+        # sent 1 at a time as GETs, not as batches of 1 over the batch rate limit
+        self.assertListEqual([('GET', get_shadow_path(*pair)) for pair in pairs[:6]],
+                             [(request.method, request.url.path) for request in requests])
+        self.assertDictEqual(self.test_client.get('/shadow/VLEF/4343').json(), results[-1])
+        self.assertLess(seconds, 1)
+
+    def test_async_batch_rate_limit(self):
+        rate_limiter.enabled = True
+        rate_limiter.clear()
+
+        async def run():
+            transport = CountingTransport()
+            async with AsyncApClient(transport=transport, batch_window=0.001,
+                                     batch_rate_limit=RateLimit(10, 1)) as client:
+                first = asyncio.gather(client.shadow_types('LVEF', '4343'), client.shadow_types('FEVL', '1440'))
+                await asyncio.sleep(0.02)  # sent, with no batches left for 0.1 seconds
+                second = asyncio.gather(client.shadow_types('VELF', '1234'), client.shadow_types('EFLV', '0000'))
+                await asyncio.sleep(0.02)
+                third = asyncio.gather(client.shadow_types('LFVE', '4444'), client.shadow_types('VLEF', '1111'))
+                results = await asyncio.gather(first, second, third)
+            return [result for batch_results in results for result in batch_results], transport.requests
+
+        results, requests = asyncio.run(run())
+        self.assertListEqual([2, 4], [len(loads(request.content)) for request in requests])  # waiting calls coalesced
+        self.assertTrue(all(request.url.path == '/shadow/batch' for request in requests))
+        self.assertDictEqual(self.test_client.get('/shadow/VLEF/1111').json(), results[-1])
+
+    def test_async_results_not_shared(self):
+        async def run():
+            async with AsyncApClient(transport=CountingTransport()) as client:
+                coalesced = await asyncio.gather(client.shadow_types('LVEF', '4343'),
+                                                 client.shadow_types('LVEF', '4343'),
+                                                 client.shadow_types('FEVL', '1440'))
+                coalesced[0]['shadow_types'].clear()
+                return coalesced, await client.shadow_types('LVEF', '4343')
+
+        coalesced, cached = asyncio.run(run())
+        expected = self.test_client.get('/shadow/LVEF/4343').json()
+        self.assertDictEqual(expected, coalesced[1])
+        self.assertDictEqual(expected, cached)
+
+    def test_etag_cache(self):
+        with ApClient(transport=self.get_sync_transport()) as client:
+            result = client.shadow_types('LVEF', '4343')
+            self.assertDictEqual(self.test_client.get('/shadow/LVEF/4343').json(), result)
+            self.assertEqual(result, client.shadow_types('lvef', '4343'))
+            self.assertEqual(1, len(self.requests))
+
+            client.cache.entries[get_shadow_path('LVEF', '4343')].expires = 0  # revalidate
+            self.assertEqual(result, client.shadow_types('LVEF', '4343'))
+            self.assertEqual(2, len(self.requests))
+            self.assertIn('if-none-match', self.requests[1].headers)
+
+            self.assertEqual(self.test_client.get('/intertypes/FLEV').json(), client.intertypes('flev'))
+            self.assertEqual(self.test_client.get('/intertype/LVEF/FEVL').json(), client.intertype('LVEF', 'FEVL'))
+            self.assertEqual(self.test_client.get('/triads/SPI SY-CY-UN').json(), client.triads('spi sy/cy/un'))
+
+            client.shadow_types('LVEF', '4343')['shadow_types'].clear()  # doesn't change the cached result
+            self.assertEqual(result, client.shadow_types('LVEF', '4343'))
+
+    def test_sync_batch(self):
+        with ApClient(transport=self.get_sync_transport()) as client:
+            results = client.shadow_types_batch([('LVEF', '4343'), ('LVEF', '5555')])
+            self.assertDictEqual(self.test_client.get('/shadow/LVEF/4343').json(), results[0])
+            self.assertDictEqual({'error': 'Invalid subtype 5555'}, results[1])
+            # cached from the batch
+            self.assertEqual(results[0], client.shadow_types('LVEF', '4343'))
+            self.assertEqual(1, len(self.requests))
+
+    def test_retry(self):
+        responses = [httpx.ConnectError('refused'), httpx.Response(503, headers={'Retry-After': '0'}),
+                     httpx.Response(429, headers={'Retry-After': '0'})]
+        with ApClient(transport=self.get_sync_transport(responses), backoff=0) as client:
+            self.assertEqual(self.test_client.get('/intertype/matrix').json(), client.intertype_matrix())
+            self.assertEqual(4, len(self.requests))
+
+        self.requests.clear()
+        with ApClient(transport=self.get_sync_transport([httpx.Response(503)] * 3), retries=2, backoff=0) as client:
+            with self.assertRaises(ApiError) as context:
+                client.intertype_matrix()
+            self.assertEqual(503, context.exception.status_code)
+            self.assertEqual(3, len(self.requests))
+
+        self.requests.clear()
+        with ApClient(transport=self.get_sync_transport(), backoff=0) as client:
+            with self.assertRaises(ApiError) as context:
+                client.shadow_types('VLLE', '4343')
+            self.assertEqual(400, context.exception.status_code)
+            self.assertEqual(1, len(self.requests))  # not retried
+
+
+if __name__ == '__main__':
+    unittest.main()
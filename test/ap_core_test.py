@@ -0,0 +1,75 @@
+import unittest
+
+from ap_core import (ApType, Subtype, ap_types, subtypes, calculate_shadow_codes, decode_ap_type, decode_subtype,
+                     encode_ap_type, encode_subtype, get_description_flag_names, get_pair, get_row, get_rows,
+                     ALL_ROWS, ROW_COUNT, DESCRIPTION_AP_TYPE,
+                     DESCRIPTION_METHOD, DESCRIPTION_OBSCURED, DESCRIPTION_REPEATED, DESCRIPTION_SELF)
+from ap_shadow_type_calculator import ShadowTypes
+
+
+class ApCoreTest(unittest.TestCase):
+
+    def test_encode_decode_ap_types(self):
+        self.assertEqual(24, len(ap_types))
+        for i, ap_type in enumerate(ap_types):
+            self.assertEqual(i, encode_ap_type(ap_type))
+            self.assertEqual(i, encode_ap_type(ap_type.lower()))
+            self.assertEqual(ap_type, decode_ap_type(i))
+        self.assertEqual('VLEF', decode_ap_type(0))
+
+    def test_encode_decode_subtypes(self):
+        self.assertEqual(625, len(subtypes))
+        for code, subtype in enumerate(subtypes):
+            self.assertEqual(code, encode_subtype(subtype))
+            self.assertEqual(subtype, decode_subtype(code))
+        self.assertEqual(179, encode_subtype('1204'))
+
+    def test_encode_invalid(self):
+        for ap_type in ['', 'ABCD', 'VLLE', 'VLEFA', 'VLE']:
+            with self.assertRaises(ValueError):
+                encode_ap_type(ap_type)
+        for subtype in ['', 'ABCD', '1005', '100', '10041']:
+            with self.assertRaises(ValueError):
+                encode_subtype(subtype)
+
+    def test_rows(self):
+        row = get_row(encode_ap_type('LVEF'), encode_subtype('4343'))
+        self.assertEqual(('LVEF', '4343'), get_pair(row))
+        self.assertEqual(('FELV', '4444'), get_pair(ROW_COUNT - 1))
+        self.assertListEqual([0, row, ROW_COUNT - 1], get_rows(1 | 1 << row | 1 << ROW_COUNT - 1))
+        self.assertListEqual([0, 1], get_rows(ALL_ROWS, 2))
+        self.assertListEqual([], get_rows(0))
+
+    def test_value_classes(self):
+        ap_type = ApType.from_str(' lvef ')
+        self.assertEqual('LVEF', str(ap_type))
+        self.assertEqual(ApType(encode_ap_type('LVEF')), ap_type)
+        self.assertEqual(1, ap_type.position(ap_type.aspect(1)))
+        subtype = Subtype.from_str('4343')
+        self.assertEqual('4343', str(subtype))
+        self.assertEqual([4, 3, 4, 3], [subtype.target(pos) for pos in range(1, 5)])
+        with self.assertRaises(ValueError):
+            ApType(24)
+        with self.assertRaises(ValueError):
+            Subtype(625)
+
+    def test_matches_reference(self):
+        for ap_type_index, ap_type in enumerate(ap_types):
+            for subtype_code, subtype in enumerate(subtypes):
+                expected = list(ShadowTypes(ap_type, subtype).shadow_types.items())
+                actual = [(ap_types[shadow_type], description) for shadow_type, description, _ in
+                          calculate_shadow_codes(ap_type_index, subtype_code)]
+                self.assertListEqual(expected, actual, f'{ap_type} {subtype}')
+
+    def test_description_flags(self):
+        results = calculate_shadow_codes(encode_ap_type('VFEL'), encode_subtype('1340'))
+        self.assertListEqual([DESCRIPTION_AP_TYPE, DESCRIPTION_OBSCURED | DESCRIPTION_SELF, DESCRIPTION_METHOD],
+                             [flags for _, _, flags in results])
+        results = calculate_shadow_codes(encode_ap_type('LEVF'), encode_subtype('1324'))
+        self.assertListEqual(['AP type', 'method', 'repeated'], get_description_flag_names(
+            DESCRIPTION_AP_TYPE | DESCRIPTION_METHOD | DESCRIPTION_REPEATED))
+        self.assertEqual(DESCRIPTION_METHOD | DESCRIPTION_REPEATED, results[1][2])
+
+
+if __name__ == '__main__':
+    unittest.main()
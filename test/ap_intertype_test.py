@@ -3,7 +3,9 @@ from enum import Enum
 from itertools import permutations
 
 from ap_all_intertype import get_all_intertypes
-from ap_intertype import get_intertype
+from ap_core import ap_types
+from ap_intertype import (get_intertype, get_intertype_id, get_intertype_id_matrix, get_intertype_matrix,
+                          get_mapping, mapping_dict, relation_mappings)
 
 
 class Direction(Enum):
@@ -173,6 +175,28 @@ class ApIntertypeTest(unittest.TestCase):
                     expected = f'{relation}: {text}'
                     self.assertEqual(get_intertype(ap_type, other_type), expected)
 
+    def test_matrix(self):
+        # precomputed intertypes are the same as computing them from the mapping
+        matrix = get_intertype_matrix()
+        id_matrix = get_intertype_id_matrix()
+        self.assertEqual(24, len(matrix))
+        for i, ap_type1 in enumerate(ap_types):
+            self.assertEqual(24, len(matrix[i]))
+            for j, ap_type2 in enumerate(ap_types):
+                mapping = get_mapping(ap_type1, ap_type2)
+                self.assertEqual(mapping_dict[mapping].format(ap_type1, ap_type2), matrix[i][j])
+                self.assertEqual(matrix[i][j], get_intertype(ap_type1, ap_type2))
+                self.assertEqual(mapping, relation_mappings[id_matrix[i][j]])
+                self.assertEqual(id_matrix[i][j], get_intertype_id(i, j))
+        # every relation appears once in each row
+        for ids in id_matrix:
+            self.assertListEqual(list(range(24)), sorted(ids))
+
+    def test_not_uppercase(self):
+        self.assertEqual('Dual: lvef <—> fevl (shared sexta)', get_intertype('lvef', 'fevl'))
+        with self.assertRaises(ValueError):
+            get_intertype('LVEF', 'VLLE')
+
     @staticmethod
     def all_valid_ap_types():
         for ap_type in permutations('VELF'):
@@ -0,0 +1,340 @@
+import gzip
+import os
+import tempfile
+import time
+import unittest
+from json import dumps, loads
+
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from ap_all_intertype import get_all_intertypes
+from ap_api_rate_limit import RateLimit
+from ap_core import ap_types, subtypes
+from ap_intertype import get_intertype
+from ap_shadow_type_api import (CACHE_CONTROL, MAX_BATCH_BYTES, MAX_BATCH_SIZE, PackedShadowBodies, app,
+                                build_table_file, json_tables, load_table_file, metrics, rate_limiter,
+                                response_bodies, warm_up)
+from ap_shadow_type_calculator import calculate_shadow_types
+from triads import get_archetypes, get_triads, get_trifixes
+
+
+class ApShadowTypeApiTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TestClient(app)
+        rate_limiter.enabled = False  # all requests come from the same client
+        self.addCleanup(rate_limiter.clear)
+        self.addCleanup(setattr, rate_limiter, 'enabled', True)
+
+    def test_get_json(self):
+        for ap_type, subtype in [('LVEF', '4343'), ('VELF', '1234'), ('FEVL', '1440')]:
+            response = self.client.get(f'/shadow/{ap_type}/{subtype}', headers={'Accept-Encoding': 'identity'})
+            self.assertEqual(200, response.status_code)
+            self.assertEqual('application/json', response.headers['content-type'])
+            self.assertNotIn('content-encoding', response.headers)
+            self.assertDictEqual(calculate_shadow_types(ap_type, subtype), response.json())
+
+    def test_get_html(self):
+        response = self.client.get('/shadow.html/LVEF/4343', headers={'Accept-Encoding': 'identity'})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('text/html; charset=utf-8', response.headers['content-type'])
+        self.assertTrue(response.text.startswith('<h1>Shadow types for LVEF 4343:</h1><ol><li>LVEF: AP type</li>'))
+        self.assertTrue(response.text.endswith('</ol>'))
+
+    def test_get_gzip(self):
+        identity = self.client.get('/shadow/LVEF/4343', headers={'Accept-Encoding': 'identity'})
+        response = self.client.get('/shadow/LVEF/4343', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual('gzip', response.headers['content-encoding'])
+        self.assertEqual('Accept-Encoding', response.headers['vary'])
+        self.assertEqual(identity.content, response.content)  # decoded by the client
+        self.assertEqual(identity.content, gzip.decompress(response_bodies.get_gzip('json', 'LVEF', '4343')))
+        self.assertNotEqual(identity.headers['etag'], response.headers['etag'])
+        refused = self.client.get('/shadow/LVEF/4343', headers={'Accept-Encoding': 'gzip;q=0'})
+        self.assertNotIn('content-encoding', refused.headers)
+
+    def test_cache_headers(self):
+        for path in ['/shadow/LVEF/4343', '/shadow.html/LVEF/4343']:
+            response = self.client.get(path)
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(CACHE_CONTROL, response.headers['cache-control'])
+            etag = response.headers['etag']
+            self.assertTrue(etag.startswith('"') and etag.endswith('"'))
+
+            not_modified = self.client.get(path, headers={'If-None-Match': f'"other", W/{etag}'})
+            self.assertEqual(304, not_modified.status_code)
+            self.assertEqual(etag, not_modified.headers['etag'])
+            self.assertEqual(b'', not_modified.content)
+            self.assertEqual(304, self.client.get(path, headers={'If-None-Match': '*'}).status_code)
+            self.assertEqual(200, self.client.get(path, headers={'If-None-Match': '"other"'}).status_code)
+
+        self.assertNotEqual(self.client.get('/shadow/LVEF/4343').headers['etag'],
+                            self.client.get('/shadow.html/LVEF/4343').headers['etag'])
+        self.assertNotEqual(self.client.get('/shadow/LVEF/4343').headers['etag'],
+                            self.client.get('/shadow/LVEF/4344').headers['etag'])
+
+    def test_canonical_redirect(self):
+        response = self.client.get('/shadow/lvef/%204343?pretty=1', follow_redirects=False)
+        self.assertEqual(308, response.status_code)
+        self.assertEqual('/shadow/LVEF/4343?pretty=1', response.headers['location'])
+        response = self.client.get('/shadow.html/Lvef/4343', follow_redirects=False)
+        self.assertEqual(308, response.status_code)
+        self.assertEqual('/shadow.html/LVEF/4343', response.headers['location'])
+
+    def test_batch_ndjson(self):
+        pairs = [{'ap_type': ap_type, 'subtype': subtype} for ap_type in ap_types[:2] for subtype in subtypes]
+        response = self.client.post('/shadow/batch', json=pairs)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('application/x-ndjson', response.headers['content-type'])
+        results = [loads(line) for line in response.text.splitlines()]
+        self.assertEqual(len(pairs), len(results))
+        for index, (pair, result) in enumerate(zip(pairs, results)):
+            self.assertDictEqual({'index': index, **calculate_shadow_types(pair['ap_type'], pair['subtype'])}, result)
+
+    def test_batch_json(self):
+        pairs = [{'ap_type': 'lvef', 'subtype': ' 4343'}, {'ap_type': 'VELF', 'subtype': '1234'}]
+        response = self.client.post('/shadow/batch?format=json', json=pairs)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('application/json', response.headers['content-type'])
+        results = response.json()
+        self.assertListEqual([{'index': 0, **calculate_shadow_types('LVEF', '4343')},
+                              {'index': 1, **calculate_shadow_types('VELF', '1234')}], results)
+        self.assertEqual(dumps(results, separators=(',', ':')), response.text)  # compact, like other responses
+        self.assertListEqual([], self.client.post('/shadow/batch?format=json', json=[]).json())
+
+    def test_batch_item_errors(self):
+        pairs = [{'ap_type': 'VLLE', 'subtype': '0000'}, {'ap_type': 'LVEF', 'subtype': '4343'},
+                 {'ap_type': 'LVEF', 'subtype': '5555'}, ['LVEF', '4343']]
+        results = [loads(line) for line in self.client.post('/shadow/batch', json=pairs).text.splitlines()]
+        self.assertDictEqual({'index': 0, 'error': 'Invalid AP type VLLE'}, results[0])
+        self.assertEqual('LVEF', results[1]['ap_type'])
+        self.assertDictEqual({'index': 2, 'error': 'Invalid subtype 5555'}, results[2])
+        self.assertEqual(3, results[3]['index'])
+        self.assertIn('error', results[3])
+
+    def test_batch_limits(self):
+        pair = {'ap_type': 'LVEF', 'subtype': '4343'}
+        self.assertEqual(413, self.client.post('/shadow/batch', json=[pair] * (MAX_BATCH_SIZE + 1)).status_code)
+        self.assertEqual(413, self.client.post('/shadow/batch', content=b' ' * (MAX_BATCH_BYTES + 1)).status_code)
+        self.assertEqual(400, self.client.post('/shadow/batch', content=b'[{').status_code)
+        response = self.client.post('/shadow/batch', content=b'[' * 100000 + b']' * 100000)
+        self.assertEqual(400, response.status_code)
+        self.assertEqual('Request body is not valid JSON', response.json()['detail'])
+        self.assertEqual(400, self.client.post('/shadow/batch', json=pair).status_code)
+        self.assertEqual(400, self.client.post('/shadow/batch?format=xml', json=[pair]).status_code)
+
+    def test_intertype(self):
+        for ap_type1 in ap_types:
+            for ap_type2 in ap_types:
+                self.assertDictEqual({'ap_type1': ap_type1, 'ap_type2': ap_type2,
+                                      'intertype': get_intertype(ap_type1, ap_type2)},
+                                     self.client.get(f'/intertype/{ap_type1}/{ap_type2}').json())
+        self.assertEqual('LVEF', self.client.get('/intertype/lvef/FEVL').json()['ap_type1'])
+        response = self.client.get('/intertype/LVEF/LVEX')
+        self.assertEqual(400, response.status_code)
+        self.assertEqual('Invalid AP type LVEX', response.json()['detail'])
+
+    def test_intertypes(self):
+        for ap_type in ap_types:
+            self.assertDictEqual({'ap_type': ap_type, 'intertypes': get_all_intertypes(ap_type)},
+                                 self.client.get(f'/intertypes/{ap_type}').json())
+        self.assertEqual(400, self.client.get('/intertypes/VLLE').status_code)
+
+    def test_intertype_matrix(self):
+        matrix = self.client.get('/intertype/matrix').json()
+        self.assertListEqual(list(ap_types), matrix['ap_types'])
+        self.assertListEqual([[get_intertype(ap_type1, ap_type2) for ap_type2 in ap_types] for ap_type1 in ap_types],
+                             matrix['intertypes'])
+
+    def test_triads(self):
+        for value in get_trifixes() + get_archetypes():
+            self.assertListEqual(get_triads(value), self.client.get(f'/triads/{value}').json()['triads'])
+        for value in ['spi sy/cy/un', 'SY CY UN', 'fd-ay-ex']:
+            result = self.client.get(f'/triads/{value}').json()
+            self.assertListEqual(get_triads(value), result['triads'])
+        self.assertEqual('SPI SY-CY-UN', self.client.get('/triads/spi sy/cy/un').json()['value'])
+        response = self.client.get('/triads/SY-CY-CY')
+        self.assertEqual(400, response.status_code)
+        self.assertTrue(response.json()['detail'].startswith('Invalid value: SY-CY-CY'))
+
+    def test_metrics(self):
+        metrics.clear()
+        self.client.get('/shadow/LVEF/4343')
+        self.client.get('/intertypes/VLLE')
+        self.client.post('/shadow/batch', json=[{'ap_type': 'VLLE', 'subtype': '0000'}] * 2)
+        response = self.client.get('/metrics')
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response.headers['content-type'].startswith('text/plain; version=0.0.4'))
+        lines = response.text.splitlines()
+        self.assertIn('ap_api_requests_total{route="/shadow/{ap_type}/{subtype}",method="GET",status="200"} 1', lines)
+        self.assertIn('ap_api_requests_total{route="/intertypes/{ap_type}",method="GET",status="400"} 1', lines)
+        self.assertIn('ap_api_validation_errors_total{route="/intertypes/{ap_type}"} 1', lines)
+        self.assertIn('ap_api_validation_errors_total{route="/shadow/batch"} 2', lines)
+        self.assertTrue(any(line.startswith('ap_api_cache_hit_ratio{cache="response_bodies"}') for line in lines))
+
+    def test_health_and_readiness(self):
+        self.assertDictEqual({'status': 'ok'}, self.client.get('/healthz').json())
+        with TestClient(app) as client:  # runs the lifespan, which starts warm-up
+            for _ in range(300):
+                response = client.get('/readyz')
+                if response.status_code == 200:
+                    break
+                self.assertEqual(503, response.status_code)
+                self.assertFalse(response.json()['ready'])
+                time.sleep(0.1)
+            readiness = response.json()
+            self.assertTrue(readiness['ready'])
+            self.assertGreater(readiness['warm_up_seconds'], 0)
+            self.assertDictEqual({'shadow_types': 15000, 'response_bodies': 30000, 'gzip_response_bodies': 30000,
+                                  'intertypes': 576, 'all_intertypes': 24, 'intertype_matrix': 1, 'triads': 1296},
+                                 readiness['tables'])
+
+    def test_table_file(self):
+        paths = ['/shadow/LVEF/4343', '/shadow.html/FEVL/1440', '/shadow/VELF/1234', '/intertype/LVEF/FEVL',
+                 '/intertypes/FLEV', '/intertype/matrix', '/triads/SPI SY-CY-UN', '/triads/259']
+        encodings = ['gzip', 'identity']
+        expected = {(path, encoding): self.client.get(path, headers={'Accept-Encoding': encoding}).content
+                    for path in paths for encoding in encodings}
+
+        def reset():
+            response_bodies.clear()
+            for table in json_tables.values():
+                table.bodies = None
+            warm_up.table_file = None
+            warm_up.table_file_error = None
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'tables.bin')
+            build_table_file(path)
+            reset()
+            self.addCleanup(reset)
+            self.assertTrue(load_table_file(path))
+            self.assertIsInstance(response_bodies.bodies, PackedShadowBodies)
+            for (request_path, encoding), content in expected.items():
+                self.assertEqual(content, self.client.get(request_path, headers={'Accept-Encoding': encoding}).content)
+            reset()
+
+            with open(path, 'r+b') as f:
+                f.seek(-1, os.SEEK_END)
+                f.write(b'!')
+            with self.assertLogs('ap_shadow_type_api', 'WARNING'):
+                self.assertFalse(load_table_file(path))
+            self.assertIn('checksum', warm_up.table_file_error)
+            self.assertIsInstance(response_bodies.bodies, dict)  # falls back to building bodies in this process
+
+    def test_rate_limit(self):
+        rate_limiter.enabled = True
+        rate_limiter.clear()
+        metrics.clear()
+        burst = int(rate_limiter.get_limit('/shadow/batch')[1].burst)
+        for _ in range(burst):
+            self.assertEqual(200, self.client.post('/shadow/batch', json=[]).status_code)
+        response = self.client.post('/shadow/batch', json=[])
+        self.assertEqual(429, response.status_code)
+        self.assertGreaterEqual(int(response.headers['Retry-After']), 1)
+        self.assertEqual('Too many requests', response.json()['detail'])
+        # other routes have their own limit, and health checks have none
+        self.assertEqual(200, self.client.get('/shadow/LVEF/4343').status_code)
+        self.assertEqual(200, self.client.get('/healthz').status_code)
+        self.assertIn('ap_api_requests_total{route="/shadow/batch",method="POST",status="429"} 1',
+                      self.client.get('/metrics').text.splitlines())
+
+    def test_cache_counts(self):
+        # 1 hit or miss per request, including for bodies that aren't gzipped because it doesn't make them smaller
+        ap_type, subtype = next((ap_type, subtype) for ap_type in ap_types for subtype in subtypes
+                                if response_bodies.get_gzip('html', ap_type, subtype) is None)
+        for headers in [{'Accept-Encoding': 'gzip'}, {'Accept-Encoding': 'identity'}]:
+            cache_info = response_bodies.info()
+            response = self.client.get(f'/shadow.html/{ap_type}/{subtype}', headers=headers)
+            self.assertEqual(200, response.status_code)
+            self.assertNotIn('Content-Encoding', response.headers)
+            self.assertEqual(cache_info['hits'] + 1, response_bodies.info()['hits'])
+            self.assertEqual(cache_info['misses'], response_bodies.info()['misses'])
+
+    def test_get_invalid(self):
+        metrics.clear()
+        cache_info = response_bodies.info()
+        for path, detail in [('/shadow/VLLE/4343', 'Invalid AP type VLLE'),
+                             ('/shadow/vlle/4343', 'Invalid AP type VLLE'),
+                             ('/shadow/LVEF/5555', 'Invalid subtype 5555'),
+                             ('/shadow/lvef/12', 'Invalid subtype 12'),
+                             ('/shadow.html/VLEFF/4343', 'Invalid AP type VLEFF')]:
+            response = self.client.get(path, headers={'Accept-Encoding': 'gzip'}, follow_redirects=False)
+            self.assertEqual(400, response.status_code, path)
+            self.assertEqual('application/json', response.headers['Content-Type'])
+            self.assertDictEqual({'detail': detail}, response.json())
+            self.assertNotIn('ETag', response.headers)
+            self.assertNotIn('Cache-Control', response.headers)
+        self.assertEqual(cache_info['hits'] + cache_info['misses'],
+                         response_bodies.info()['hits'] + response_bodies.info()['misses'])
+        lines = self.client.get('/metrics').text.splitlines()
+        self.assertIn('ap_api_requests_total{route="/shadow/{ap_type}/{subtype}",method="GET",status="400"} 4', lines)
+        self.assertIn('ap_api_validation_errors_total{route="/shadow/{ap_type}/{subtype}"} 4', lines)
+        self.assertIn('ap_api_validation_errors_total{route="/shadow.html/{ap_type}/{subtype}"} 1', lines)
+
+    def test_openapi(self):
+        operation = self.client.get('/openapi.json').json()['paths']['/shadow/{ap_type}/{subtype}']['get']
+        self.assertListEqual(['ap_type', 'subtype'], [parameter['name'] for parameter in operation['parameters']])
+        self.assertIn('400', operation['responses'])
+
+    def test_websocket(self):
+        with self.client.websocket_connect('/ws') as websocket:
+            queries = [
+                ({'id': 1, 'type': 'shadow', 'ap_type': 'lvef', 'subtype': '4343'}, '/shadow/LVEF/4343'),
+                ({'id': 'a', 'type': 'intertype', 'ap_type1': 'LVEF', 'ap_type2': 'FEVL'}, '/intertype/LVEF/FEVL'),
+                ({'id': 3, 'type': 'intertypes', 'ap_type': 'FLEV'}, '/intertypes/FLEV'),
+                ({'id': 4, 'type': 'intertype_matrix'}, '/intertype/matrix'),
+                ({'id': 5, 'type': 'triads', 'value': 'spi sy/cy/un'}, '/triads/SPI SY-CY-UN'),
+            ]
+            for query, path in queries:
+                websocket.send_json(query)
+            for query, path in queries:
+                self.assertDictEqual({'id': query['id'], 'status': 200, 'result': self.client.get(path).json()},
+                                     websocket.receive_json())
+
+            websocket.send_json({'id': 6, 'type': 'shadow', 'ap_type': 'VLLE', 'subtype': '4343'})
+            self.assertDictEqual({'id': 6, 'status': 400, 'detail': 'Invalid AP type VLLE'}, websocket.receive_json())
+            websocket.send_json({'id': 7, 'type': 'shadow', 'ap_type': 'LVEF'})
+            self.assertDictEqual({'id': 7, 'status': 400, 'detail': 'Expected string subtype'},
+                                 websocket.receive_json())
+            websocket.send_json({'id': 8, 'type': 'unknown'})
+            unknown_type = websocket.receive_json()
+            self.assertEqual(400, unknown_type['status'])
+            websocket.send_json({'id': 8, 'type': [1]})  # not a valid key either
+            self.assertDictEqual({**unknown_type, 'detail': unknown_type['detail'].replace('unknown', '[1]')},
+                                 websocket.receive_json())
+            websocket.send_json({'id': [9], 'type': 'intertype_matrix'})
+            self.assertDictEqual({'id': None, 'status': 400, 'detail': 'Expected string or integer id'},
+                                 websocket.receive_json())
+            websocket.send_text('{')
+            self.assertDictEqual({'id': None, 'status': 400, 'detail': 'Message is not valid JSON'},
+                                 websocket.receive_json())
+            websocket.send_text('[' * 1500)
+            self.assertDictEqual({'id': None, 'status': 400, 'detail': 'Message is not valid JSON'},
+                                 websocket.receive_json())
+            websocket.send_bytes(b'{"id": 10, "type": "intertypes", "ap_type": "VLEF"}')
+            self.assertEqual(200, websocket.receive_json()['status'])
+
+    def test_websocket_limits(self):
+        rate_limiter.enabled = True
+        rate_limiter.clear()
+        self.addCleanup(setattr, rate_limiter, 'default', rate_limiter.default)
+        rate_limiter.default = RateLimit(0.1, 5)  # no new tokens during the test
+        burst = 5
+        with self.client.websocket_connect('/ws') as websocket:
+            for i in range(burst):
+                websocket.send_json({'id': i, 'type': 'intertype_matrix'})
+                self.assertEqual(200, websocket.receive_json()['status'])
+            websocket.send_json({'id': burst, 'type': 'intertype_matrix'})
+            response = websocket.receive_json()
+            self.assertEqual(429, response['status'])
+            self.assertGreaterEqual(response['retry_after'], 1)
+
+            websocket.send_text('x' * 5000)
+            with self.assertRaises(WebSocketDisconnect) as context:
+                websocket.receive_json()
+            self.assertEqual(1009, context.exception.code)
+
+
+if __name__ == '__main__':
+    unittest.main()
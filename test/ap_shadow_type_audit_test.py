@@ -0,0 +1,49 @@
+import unittest
+from collections import Counter
+
+from ap_core import ap_types, subtypes
+from ap_shadow_type_audit import audit_ap_type, get_audit_summary, run_audit
+from ap_shadow_type_calculator import ShadowTypes, TraceEventKind
+
+
+class ApShadowTypeAuditTest(unittest.TestCase):
+
+    def test_audit_ap_type(self):
+        audit = audit_ap_type('LVEF')
+        events = Counter()
+        pairs_by_event = Counter()
+        shadow_type_counts = Counter()
+        shadow_types_by_subtype = {}
+        for subtype in subtypes:
+            trace = []
+            shadow_types = [shadow_type for shadow_type, description in
+                            ShadowTypes('LVEF', subtype, trace=trace.append).shadow_types.items()
+                            if not description.startswith('AP type')]
+            events.update(event.kind for event in trace)
+            pairs_by_event.update({event.kind for event in trace})
+            shadow_type_counts[len(shadow_types)] += 1
+            shadow_types_by_subtype[subtype] = dict.fromkeys(sorted(shadow_types), 1)
+        report = audit.to_dict()
+        self.assertEqual(625, report['pairs'])
+        self.assertDictEqual({kind.value: events[kind] for kind in TraceEventKind}, report['events'])
+        self.assertDictEqual({kind.value: pairs_by_event[kind] for kind in TraceEventKind}, report['pairs_by_event'])
+        self.assertEqual(shadow_type_counts, Counter({int(count): pairs for count, pairs
+                                                      in report['shadow_type_counts'].items()}))
+        self.assertDictEqual(shadow_types_by_subtype, report['shadow_types_by_subtype'])
+
+    def test_run_audit(self):
+        inline = run_audit(workers=1).to_dict()
+        self.assertDictEqual(inline, run_audit(workers=2).to_dict())
+        self.assertEqual(15000, inline['pairs'])
+        self.assertEqual(15000, sum(inline['shadow_type_counts'].values()))
+        self.assertListEqual(sorted(ap_types), list(inline['shadow_type_counts_by_ap_type']))
+        self.assertEqual(625, len(inline['shadow_types_by_subtype']))
+        self.assertDictEqual({}, inline['shadow_types_by_subtype']['0000'])
+        self.assertDictEqual(dict.fromkeys(sorted(ap_types), 4), inline['shadow_types_by_subtype']['4343'])
+        for kind, count in inline['events'].items():
+            self.assertEqual(count, sum(phase_events[kind] for phase_events in inline['events_by_phase'].values()))
+        self.assertIn('skipped multiple matches', get_audit_summary(inline))
+
+
+if __name__ == '__main__':
+    unittest.main()
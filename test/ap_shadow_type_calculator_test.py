@@ -1,7 +1,14 @@
+import io
+import json
 import unittest
+from contextlib import redirect_stdout
 from itertools import permutations
 
-from ap_shadow_type_calculator import validate_subtype, validate_ap_type, ShadowTypes, calculate_shadow_types
+from ap_core import encode_ap_type, encode_subtype
+from ap_shadow_type_calculator import (validate_subtype, validate_ap_type, ShadowTypes, calculate_shadow_types,
+                                       calculate_shadow_types_batch, np, parse_stream_line,
+                                       run_stream, get_shadow_types_str, RenderCache, TraceEventKind,
+                                       TracePhase)
 
 
 class ApShadowTypeCalculatorTest(unittest.TestCase):
@@ -244,6 +251,177 @@ class ApShadowTypeCalculatorTest(unittest.TestCase):
         }
         self.assertDictEqual(shadow_types_json, expected)
 
+    def test_table_matches_reference(self):
+        for ap_type in self.all_valid_ap_types():
+            for subtype in self.all_valid_subtypes():
+                self.assertDictEqual(calculate_shadow_types(ap_type, subtype, use_table=False),
+                                     calculate_shadow_types(ap_type, subtype))
+
+    def test_table_normalizes_input(self):
+        self.assertDictEqual(calculate_shadow_types('LVEF', '4343'), calculate_shadow_types(' lvEf ', ' 4343 '))
+
+    def test_table_invalid_input(self):
+        with self.assertRaises(ValueError):
+            calculate_shadow_types('VLLE', '0000')
+        with self.assertRaises(ValueError):
+            calculate_shadow_types('VLEF', '1005')
+
+    def test_table_result_is_not_shared(self):
+        calculate_shadow_types('LVEF', '4343')['shadow_types'].clear()
+        self.assertEqual(5, len(calculate_shadow_types('LVEF', '4343')['shadow_types']))
+
+    def verify_batch(self, ap_types, subtypes, batch):
+        self.assertEqual(len(ap_types), len(batch))
+        for i, (ap_type, subtype) in enumerate(zip(ap_types, subtypes)):
+            expected = [(shadow_type['shadow_type'], shadow_type['description']) for shadow_type in
+                        calculate_shadow_types(ap_type, subtype)['shadow_types']]
+            self.assertListEqual(expected, batch.get(i))
+            self.assertEqual(len(expected), batch.counts[i])
+
+    def test_batch(self):
+        ap_types = [ap_type for ap_type in self.all_valid_ap_types() for _ in range(625)]
+        subtypes = list(self.all_valid_subtypes()) * 24
+        self.verify_batch(ap_types, subtypes, calculate_shadow_types_batch(ap_types, subtypes))
+
+    def test_batch_encoded_and_unnormalized(self):
+        ap_types = ['LVEF', 'FEVL', 'LEVF']
+        subtypes = ['4343', '1440', '4442']
+        self.verify_batch(ap_types, subtypes, calculate_shadow_types_batch(
+            [encode_ap_type(ap_type) for ap_type in ap_types], [encode_subtype(subtype) for subtype in subtypes]))
+        self.verify_batch(ap_types, subtypes,
+                          calculate_shadow_types_batch(['lvef ', 'FEVL', 'levF'], [' 4343', '1440', '4442']))
+
+    def test_batch_invalid(self):
+        with self.assertRaises(ValueError):
+            calculate_shadow_types_batch(['VLEF', 'VLLE'], ['0000', '0000'])
+        with self.assertRaises(ValueError):
+            calculate_shadow_types_batch(['VLEF'], ['1005'])
+        with self.assertRaises(ValueError):
+            calculate_shadow_types_batch([24], [0])
+        with self.assertRaises(ValueError):
+            calculate_shadow_types_batch(['VLEF'], [])
+        # only strings and integers
+        for ap_type in (0.7, None, True, b'VLEF'):
+            with self.assertRaises(ValueError):
+                calculate_shadow_types_batch([ap_type], ['0000'])
+        with self.assertRaises(ValueError):
+            calculate_shadow_types_batch([0], [1.0])
+
+    @unittest.skipIf(np is None, 'NumPy not installed')
+    def test_batch_numpy(self):
+        ap_types = ['LVEF', 'FEVL', 'LEVF', 'VELF']
+        subtypes = ['4343', '1440', '4442', '1234']
+        batch = calculate_shadow_types_batch(np.array([encode_ap_type(ap_type) for ap_type in ap_types]),
+                                             np.array([encode_subtype(subtype) for subtype in subtypes]))
+        self.verify_batch(ap_types, subtypes, batch)
+        with self.assertRaises(ValueError):
+            calculate_shadow_types_batch(np.array([0]), np.array([625]))
+        # other arrays are encoded like sequences
+        self.verify_batch(ap_types, subtypes, calculate_shadow_types_batch(np.array(ap_types), np.array(subtypes)))
+        with self.assertRaises(ValueError):
+            calculate_shadow_types_batch(np.array([0.7]), np.array([0]))
+
+    def test_parse_stream_line(self):
+        self.assertEqual(('VLEF', '1204'), parse_stream_line(' VLEF   1204\n'))
+        self.assertEqual(('VLEF', '1204'), parse_stream_line('VLEF,1204'))
+        self.assertEqual(('VLEF', '1204'), parse_stream_line('{"ap_type": "VLEF", "subtype": "1204"}'))
+        self.assertEqual(('VLEF', '1204'), parse_stream_line('["VLEF", "1204"]'))
+        for line in ['VLEF', 'VLEF 1204 1', '{"ap_type": "VLEF"}', '[1, 2]', '{"ap_type"']:
+            with self.assertRaises(ValueError):
+                parse_stream_line(line)
+
+    def test_stream_json(self):
+        lines = ['LVEF 4343\n', '\n', 'VLLE 0000\n', 'FEVL,1440\n']
+        for workers in [1, 2]:
+            output = io.StringIO()
+            with redirect_stdout(output):
+                run_stream(iter(lines), json=True, workers=workers, chunk_size=1)
+            results = [json.loads(line) for line in output.getvalue().splitlines()]
+            self.assertListEqual([calculate_shadow_types('LVEF', '4343'),
+                                  {'line': 3, 'input': 'VLLE 0000', 'error': 'Invalid AP type VLLE'},
+                                  calculate_shadow_types('FEVL', '1440')], results)
+
+    def test_stream_text(self):
+        lines = ['LVEF 4343\n', 'VLLE 0000\n']
+        for workers in [1, 2]:
+            output = io.StringIO()
+            with redirect_stdout(output):
+                run_stream(iter(lines), workers=workers, chunk_size=1)
+            self.assertEqual(get_shadow_types_str('LVEF', '4343') + '\nLine 2: Invalid AP type VLLE\n',
+                             output.getvalue())
+
+    def test_stream_nested_json(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            run_stream(iter(['[' * 2000 + '\n', 'LVEF 4343\n']), json=True)
+        errors, result = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(1, errors['line'])
+        self.assertIn('nested too deeply', errors['error'])
+        self.assertEqual(calculate_shadow_types('LVEF', '4343'), result)
+
+    def test_render_cache(self):
+        cache = RenderCache(maxsize=2)
+        for json_format in [False, True]:
+            expected = get_shadow_types_str('LVEF', '4343', json=json_format, use_table=False)
+            self.assertEqual(expected, get_shadow_types_str('LVEF', '4343', json=json_format))
+            self.assertEqual(expected, cache.get_str(' lvef', '4343 ', json_format))
+            self.assertEqual(expected.encode(), cache.get_bytes('LVEF', '4343', json_format))
+        self.assertDictEqual({'hits': 2, 'misses': 2, 'hit_ratio': 0.5, 'size': 2, 'maxsize': 2}, cache.info())
+
+        cache.get_str('VLEF', '0000')  # evicts LVEF 4343 text
+        cache.get_str('LVEF', '4343')
+        self.assertEqual(4, cache.info()['misses'])
+
+        with self.assertRaises(ValueError):
+            cache.get_str('VLLE', '0000')
+        self.assertEqual(2, cache.info()['size'])
+
+    def test_render_cache_warm(self):
+        cache = RenderCache()
+        cache.warm(json=False)
+        self.assertEqual(len(list(self.all_valid_subtypes())) * 24, cache.info()['size'])
+        cache.get_str('LVEF', '4343')
+        self.assertEqual(1, cache.info()['hits'])
+        cache.clear()
+        self.assertEqual(0, cache.info()['size'])
+
+    def test_trace_events(self):
+        events = []
+        ShadowTypes('VLEF', '4300', trace=events.append)
+        self.assertListEqual([
+            (TracePhase.OBSCURED, TraceEventKind.SWAPPED, 'Swapped 2L-3 (method) -> VELF'),
+            (TracePhase.OBSCURED, TraceEventKind.SWAPPED, 'Swapped 1V-4 (method) -> FELV'),
+            (TracePhase.METHOD, TraceEventKind.SKIPPED_ALREADY_SWAPPED, 'Skipped 2L-3 (method) - already swapped'),
+            (TracePhase.METHOD, TraceEventKind.SKIPPED_ALREADY_SWAPPED, 'Skipped 1V-4 (method) - already swapped'),
+        ], [(event.phase, event.kind, str(event)) for event in events])
+
+        events = []
+        ShadowTypes('FEVL', '1440', trace=events.append)
+        self.assertEqual(TraceEventKind.SKIPPED_MULTIPLE_MATCHES, events[0].kind)
+        events = []
+        ShadowTypes('LEVF', '1324', trace=events.append)
+        self.assertEqual(TraceEventKind.ALREADY_SWAPPED, events[1].kind)
+
+    def test_verbose(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            ShadowTypes('LEVF', '1324', verbose=True)
+        self.assertEqual('Swapped 2E-3 (method) -> LVEF\nAlready swapped 3V-2 (method)\n', output.getvalue())
+
+    def test_explain(self):
+        result = calculate_shadow_types('FEVL', '1440', explain=True)
+        trace = result.pop('trace')
+        self.assertDictEqual(calculate_shadow_types('FEVL', '1440'), result)
+        self.assertDictEqual({
+            'phase': 'obscured',
+            'event': 'skipped multiple matches',
+            'subtype': '4L-0 (obscured)',
+            'obscured_subtype': None,
+            'shadow_type': None,
+            'message': 'Skipped 4L-0 (obscured) - multiple matches',
+        }, trace[0])
+        self.assertIn('- Swapped 3V-4 (self) -> FELV (self phase)', get_shadow_types_str('FEVL', '1440', explain=True))
+
     @staticmethod
     def all_valid_subtypes():
         for pos1 in range(5):
@@ -0,0 +1,58 @@
+import unittest
+
+from ap_core import ap_types, subtypes
+from ap_shadow_type_calculator import calculate_shadow_types
+from ap_shadow_type_index import find_shadow_type_sources, get_shadow_type_index
+
+
+class ApShadowTypeIndexTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # brute force: (AP type, subtype) -> shadow types and descriptions, not including the AP type itself
+        cls.shadow_types = {}
+        for ap_type in ap_types:
+            for subtype in subtypes:
+                cls.shadow_types[(ap_type, subtype)] = {
+                    shadow_type['shadow_type']: shadow_type['description']
+                    for shadow_type in calculate_shadow_types(ap_type, subtype)['shadow_types']
+                    if not shadow_type['description'].startswith('AP type')}
+
+    def brute_force(self, predicate) -> list[tuple[str, str]]:
+        return [pair for pair, shadow_types in self.shadow_types.items() if predicate(shadow_types)]
+
+    def test_find_all_shadow_types(self):
+        for shadow_type in ap_types:
+            self.assertListEqual(self.brute_force(lambda shadow_types: shadow_type in shadow_types),
+                                 find_shadow_type_sources(shadow_type))
+
+    def test_find_with_description(self):
+        self.assertListEqual(
+            self.brute_force(lambda shadow_types: 'Swapped 2L-3' in shadow_types.get('VELF', '')),
+            find_shadow_type_sources('velf', 'Swapped 2L-3'))
+
+    def test_find_with_kinds(self):
+        self.assertListEqual(
+            self.brute_force(lambda shadow_types: '(obscured)' in shadow_types.get('FVLE', '') and
+                                                  ' and ' in shadow_types.get('FVLE', '')),
+            find_shadow_type_sources('FVLE', kinds=['obscured', 'repeated']))
+
+    def test_compound_query(self):
+        index = get_shadow_type_index()
+        expected = self.brute_force(lambda shadow_types: 'VLEF' in shadow_types and 'FELV' not in shadow_types
+                                                         and len(shadow_types) >= 3)
+        self.assertListEqual(expected, index.query(['VLEF'], ['FELV'], min_count=3))
+        self.assertEqual(len(expected), index.count(['VLEF'], ['FELV'], min_count=3))
+
+        expected = self.brute_force(lambda shadow_types: len(shadow_types) == 0)
+        self.assertListEqual(expected, index.query(max_count=0))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            find_shadow_type_sources('VLLE')
+        with self.assertRaises(ValueError):
+            find_shadow_type_sources('VLEF', kinds=['bogus'])
+
+
+if __name__ == '__main__':
+    unittest.main()
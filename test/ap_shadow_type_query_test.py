@@ -0,0 +1,52 @@
+import unittest
+from collections import Counter
+
+from ap_core import ap_types, subtypes
+from ap_shadow_type_calculator import calculate_shadow_types
+from ap_shadow_type_query import expand_ap_types, expand_subtypes, query_shadow_types
+
+
+class ApShadowTypeQueryTest(unittest.TestCase):
+
+    def test_expand_ap_types(self):
+        self.assertListEqual(['VLEF', 'VLFE', 'VELF', 'VEFL', 'VFLE', 'VFEL'],
+                             [ap_types[i] for i in expand_ap_types('v*')])
+        self.assertListEqual(['VLEF', 'VLFE', 'ELVF', 'ELFV', 'FLVE', 'FLEV'],
+                             [ap_types[i] for i in expand_ap_types('?L??')])
+        self.assertEqual(24, len(expand_ap_types('*')))
+
+    def test_expand_subtypes(self):
+        self.assertListEqual(['1034', '1134', '1234', '1334', '1434'], [subtypes[i] for i in expand_subtypes('1?34')])
+        self.assertEqual(15, len(expand_subtypes('[0-2]2*4')))
+        self.assertEqual(125, len(expand_subtypes('1*')))
+        self.assertEqual(625, len(expand_subtypes('*')))
+
+    def test_no_matches(self):
+        with self.assertRaises(ValueError):
+            expand_ap_types('X*')
+        with self.assertRaises(ValueError):
+            expand_subtypes('5???')
+
+    def test_query_matches_calculator(self):
+        stats = query_shadow_types('V*', '[0-2]2*4')
+        shadow_type_counts = Counter()
+        count_distribution = Counter()
+        for ap_type in ['VLEF', 'VLFE', 'VELF', 'VEFL', 'VFLE', 'VFEL']:
+            for subtype in [subtypes[i] for i in expand_subtypes('[0-2]2*4')]:
+                shadow_types = [shadow_type['shadow_type'] for shadow_type in
+                                calculate_shadow_types(ap_type, subtype)['shadow_types']
+                                if not shadow_type['description'].startswith('AP type')]
+                shadow_type_counts.update(shadow_types)
+                count_distribution[len(shadow_types)] += 1
+        self.assertEqual(90, stats.pairs)
+        self.assertEqual(shadow_type_counts, stats.shadow_type_counts)
+        self.assertEqual(count_distribution, stats.count_distribution)
+
+    def test_to_dict(self):
+        stats = query_shadow_types('VELF', '1234').to_dict()
+        self.assertDictEqual({'pairs': 1, 'pairs_with_shadow_types': 0, 'shadow_types': {}, 'descriptions': {},
+                              'shadow_type_counts': {'0': 1}}, stats)
+
+
+if __name__ == '__main__':
+    unittest.main()
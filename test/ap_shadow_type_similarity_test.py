@@ -0,0 +1,50 @@
+import unittest
+
+from ap_core import ap_types, subtypes
+from ap_shadow_type_similarity import (find_similar_subtypes, get_hamming_distance, get_jaccard_distance,
+                                       get_shadow_type_profiles)
+
+
+class ApShadowTypeSimilarityTest(unittest.TestCase):
+
+    def brute_force(self, ap_type, subtype, k, metric, ap_type_filter=(), subtype_filter=()):
+        profiles = get_shadow_type_profiles()
+        profile = profiles.get_profile(ap_type, subtype)
+        distance = get_jaccard_distance if metric == 'jaccard' else get_hamming_distance
+        results = []
+        for other_ap_type in ap_type_filter or ap_types:
+            for other_subtype in subtype_filter or subtypes:
+                if (other_ap_type, other_subtype) != (ap_type, subtype):
+                    other_profile = profiles.get_profile(other_ap_type, other_subtype)
+                    results.append((distance(profile, other_profile), ap_types.index(other_ap_type), other_subtype))
+        return [(ap_types[ap_type_index], other_subtype, distance)
+                for distance, ap_type_index, other_subtype in sorted(results)[:k]]
+
+    def test_profile(self):
+        profiles = get_shadow_type_profiles()
+        self.assertEqual(0, profiles.get_profile('VELF', '1234'))
+        # LVEF 4343 has 4 shadow types, all method or self
+        self.assertEqual(6, profiles.get_profile('LVEF', '4343').bit_count())
+
+    def test_matches_brute_force(self):
+        for ap_type, subtype in [('LVEF', '4343'), ('VELF', '1234'), ('FEVL', '1440'), ('LFVE', '2111')]:
+            for metric in ['jaccard', 'hamming']:
+                for k in [1, 10, 50]:
+                    self.assertListEqual(self.brute_force(ap_type, subtype, k, metric),
+                                         find_similar_subtypes(ap_type, subtype, k, metric))
+
+    def test_filters(self):
+        self.assertListEqual(self.brute_force('LVEF', '4343', 10, 'hamming', ['FEVL', 'VLEF']),
+                             find_similar_subtypes('LVEF', '4343', 10, 'hamming', ['FEVL', 'VLEF']))
+        self.assertListEqual(self.brute_force('LVEF', '4343', 10, 'jaccard', (), ['1111', '2222', '4343']),
+                             find_similar_subtypes('LVEF', '4343', 10, 'jaccard', (), ['1111', '2222', '4343']))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            find_similar_subtypes('VLLE', '0000')
+        with self.assertRaises(ValueError):
+            find_similar_subtypes('VLEF', '0000', metric='cosine')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+
+from ap_table_file import TableFile, TableFileError, pack_bodies, write_table_file
+
+VERSION_KEY = bytes(range(32))
+
+
+class ApTableFileTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'tables.bin')
+
+    def open(self, version_key: bytes = VERSION_KEY) -> TableFile:
+        table_file = TableFile(self.path, version_key)
+        self.addCleanup(table_file.mmap.close)
+        self.addCleanup(table_file.sections.clear)  # release views before closing the map
+        return table_file
+
+    def test_round_trip(self):
+        bodies = [b'first', b'', 'ünïcode'.encode(), b'x' * 1000]
+        write_table_file(self.path, VERSION_KEY, {'raw': b'abc', 'bodies': pack_bodies(bodies), 'empty': b''})
+        table_file = self.open()
+        self.assertEqual(b'abc', bytes(table_file.section('raw')))
+        self.assertEqual(b'', bytes(table_file.section('empty')))
+        packed = table_file.bodies('bodies')
+        self.assertEqual(len(bodies), len(packed))
+        self.assertListEqual(bodies, [packed[i] for i in range(len(packed))])
+        with self.assertRaises(TableFileError):
+            table_file.section('missing')
+
+    def test_stale(self):
+        write_table_file(self.path, VERSION_KEY, {'raw': b'abc'})
+        with self.assertRaisesRegex(TableFileError, 'stale'):
+            TableFile(self.path, bytes(32))
+
+    def test_corrupt(self):
+        write_table_file(self.path, VERSION_KEY, {'raw': b'abc' * 100})
+        with open(self.path, 'r+b') as f:
+            f.seek(-10, os.SEEK_END)
+            f.write(b'!')
+        with self.assertRaisesRegex(TableFileError, 'checksum'):
+            TableFile(self.path, VERSION_KEY)
+
+    def test_truncated(self):
+        write_table_file(self.path, VERSION_KEY, {'raw': b'abc' * 100})
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+        with self.assertRaisesRegex(TableFileError, 'truncated'):
+            TableFile(self.path, VERSION_KEY)
+
+    def test_empty(self):
+        open(self.path, 'wb').close()
+        with self.assertRaisesRegex(TableFileError, 'empty'):
+            TableFile(self.path, VERSION_KEY)
+
+    def test_not_table_file(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'{"not": "a table file"}' * 10)
+        with self.assertRaisesRegex(TableFileError, 'not a table file'):
+            TableFile(self.path, VERSION_KEY)
+
+
+if __name__ == '__main__':
+    unittest.main()
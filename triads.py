@@ -1,6 +1,7 @@
 import argparse
 import re
 import sys
+from itertools import permutations, product
 
 
 # List triad counts, nicknames, and other information for Enneagram trifixes ([234][567][891] in any order) or
@@ -290,6 +291,22 @@ def get_triads(trifix_or_archetype: str) -> list[str]:
         return get_archetype_triads(trifix_or_archetype)
 
 
+# every valid trifix, in every order
+def get_trifixes() -> list[str]:
+    return [''.join(trifix) for types in product('234', '567', '891') for trifix in permutations(types)]
+
+
+# every valid EI archetype, in every order, with and without center stacking
+def get_archetypes() -> list[str]:
+    archetypes = []
+    for instincts in product(['FD', 'SY', 'SM'], ['AY', 'CY', 'BG'], ['SS', 'EX', 'UN']):
+        for ordered_instincts in permutations(instincts):
+            archetype = '-'.join(ordered_instincts)
+            archetypes.append(archetype)
+            archetypes.extend(f'{''.join(center_stacking)} {archetype}' for center_stacking in permutations('SIP'))
+    return archetypes
+
+
 def run_interactive() -> None:
     while True:
         try:
@@ -138,7 +138,7 @@ class TypingStats:
 
         if include_celebrities:
             typing_types.append('Celebrity')
-            self.all_typings = self.celebrity_typings
+            self.all_typings = list(self.celebrity_typings)  # copy, since community typings may be added
         else:
             self.all_typings = []
         if include_community: